@@ -0,0 +1,148 @@
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument
+
+# Slot statuses in the slots collection
+FREE = "free"
+OCCUPIED = "occupied"  # seen taken by the camera (see slot_sync)
+HELD = "held"
+BOOKED = "booked"
+RETIRED = "retired"  # no longer in the lot's mask (see init_db.py)
+
+HOLD_SECONDS = 300
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def reservable(now):
+    """Slots a time-window reservation may take: not retired, booked or on a live hold.
+
+    A hold or booking through the allocator has no end of its own, so it
+    keeps the slot from reservations until it is released or the hold runs out.
+    """
+    return {"status": {"$nin": [RETIRED, BOOKED]}, "$nor": [{"status": HELD, "hold_expires": {"$gte": now}}]}
+
+
+class SlotAllocator:
+    """Claims slots with a single atomic ``find_one_and_update``.
+
+    A claim puts the slot on hold for ``hold_seconds``; the hold is confirmed
+    once payment succeeds. Holds that run out are claimable again without any
+    cleanup job, because the claim predicate matches them directly. A
+    booking has no end time: the slot stays booked until ``release`` (the
+    driver checking out) frees it.
+
+    ``listeners`` are called as ``listener(lot_id, slot_id, status)`` after
+    every status this allocator writes.
+
+    ``reserved(lot_id, slot_ids, now)``, if given, returns the slots of
+    ``slot_ids`` with a reservation from ``now`` on (see
+    ``ReservationBook.reserved``); those are never claimed. A reservation
+    bumps its slot's ``reservations`` counter, and a claim only matches the
+    counter it read before checking, so a reservation made in between makes
+    the claim check again instead of taking the slot under it.
+    """
+
+    def __init__(self, slots, hold_seconds=HOLD_SECONDS, listeners=(), reserved=None, attempts=4):
+        self.slots = slots
+        self.hold_seconds = hold_seconds
+        self.listeners = listeners
+        self.reserved = reserved
+        self.attempts = attempts  # rounds of checking reservations per claim
+
+    def _notify(self, lot_id, slot_id, status):
+        for listener in self.listeners:
+            listener(lot_id, slot_id, status)
+
+    def _claimable(self, now):
+        return {"$or": [
+            {"status": FREE},
+            {"status": HELD, "hold_expires": {"$lt": now}},
+        ]}
+
+    def claim(self, holder, lot_id=None, slot_ids=None, hold_seconds=None):
+        """Hold one free slot for ``holder``; returns the slot document or None."""
+        now = _now()
+        query = self._claimable(now)
+        if lot_id is not None:
+            query["lot_id"] = lot_id
+        if slot_ids is not None:
+            query["slot_id"] = {"$in": list(slot_ids)}
+
+        expires = now + timedelta(seconds=hold_seconds or self.hold_seconds)
+        update = {"$set": {"status": HELD, "holder": holder, "hold_expires": expires}}
+        if self.reserved is None:
+            slot = self.slots.find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
+        else:
+            slot = self._claim_unreserved(query, update, now)
+        if slot:
+            self._notify(slot.get("lot_id"), slot["slot_id"], HELD)
+        return slot
+
+    def _claim_unreserved(self, query, update, now):
+        for _ in range(self.attempts):
+            candidates = list(self.slots.find(query, {"lot_id": 1, "slot_id": 1, "reservations": 1}))
+            if not candidates:
+                return None
+            # Read each slot's counter before its reservations, so one made after the check moves it
+            by_lot = {}
+            for doc in candidates:
+                by_lot.setdefault(doc.get("lot_id"), []).append(doc)
+            unreserved = []
+            for lot_id, docs in by_lot.items():
+                reserved = self.reserved(lot_id, [doc["slot_id"] for doc in docs], now)
+                unreserved += [doc for doc in docs if doc["slot_id"] not in reserved]
+            if not unreserved:
+                return None
+            unchanged = [{"_id": doc["_id"], "reservations": doc.get("reservations", {"$exists": False})}
+                         for doc in unreserved]
+            slot = self.slots.find_one_and_update({**query, "$and": [{"$or": unchanged}]},
+                                                  update,
+                                                  return_document=ReturnDocument.AFTER)
+            if slot:
+                return slot
+        return None
+
+    def claim_first(self, holder, lot_id, slot_ids, batches=(1, 4, 16)):
+        """Hold the first claimable slot of ``slot_ids``, in order of preference.
+
+        Slots are tried in growing batches (the first one alone, then the
+        next 4, ...), so an uncontended claim gets the preferred slot in one
+        round-trip and a contended one needs only a few more.
+        """
+        slot_ids = list(slot_ids)
+        start = 0
+        for size in (*batches, len(slot_ids)):
+            batch = slot_ids[start:start + size]
+            if not batch:
+                return None
+            slot = self.claim(holder, lot_id=lot_id, slot_ids=batch)
+            if slot:
+                return slot
+            start += size
+        return None
+
+    def confirm(self, lot_id, slot_id, holder):
+        """Turn a live hold into a booking; returns False if the hold was lost."""
+        result = self.slots.update_one(
+            {"lot_id": lot_id, "slot_id": slot_id, "status": HELD, "holder": holder,
+             "hold_expires": {"$gte": _now()}},
+            {"$set": {"status": BOOKED}, "$unset": {"hold_expires": ""}},
+        )
+        if result.modified_count != 1:
+            return False
+        self._notify(lot_id, slot_id, BOOKED)
+        return True
+
+    def release(self, lot_id, slot_id, holder):
+        """Free a slot ``holder`` has on hold or booked; returns False if they no longer had it."""
+        result = self.slots.update_one(
+            {"lot_id": lot_id, "slot_id": slot_id, "holder": holder, "status": {"$in": [HELD, BOOKED]}},
+            {"$set": {"status": FREE}, "$unset": {"holder": "", "hold_expires": ""}},
+        )
+        if result.modified_count != 1:
+            return False
+        self._notify(lot_id, slot_id, FREE)
+        return True
@@ -0,0 +1,110 @@
+"""Concurrent slot allocation: double-bookings and throughput.
+
+Hammers the slots collection with many concurrent claims until the lot is
+full, then counts slots that were handed out more than once.
+
+    python -m benchmarks.bench_allocation [--mongo-uri mongodb://localhost:27017] \
+        [--slots 500] [--workers 200] [--mode atomic|legacy]
+
+Without --mongo-uri the test runs against mongomock. mongomock is not
+thread-safe, so each operation is run under a lock, which gives the same
+single-operation atomicity a mongod has; use a real mongod for meaningful
+throughput numbers.
+"""
+import argparse
+import collections
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from allocation import SlotAllocator
+
+
+def legacy_claim(slots, holder):
+    # What /book did before SlotAllocator: read, then write in a second round-trip
+    free_slot = slots.find_one({"status": "free"})
+    if free_slot:
+        slots.update_one({"_id": free_slot["_id"]}, {"$set": {"status": "booked", "holder": holder}})
+    return free_slot
+
+
+class SerializedCollection:
+    """Runs every collection operation under one lock, like a single mongod would."""
+
+    def __init__(self, collection):
+        self._collection = collection
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if not callable(attr):
+            return attr
+
+        def locked(*args, **kwargs):
+            with self._lock:
+                return attr(*args, **kwargs)
+        return locked
+
+
+def get_collection(args):
+    if args.mongo_uri:
+        from pymongo import MongoClient
+        return MongoClient(args.mongo_uri)[args.db].slots
+    import mongomock
+    return SerializedCollection(mongomock.MongoClient()[args.db].slots)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mongo-uri')
+    parser.add_argument('--db', default='bench_allocation')
+    parser.add_argument('--slots', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=200)
+    parser.add_argument('--mode', choices=['atomic', 'legacy'], default='atomic')
+    args = parser.parse_args()
+
+    slots = get_collection(args)
+    slots.drop()
+    slots.insert_many([{"lot_id": "bench", "slot_id": i, "status": "free"} for i in range(args.slots)])
+    slots.create_index("status")
+
+    allocator = SlotAllocator(slots)
+    claimed = collections.Counter()
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(n):
+        holder = f"user-{n}"
+        while True:
+            start = time.perf_counter()
+            if args.mode == 'atomic':
+                slot = allocator.claim(holder, lot_id="bench")
+            else:
+                slot = legacy_claim(slots, holder)
+            elapsed = time.perf_counter() - start
+            if slot is None:
+                return
+            with lock:
+                claimed[slot["slot_id"]] += 1
+                latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        list(pool.map(worker, range(args.workers)))
+    elapsed = time.perf_counter() - start
+
+    allocations = sum(claimed.values())
+    double_booked = sum(1 for count in claimed.values() if count > 1)
+    latencies.sort()
+    print(f"backend: {'mongod' if args.mongo_uri else 'mongomock'}  mode: {args.mode}  "
+          f"slots: {args.slots}  concurrent workers: {args.workers}")
+    print(f"   allocations: {allocations}")
+    print(f" double-booked: {double_booked}")
+    print(f"    throughput: {allocations / elapsed:.0f} claims/s")
+    if latencies:
+        print(f"       latency: p50 {latencies[len(latencies) // 2] * 1000:.2f} ms  "
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
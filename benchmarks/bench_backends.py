@@ -0,0 +1,85 @@
+"""Import/load time and batch-predict throughput of each classifier backend.
+
+Run from the repository root, after ``python export_model.py``:
+
+    python -m benchmarks.bench_backends [--sklearn model.p] [--npz model.npz]
+
+Import time is measured in a fresh interpreter (``import util`` plus the
+first model load), which is what a web or worker process pays at startup.
+Predictions are checked against the sklearn model on synthetic frames.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import SyntheticLot
+from classifier import load_classifier
+from util import SpotFeatures
+
+COLD_START = """
+import json, sys, time
+start = time.perf_counter()
+import util
+imported = time.perf_counter()
+from classifier import load_classifier
+load_classifier(sys.argv[1]).load()
+loaded = time.perf_counter()
+print(json.dumps({"import_ms": (imported - start) * 1000, "load_ms": (loaded - imported) * 1000,
+                  "sklearn_imported": "sklearn" in sys.modules}))
+"""
+
+
+def cold_start(path, repeat):
+    runs = [json.loads(subprocess.check_output([sys.executable, '-c', COLD_START, path]))
+            for _ in range(repeat)]
+    return {key: float(np.median([r[key] for r in runs])) for key in ('import_ms', 'load_ms')} | {
+        'sklearn_imported': runs[0]['sklearn_imported']}
+
+
+def throughput(classifier, data, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        classifier.predict(data)
+        samples.append(time.perf_counter() - start)
+    return len(data) / np.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sklearn', default='model.p')
+    parser.add_argument('--npz', default='model.npz')
+    parser.add_argument('--mask', default='mask_1920_1080.png')
+    parser.add_argument('--frames', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--cold-repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    synthetic = SyntheticLot(args.mask)
+    features = SpotFeatures(len(synthetic.spots))
+    data = np.vstack([features.extract(synthetic.next_frame(), synthetic.spots).copy()
+                      for _ in range(args.frames)])
+
+    reference = load_classifier(args.sklearn).load()
+    expected = reference.predict(data)
+    expected_decision = reference.decision_function(data)
+
+    print(f"batch: {len(data)} spots ({args.frames} frames x {len(synthetic.spots)})")
+    for path in (args.sklearn, args.npz):
+        classifier = load_classifier(path).load()
+        cold = cold_start(path, args.cold_repeat)
+        max_diff = np.max(np.abs(classifier.decision_function(data) - expected_decision))
+        agreement = np.mean(classifier.predict(data) == expected)
+        print(f"{classifier!r}")
+        print(f"    import util: {cold['import_ms']:8.1f} ms  model load: {cold['load_ms']:8.1f} ms"
+              f"  sklearn imported: {cold['sklearn_imported']}")
+        print(f"    throughput:  {throughput(classifier, data, args.repeat):8.0f} spots/s")
+        print(f"    vs sklearn:  max decision difference {max_diff:.2e}, agreement {agreement * 100:.2f}%")
+
+
+if __name__ == '__main__':
+    main()
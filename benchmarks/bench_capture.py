@@ -0,0 +1,72 @@
+"""Decode cost of the capture reader with and without stream viewers.
+
+Plays a synthetic video (see benchmarks/synthetic.py) through
+capture.CaptureReader as fast as it decodes and reports CPU time per source
+frame, against decoding every frame with ``cap.read()``:
+
+    python -m benchmarks.bench_capture [--frames 300] [--step 10]
+
+"headless" is a detection-only deployment (nobody on /video_feed), "5 fps
+viewer" a client on /video_feed?fps=5 and "full-rate viewer" a client
+without a limit.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import cv2
+
+from benchmarks.synthetic import SyntheticLot
+from capture import CaptureReader
+
+
+def read_all(video_path):
+    cap = cv2.VideoCapture(video_path)
+    frames = 0
+    while cap.read()[0]:
+        frames += 1
+    cap.release()
+    return frames, frames
+
+
+def read_with_reader(video_path, n_frames, step, stream_fps):
+    reader = CaptureReader(video_path, step, stream_fps=lambda: stream_fps, lot_id='bench', realtime=False)
+    reader.start()
+    # Consume as the pipeline would, until one pass over the file is done
+    while reader.frame_nmr < n_frames:
+        reader.frames.get(timeout=0.1)
+    reader.stop()
+    reader.join()
+    return reader.frame_nmr, reader.decoded
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mask', default='mask_1920_1080.png')
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--step', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        video_path = os.path.join(tmp, 'synthetic.avi')
+        SyntheticLot(args.mask).write_video(video_path, args.frames)
+
+        cases = [
+            ("cap.read() every frame", lambda: read_all(video_path)),
+            ("headless", lambda: read_with_reader(video_path, args.frames, args.step, 0)),
+            ("5 fps viewer", lambda: read_with_reader(video_path, args.frames, args.step, 5)),
+            ("full-rate viewer", lambda: read_with_reader(video_path, args.frames, args.step, float('inf'))),
+        ]
+        baseline = None
+        for name, fn in cases:
+            start = time.process_time()
+            grabbed, decoded = fn()
+            cpu_ms = (time.process_time() - start) / grabbed * 1000
+            baseline = baseline or cpu_ms
+            print(f"{name:>24}: {decoded:4d}/{grabbed} frames decoded, {cpu_ms:6.2f} ms CPU per frame "
+                  f"({baseline / cpu_ms:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
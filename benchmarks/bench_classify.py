@@ -0,0 +1,63 @@
+"""Per-frame spot classification latency: per-spot loop vs. batched call.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_classify [--frame image.jpg] [--repeat 20]
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+from skimage.transform import resize
+
+from classifier import get_classifier
+from util import get_parking_spots_bboxes, classify_spots, SpotFeatures
+
+
+def legacy_loop(frame, spots):
+    # The pre-batching implementation of empty_or_not, called once per spot
+    status = []
+    for x1, y1, w, h in spots:
+        img_resized = resize(frame[y1:y1 + h, x1:x1 + w], (15, 15, 3))
+        y_output = get_classifier().predict(np.array([img_resized.flatten()]))
+        status.append(y_output == 0)
+    return np.array(status).ravel()
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return result, np.array(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mask', default='mask_1920_1080.png')
+    parser.add_argument('--frame', help='image used as the camera frame (random noise if omitted)')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    mask = cv2.imread(args.mask, 0)
+    spots = get_parking_spots_bboxes(cv2.connectedComponentsWithStats(mask, 4, cv2.CV_32S))
+    if args.frame:
+        frame = cv2.resize(cv2.imread(args.frame), (mask.shape[1], mask.shape[0]))
+    else:
+        frame = np.random.default_rng(0).integers(0, 256, (*mask.shape, 3), dtype=np.uint8)
+
+    features = SpotFeatures(len(spots))
+    legacy, legacy_ms = timed(lambda: legacy_loop(frame, spots), args.repeat)
+    batched, batched_ms = timed(lambda: classify_spots(frame, spots, features), args.repeat)
+
+    print(f"spots: {len(spots)}  repeat: {args.repeat}")
+    for name, ms in (("per-spot loop", legacy_ms), ("classify_spots", batched_ms)):
+        print(f"{name:>15}: median {np.median(ms):8.2f} ms  p95 {np.percentile(ms, 95):8.2f} ms")
+    print(f"        speedup: {np.median(legacy_ms) / np.median(batched_ms):.1f}x")
+    print(f"      agreement: {np.mean(legacy == batched) * 100:.1f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Lot geometry: labeling the mask at startup vs loading the compiled cache.
+
+Times what a lot used to cost at startup (read the mask, label it, walk the
+labels in Python), compiling the geometry into an empty cache, loading it
+back from the cache, and scaling it to other camera resolutions. The cached
+bboxes are checked against the old ones.
+
+    python -m benchmarks.bench_geometry [--mask mask_1920_1080.png] [--repeat 20]
+"""
+import argparse
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from geometry import SAMPLE_SCALE, load_geometry
+
+
+def legacy_spots(mask_path):
+    # config.Lot before the geometry cache
+    mask = cv2.imread(mask_path, 0)
+    totalLabels, label_ids, values, centroid = cv2.connectedComponentsWithStats(mask, 4, cv2.CV_32S)
+    slots = []
+    coef = 1
+    for i in range(1, totalLabels):
+        x1 = int(values[i, cv2.CC_STAT_LEFT] * coef)
+        y1 = int(values[i, cv2.CC_STAT_TOP] * coef)
+        w = int(values[i, cv2.CC_STAT_WIDTH] * coef)
+        h = int(values[i, cv2.CC_STAT_HEIGHT] * coef)
+        slots.append([x1, y1, w, h])
+    return slots
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return min(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mask', default='mask_1920_1080.png')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        legacy_ms = best_of(lambda: legacy_spots(args.mask), args.repeat)
+
+        t = time.perf_counter()
+        geometry = load_geometry(args.mask, cache_dir)
+        compile_ms = (time.perf_counter() - t) * 1000
+        cached_ms = best_of(lambda: load_geometry(args.mask, cache_dir).spots(), args.repeat)
+
+        assert load_geometry(args.mask, cache_dir).spots() == legacy_spots(args.mask), "bboxes differ"
+        print(f"mask {args.mask}: {len(geometry)} spots, {geometry.shape[1]}x{geometry.shape[0]}")
+        print(f"  legacy label + loop:   {legacy_ms:7.2f} ms")
+        print(f"  compile (cold cache):  {compile_ms:7.2f} ms")
+        print(f"  load (warm cache):     {cached_ms:7.2f} ms")
+
+    for shape in [(720, 1280), (2160, 3840)]:
+        def scale():
+            geometry._scaled.clear()
+            scaled = geometry.scaled(shape)
+            scaled.samples(SAMPLE_SCALE)
+            return scaled
+        scale_ms = best_of(scale, max(args.repeat // 4, 1))
+        scaled = scale()
+        inside = ((scaled.bboxes[:, :2] >= 0).all() and (scaled.bboxes[:, 0] + scaled.bboxes[:, 2] <= shape[1]).all()
+                  and (scaled.bboxes[:, 1] + scaled.bboxes[:, 3] <= shape[0]).all())
+        assert inside, "scaled bboxes leave the frame"
+        drift = np.abs(scaled.centroids / [shape[1], shape[0]]
+                       - np.asarray(geometry.centroids) / [geometry.shape[1], geometry.shape[0]]).max()
+        print(f"  scale to {shape[1]}x{shape[0]}: {scale_ms:7.2f} ms (with diff samples), "
+              f"centroid drift {drift:.1e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Login storm: password throughput and the latency of every other route meanwhile.
+
+Serves a small threaded Flask app with a /login that checks a bcrypt hash
+the way main.py does, and a cheap /ping standing in for the dashboard and
+count routes. ``--logins`` clients log in back to back while one client
+probes /ping every 20 ms.
+
+    python -m benchmarks.bench_login [--mode pool|inline] [--logins 32] \
+        [--seconds 10] [--rounds 12] [--workers N]
+
+``inline`` is what /login did before PasswordHasher: bcrypt on the request
+thread.
+"""
+import argparse
+import logging
+import threading
+import time
+
+import bcrypt
+import numpy as np
+import requests
+from flask import Flask, request
+from werkzeug.serving import make_server
+
+from passwords import PasswordHasher, PasswordBusy, PASSWORD_WORKERS
+
+PASSWORD = 'correct horse battery staple'
+
+
+def build_app(mode, hashed, hasher):
+    app = Flask(__name__)
+
+    @app.route('/login', methods=['POST'])
+    def login():
+        password = request.form['password']
+        if mode == 'inline':
+            valid = bcrypt.checkpw(password.encode('utf-8'), hashed)
+        else:
+            try:
+                valid, _ = hasher.verify(password, hashed)
+            except PasswordBusy:
+                return 'busy', 503
+        return ('ok', 200) if valid else ('denied', 401)
+
+    @app.route('/ping')
+    def ping():
+        return {'free_spaces': 42}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=['pool', 'inline'], default='pool')
+    parser.add_argument('--logins', type=int, default=32, help='concurrent login clients')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--rounds', type=int, default=12)
+    parser.add_argument('--workers', type=int, default=PASSWORD_WORKERS)
+    parser.add_argument('--max-pending', type=int, default=32)
+    args = parser.parse_args()
+
+    hashed = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(args.rounds))
+    hasher = PasswordHasher(rounds=args.rounds, workers=args.workers, max_pending=args.max_pending)
+    hasher.verify(PASSWORD, hashed)  # start the pool outside the measurement
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, build_app(args.mode, hashed, hasher), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    deadline = time.monotonic() + args.seconds
+    lock = threading.Lock()
+    login_latencies, ping_latencies, statuses = [], [], {}
+
+    def login_client():
+        http = requests.Session()
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            status = http.post(f"{base}/login", data={'password': PASSWORD}).status_code
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    login_latencies.append(time.perf_counter() - start)
+            if status == 503:
+                time.sleep(0.1)  # a client backing off after "busy"
+
+    def ping_client():
+        http = requests.Session()
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            http.get(f"{base}/ping")
+            ping_latencies.append(time.perf_counter() - start)
+            time.sleep(0.02)
+
+    threads = [threading.Thread(target=login_client) for _ in range(args.logins)]
+    threads.append(threading.Thread(target=ping_client))
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    server.shutdown()
+    hasher.close()
+
+    print(f"{args.mode}: {args.logins} login clients, cost {args.rounds}, "
+          f"{args.workers if args.mode == 'pool' else args.logins} hashing at once, {elapsed:.1f}s")
+    if login_latencies:
+        p50, p99 = np.percentile(login_latencies, [50, 99]) * 1000
+        print(f"  logins: {len(login_latencies) / elapsed:.1f}/s, p50 {p50:.0f} ms, p99 {p99:.0f} ms, "
+              f"refused {statuses.get(503, 0)}")
+    p50, p99 = np.percentile(ping_latencies, [50, 99]) * 1000
+    print(f"  /ping:  {len(ping_latencies)} probes, p50 {p50:.1f} ms, p99 {p99:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Nearest-free-spot queries: spatial index vs scanning every free spot.
+
+Builds lots of bays laid out in rows (like a real mask), frees a fraction of
+them at random and times "nearest free spot to a point" and "k nearest"
+through FreeSpotIndex and through a vectorized scan of the free list, which
+is what finding the closest spot costs without the index. Results are
+checked against each other.
+
+    python -m benchmarks.bench_nearest [--sizes 500 5000 50000] [--free 0.1] [--k 8]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from spot_index import FreeSpotIndex
+
+
+def lot_bboxes(n_spots, bay_w=40, bay_h=80, per_row=50, aisle=60):
+    i = np.arange(n_spots)
+    x = (i % per_row) * bay_w
+    y = (i // per_row) * (bay_h + aisle)
+    return np.stack([x, y, np.full(n_spots, bay_w - 4), np.full(n_spots, bay_h - 4)], axis=1)
+
+
+def scan(centroids, free_ids, x, y, k):
+    d = np.hypot(centroids[free_ids, 0] - x, centroids[free_ids, 1] - y)
+    if k < len(d):
+        part = np.argpartition(d, k)[:k]
+    else:
+        part = np.arange(len(d))
+    order = part[np.lexsort((free_ids[part], d[part]))]
+    return [(float(d[j]), int(free_ids[j])) for j in order]
+
+
+def timed(fn, queries):
+    start = time.perf_counter()
+    results = [fn(x, y) for x, y in queries]
+    return (time.perf_counter() - start) / len(queries) * 1e6, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[500, 5000, 50000])
+    parser.add_argument('--free', type=float, default=0.1, help='fraction of free spots')
+    parser.add_argument('--k', type=int, default=8)
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for n_spots in args.sizes:
+        bboxes = lot_bboxes(n_spots)
+        index = FreeSpotIndex(bboxes)
+        free = rng.random(n_spots) < args.free
+        start = time.perf_counter()
+        index.update(np.arange(n_spots), free)
+        load_ms = (time.perf_counter() - start) * 1000
+        free_ids = np.flatnonzero(free)
+
+        extent = index.centroids.max(0)
+        queries = rng.random((args.queries, 2)) * extent
+        print(f"{n_spots} spots, {len(free_ids)} free (index load {load_ms:.1f} ms)")
+        for k in (1, args.k):
+            index_us, got = timed(lambda x, y: index.nearest(x, y, k), queries)
+            scan_us, expected = timed(lambda x, y: scan(index.centroids, free_ids, x, y, k), queries)
+            same = all(np.allclose([d for d, _ in a], [d for d, _ in b]) for a, b in zip(got, expected))
+            print(f"  k={k}: index {index_us:6.1f} us, scan {scan_us:7.1f} us per query, results match: {same}")
+
+        # Status churn: one spot flips per update, as the pipeline reports them
+        flips = rng.integers(0, n_spots, 10000)
+        start = time.perf_counter()
+        for spot_id in flips:
+            index.update([spot_id], [not index._is_free[spot_id]])
+        print(f"  update {(time.perf_counter() - start) / len(flips) * 1e6:.1f} us per change")
+
+        index.update(np.arange(n_spots), np.zeros(n_spots, bool))
+        full_us, _ = timed(lambda x, y: index.nearest(x, y, 1), queries[:100])
+        print(f"  full lot: {full_us:.2f} us per query")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Checkout load against a slow payment gateway: latency, refusals and duplicate orders.
+
+Starts benchmarks/stub_gateway.py in-process and runs many concurrent
+checkouts (order creation for a booking), some of them submitted twice as a
+double-clicked "Pay" button would.
+
+    python -m benchmarks.bench_payments [--checkouts 400] [--concurrency 64] \
+        [--latency 0.2] [--resubmit 0.2] [--mode service|legacy]
+
+``legacy`` is what /pay did before PaymentService: one shared razorpay.Client
+called from the request thread, no timeout and a new order on every submit.
+Run with a --latency above --timeout to see how each mode fails when the
+gateway hangs.
+"""
+import argparse
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import razorpay
+
+from benchmarks.stub_gateway import StubGateway
+from payments import PaymentService, PaymentBusy, PaymentError, new_receipt
+
+
+def legacy_checkout(client):
+    def checkout(receipt, amount):
+        return client.order.create(data={"amount": amount, "currency": "INR", "receipt": receipt})
+    return checkout
+
+
+def service_checkout(service):
+    seen = set()
+
+    def checkout(receipt, amount):
+        # As /pay does: a receipt already in the session is a resubmit
+        resubmit = receipt in seen
+        seen.add(receipt)
+        return service.create_order(receipt, amount, resubmit=resubmit)
+    return checkout
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=['service', 'legacy'], default='service')
+    parser.add_argument('--checkouts', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=64, help='web request threads')
+    parser.add_argument('--latency', type=float, default=0.2, help='gateway seconds per response')
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--resubmit', type=float, default=0.2, help='fraction of checkouts submitted twice')
+    parser.add_argument('--timeout', type=float, default=5.0)
+    parser.add_argument('--workers', type=int, default=32, help='gateway connections (service mode)')
+    parser.add_argument('--max-pending', type=int, default=128)
+    args = parser.parse_args()
+
+    gateway = StubGateway(latency=args.latency, jitter=args.jitter).start()
+    if args.mode == 'service':
+        checkout = service_checkout(PaymentService('key', 'secret', base_url=gateway.base_url, timeout=args.timeout,
+                                                   workers=args.workers, max_pending=args.max_pending))
+    else:
+        checkout = legacy_checkout(razorpay.Client(auth=('key', 'secret'), base_url=gateway.base_url))
+
+    random.seed(0)
+    requests_ = []
+    for _ in range(args.checkouts):
+        receipt = new_receipt()
+        requests_.append(receipt)
+        if random.random() < args.resubmit:
+            requests_.append(receipt)
+    random.shuffle(requests_)
+
+    latencies, outcomes = [], {'ok': 0, 'busy': 0, 'error': 0}
+    lock = threading.Lock()
+
+    def submit(receipt):
+        start = time.perf_counter()
+        try:
+            checkout(receipt, 5000)
+            outcome = 'ok'
+        except PaymentBusy:
+            outcome = 'busy'
+        except (PaymentError, Exception):
+            outcome = 'error'
+        with lock:
+            latencies.append(time.perf_counter() - start)
+            outcomes[outcome] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(submit, requests_))
+    elapsed = time.perf_counter() - start
+
+    p50, p99, worst = np.percentile(latencies, [50, 99, 100]) * 1000
+    print(f"{args.mode}: {len(requests_)} submits ({len(requests_) - args.checkouts} resubmits) "
+          f"in {elapsed:.2f}s = {outcomes['ok'] / elapsed:.0f} orders/s")
+    print(f"  latency p50 {p50:.0f} ms, p99 {p99:.0f} ms, max {worst:.0f} ms")
+    print(f"  ok {outcomes['ok']}, busy {outcomes['busy']}, errors {outcomes['error']}, "
+          f"duplicate orders at gateway {gateway.duplicates()}")
+    gateway.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""Headless benchmark of the detection pipeline on synthetic frames.
+
+Synthesizes a video from the mask (see benchmarks/synthetic.py), then runs
+the same per-frame loop as CameraPipeline.run over it, without a window or
+pacing, and reports frames/sec, per-stage latency percentiles and peak
+memory.
+
+    python -m benchmarks.bench_pipeline [--frames 300] [--change-rate 0.02]
+    python -m benchmarks.bench_pipeline --save baseline.json
+    python -m benchmarks.bench_pipeline --compare baseline.json
+
+With --compare the exit status is 1 if any number regressed by more than
+--tolerance.
+"""
+import argparse
+import collections
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+from benchmarks.synthetic import SyntheticLot
+from config import Lot
+from pipeline import CameraPipeline
+from util import get_parking_spots_bboxes, empty_or_not
+
+
+class StageRecorder:
+    """Stands in for the stage histogram and keeps every sample."""
+
+    def __init__(self):
+        self.samples = collections.defaultdict(list)
+
+    @contextmanager
+    def time(self, lot, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[stage].append(time.perf_counter() - start)
+
+
+class SingleViewerOutput:
+    """Encodes every published frame once, as for one /video_feed viewer."""
+
+    def __init__(self, recorder, quality):
+        self.recorder = recorder
+        self.quality = quality
+        self.status_updates = 0
+
+    def publish_status(self, spot_ids, free):
+        self.status_updates += 1
+
+    def publish_frame(self, frame):
+        with self.recorder.time('bench', 'encode'):
+            cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+
+
+def percentiles_ms(samples):
+    samples = np.asarray(samples) * 1000
+    return {f"p{p}": float(np.percentile(samples, p)) for p in (50, 95, 99)}
+
+
+def run(args):
+    results = {}
+
+    mask = cv2.imread(args.mask, 0)
+    start = time.perf_counter()
+    for _ in range(10):
+        get_parking_spots_bboxes(cv2.connectedComponentsWithStats(mask, 4, cv2.CV_32S))
+    results["get_parking_spots_bboxes_ms"] = (time.perf_counter() - start) / 10 * 1000
+
+    synthetic = SyntheticLot(args.mask, occupancy=args.occupancy, change_rate=args.change_rate)
+    frame = synthetic.next_frame()
+    crops = [frame[y1:y1 + h, x1:x1 + w] for x1, y1, w, h in synthetic.spots[:200]]
+    start = time.perf_counter()
+    for crop in crops:
+        empty_or_not(crop)
+    results["empty_or_not_ms"] = (time.perf_counter() - start) / len(crops) * 1000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        video_path = os.path.join(tmp, 'synthetic.avi')
+        synthetic.write_video(video_path, args.frames)
+
+        lot = Lot('bench', args.mask, video_path, step=args.step)
+        recorder = StageRecorder()
+        pipeline = CameraPipeline(lot, SingleViewerOutput(recorder, lot.stream_quality))
+        pipeline.stage_seconds = recorder
+
+        cap = cv2.VideoCapture(video_path)
+        tracemalloc.start()
+        start = time.perf_counter()
+        while True:
+            with recorder.time(lot.id, 'decode'):
+                success, frame = cap.read()
+            if not success:
+                recorder.samples['decode'].pop()
+                break
+            pipeline.process(frame)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        cap.release()
+
+    results["spots"] = len(lot.spots)
+    results["frames"] = pipeline.frame_nmr
+    results["fps"] = pipeline.frame_nmr / elapsed
+    results["stages_ms"] = {stage: percentiles_ms(samples) for stage, samples in recorder.samples.items()}
+    results["peak_traced_mb"] = peak / 2 ** 20
+    results["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return results
+
+
+def report(results):
+    print(f"spots: {results['spots']}  frames: {results['frames']}")
+    print(f"  get_parking_spots_bboxes: {results['get_parking_spots_bboxes_ms']:.2f} ms")
+    print(f"  empty_or_not (per spot):  {results['empty_or_not_ms']:.3f} ms")
+    print(f"  frame loop:               {results['fps']:.1f} frames/s")
+    for stage, p in results["stages_ms"].items():
+        print(f"    {stage:>9}: p50 {p['p50']:7.2f} ms  p95 {p['p95']:7.2f} ms  p99 {p['p99']:7.2f} ms")
+    print(f"  peak traced memory: {results['peak_traced_mb']:.1f} MB  max RSS: {results['max_rss_mb']:.1f} MB")
+
+
+def flatten(results):
+    # (name, value, higher_is_better)
+    yield "fps", results["fps"], True
+    yield "get_parking_spots_bboxes_ms", results["get_parking_spots_bboxes_ms"], False
+    yield "empty_or_not_ms", results["empty_or_not_ms"], False
+    for stage, p in results["stages_ms"].items():
+        for name, value in p.items():
+            yield f"{stage}.{name}_ms", value, False
+    yield "peak_traced_mb", results["peak_traced_mb"], False
+
+
+def compare(results, baseline, tolerance):
+    base = {name: value for name, value, _ in flatten(baseline)}
+    regressed = False
+    print(f"\n{'metric':>30} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, value, higher_is_better in flatten(results):
+        if name not in base or not base[name]:
+            continue
+        change = (value - base[name]) / base[name]
+        worse = -change if higher_is_better else change
+        flag = ''
+        if worse > tolerance:
+            flag = '  REGRESSION'
+            regressed = True
+        print(f"{name:>30} {base[name]:10.2f} {value:10.2f} {change * 100:+7.1f}%{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mask', default='mask_1920_1080.png')
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--step', type=int, default=10)
+    parser.add_argument('--occupancy', type=float, default=0.6)
+    parser.add_argument('--change-rate', type=float, default=0.02, help='fraction of spots flipped per frame')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed relative regression')
+    args = parser.parse_args()
+
+    results = run(args)
+    report(results)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""Time-window reservations: per-slot interval index vs scanning every booking.
+
+Fills a lot with ``--bookings`` non-overlapping reservations spread over its
+slots and times, for random windows, "which slots are free over the
+window" through ReservationIndex and through a vectorized scan of all
+bookings (what the query costs without an interval index), plus "earliest
+free window of this length". Results are checked against the scan and a
+brute-force search.
+
+The concurrency part makes reservations of a few contended days from
+``--threads`` threads through two ReservationBooks (as two web workers
+would, each with its own index) against mongomock, then checks that no two
+live reservations of a slot overlap. mongomock is not thread-safe, so each
+operation runs under a lock, as in bench_allocation.
+
+    python -m benchmarks.bench_reservations [--slots 400] [--bookings 300000] [--queries 2000] \\
+        [--threads 32] [--reservations 2000]
+"""
+import argparse
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from benchmarks.bench_allocation import SerializedCollection
+from reservations import ReservationBook, ReservationIndex, PENDING, BOOKED, to_seconds
+
+HOUR = 3600.0
+
+
+def synthesize(n_slots, n_bookings, rng):
+    # Back-to-back reservations of 0.5-8 h with exponential gaps, per slot
+    per_slot = n_bookings // n_slots
+    durations = rng.uniform(0.5, 8, (n_slots, per_slot)) * HOUR
+    gaps = rng.exponential(6, (n_slots, per_slot)) * HOUR
+    ends = np.cumsum(durations + gaps, axis=1)
+    starts = ends - durations
+    slot = np.repeat(np.arange(n_slots), per_slot)
+    return slot, starts.ravel(), ends.ravel()
+
+
+def scan_free(slot, starts, ends, n_slots, t1, t2):
+    busy = np.zeros(n_slots, dtype=bool)
+    busy[slot[(starts < t2) & (ends > t1)]] = True
+    return np.flatnonzero(~busy).tolist()
+
+
+def brute_earliest(intervals, after, duration):
+    best = None
+    for slot_id, slot_intervals in enumerate(intervals):
+        t = after
+        for start, end in slot_intervals:
+            if end <= t:
+                continue
+            if start >= t + duration:
+                break
+            t = end
+        if best is None or t < best[0]:
+            best = (t, slot_id)
+    return best
+
+
+def bench_index(args, rng):
+    slot, starts, ends = synthesize(args.slots, args.bookings, rng)
+    horizon = ends.max()
+    t = time.perf_counter()
+    index = ReservationIndex({'bench': args.slots})
+    for booking_id, (slot_id, start, end) in enumerate(zip(slot.tolist(), starts.tolist(), ends.tolist())):
+        index.add('bench', slot_id, start, end, booking_id, now=0)
+    build = time.perf_counter() - t
+    print(f"{index.size:,} bookings over {args.slots} slots, {horizon / 86400:.0f} days; "
+          f"index built in {build:.2f} s")
+
+    windows = [(t1, t1 + rng.uniform(1, 4) * HOUR) for t1 in rng.uniform(0, horizon, args.queries).tolist()]
+    t = time.perf_counter()
+    indexed = [index.free_slots('bench', t1, t2, now=0) for t1, t2 in windows]
+    index_s = time.perf_counter() - t
+    t = time.perf_counter()
+    scanned = [scan_free(slot, starts, ends, args.slots, t1, t2) for t1, t2 in windows]
+    scan_s = time.perf_counter() - t
+    assert indexed == scanned, "free slots differ"
+    print(f"  free slots over a window: index {index_s / args.queries * 1e3:7.3f} ms/query, "
+          f"scan {scan_s / args.queries * 1e3:7.3f} ms/query ({scan_s / index_s:.1f}x)")
+
+    t = time.perf_counter()
+    earliest = [index.earliest_free('bench', t1, t2 - t1, now=0) for t1, t2 in windows]
+    earliest_s = time.perf_counter() - t
+    intervals = [[] for _ in range(args.slots)]
+    for slot_id, start, end in zip(slot.tolist(), starts.tolist(), ends.tolist()):
+        intervals[slot_id].append((start, end))
+    for (t1, t2), found in list(zip(windows, earliest))[:50]:
+        assert found[0] == brute_earliest(intervals, t1, t2 - t1)[0], "earliest window differs"
+    print(f"  earliest free window:     index {earliest_s / args.queries * 1e3:7.3f} ms/query")
+
+    t = time.perf_counter()
+    added = 0
+    for t1, t2 in windows[:1000]:
+        free = index.free_slots('bench', t1, t2, now=0)
+        if free:
+            added += index.add('bench', free[0], t1, t2, ('new', t1), now=0)
+    insert_s = time.perf_counter() - t
+    print(f"  check + insert:           index {insert_s / min(len(windows), 1000) * 1e3:7.3f} ms/reservation "
+          f"({added} added)")
+
+
+def bench_concurrency(args, rng):
+    import mongomock
+    db = mongomock.MongoClient().bench_reservations
+    db.slots.insert_many([{"lot_id": 'bench', "slot_id": i, "status": "free"} for i in range(args.contended_slots)])
+    bookings, slots = SerializedCollection(db.bookings), SerializedCollection(db.slots)
+    workers = [ReservationBook(bookings, slots, {'bench': args.contended_slots}) for _ in range(2)]
+
+    day0 = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+    windows = [(day0 + timedelta(hours=h), timedelta(hours=d))
+               for h, d in zip(rng.integers(0, 72, args.reservations).tolist(),
+                               rng.integers(1, 6, args.reservations).tolist())]
+    made, refused = [0], [0]
+    lock = threading.Lock()
+
+    def run(worker_id):
+        book = workers[worker_id % len(workers)]
+        for i in range(worker_id, len(windows), args.threads):
+            start, duration = windows[i]
+            booking = book.reserve(f"user-{i}", 'bench', start, start + duration)
+            if booking and i % 2:
+                book.confirm(booking["_id"], booking["holder"])
+            with lock:
+                made[0] += booking is not None
+                refused[0] += booking is None
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(args.threads)]
+    t = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - t
+
+    overlaps = 0
+    per_slot = {}
+    for doc in db.bookings.find({"status": {"$in": [PENDING, BOOKED]}}):
+        per_slot.setdefault(doc["slot_id"], []).append((to_seconds(doc["start"]), to_seconds(doc["end"])))
+    for intervals in per_slot.values():
+        intervals.sort()
+        overlaps += sum(1 for a, b in zip(intervals, intervals[1:]) if b[0] < a[1])
+    print(f"concurrent: {args.threads} threads, 2 workers, {args.contended_slots} slots over 3 days")
+    print(f"  reserved: {made[0]}  refused: {refused[0]}  overlapping reservations: {overlaps}  "
+          f"({len(windows) / elapsed:.0f} attempts/s on mongomock)")
+    assert overlaps == 0, "double-booked"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--slots', type=int, default=400)
+    parser.add_argument('--bookings', type=int, default=300000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--reservations', type=int, default=2000)
+    parser.add_argument('--contended-slots', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+    bench_index(args, rng)
+    bench_concurrency(args, rng)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Web app startup: import cost per module and warm-up time per subsystem.
+
+Each measurement runs in a fresh interpreter. The first imports main.py
+under ``-X importtime`` (with ``WARMUP=lazy``, so no warm-up thread imports
+alongside) and lists what each of its imports costs, including everything
+that import pulls in. The second imports main.py as a server would (which
+runs ``create_app()``), then times the first request and every subsystem's
+background warm-up until ``/ready`` reports them all ready.
+
+    python -m benchmarks.bench_startup [--mongo-uri mongodb://localhost:27017/parking] [--timeout 60]
+
+Without --mongo-uri the app runs against mongomock, so the mongo line is
+only the in-process part of its warm-up.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_costs(env):
+    # -X importtime lines: "import time: self [us] | cumulative | <indent><module>"
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    imports, pending = [], []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            if name.strip() == 'main':
+                imports = pending
+                total = int(cumulative)
+            pending = []
+        elif depth == 1:
+            pending.append((name.strip(), int(cumulative)))
+    return sorted(imports, key=lambda item: -item[1]), total
+
+
+def child(args):
+    if not args.mongo_uri:
+        import flask_pymongo
+        import mongomock
+        flask_pymongo.MongoClient = mongomock.MongoClient
+
+    t = time.perf_counter()
+    import main
+    imported = time.perf_counter() - t
+    client = main.app.test_client()
+    client.get('/')
+    first = time.perf_counter() - t
+
+    deadline = time.monotonic() + args.timeout
+    while client.get('/ready').status_code != 200 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    ready = time.perf_counter() - t
+    print(json.dumps({'import': imported, 'first_request': first, 'ready': ready,
+                      'subsystems': main.app.extensions['warmup'].status()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mongo-uri')
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--top', type=int, default=12)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+
+    env = dict(os.environ, WARMUP='lazy')
+    if args.mongo_uri:
+        env['MONGO_URI'] = args.mongo_uri
+    imports, total = import_costs(env)
+    print(f"import main: {total / 1000:7.1f} ms")
+    for module, us in imports[:args.top]:
+        print(f"  {module:24} {us / 1000:7.1f} ms")
+
+    command = [sys.executable, '-m', 'benchmarks.bench_startup', '--child', '--timeout', str(args.timeout)]
+    if args.mongo_uri:
+        command += ['--mongo-uri', args.mongo_uri]
+    env = dict(env, WARMUP='background')
+    out = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+    result = json.loads(out.strip().splitlines()[-1])
+    print(f"import + create_app: {result['import'] * 1000:7.1f} ms")
+    print(f"first response:     {result['first_request'] * 1000:7.1f} ms")
+    print(f"ready:              {result['ready'] * 1000:7.1f} ms")
+    for name, status in result['subsystems'].items():
+        seconds = f"{status['seconds'] * 1000:7.1f} ms" if status['seconds'] is not None else '      -'
+        print(f"  {name:12} {status['state']:8} {seconds}  {status['error'] or ''}")
+
+
+if __name__ == '__main__':
+    main()
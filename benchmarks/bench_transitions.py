@@ -0,0 +1,88 @@
+"""Occupancy analytics over a long transition log.
+
+Writes a synthetic log for one lot (``--spots`` spots, ``--days`` of
+history, ``--rate`` transitions per spot per day) as compacted segments the
+way TransitionLog leaves them, then times TransitionStore.analyze over
+windows of different lengths from cold memory-mapped files.
+
+    python -m benchmarks.bench_transitions [--spots 2000] [--days 90] [--rate 20]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from spot_table import FREE, OCCUPIED, UNKNOWN
+from transitions import TransitionStore, write_segment, list_segments
+
+
+def synthesize(lot_dir, n_spots, days, rate, segment_days, seed=0):
+    rng = np.random.default_rng(seed)
+    end = time.time()
+    start = end - days * 86400
+    per_spot = rng.poisson(rate * days, n_spots)
+    spot = np.repeat(np.arange(n_spots, dtype=np.int32), per_spot)
+    t = start + rng.random(len(spot)) * (end - start)
+    order = np.lexsort((t, spot))
+    spot, t = spot[order], t[order]
+
+    # Alternate occupied/free per spot; the first transition comes from unknown
+    first = np.r_[True, spot[1:] != spot[:-1]]
+    rank = np.arange(len(spot)) - np.maximum.accumulate(np.where(first, np.arange(len(spot)), 0))
+    state = np.where(rank % 2 == 0, OCCUPIED, FREE).astype(np.uint8)
+    prev_t = np.where(first, 0.0, np.r_[0.0, t[:-1]])
+    prev_state = np.where(first, UNKNOWN, np.r_[UNKNOWN, state[:-1]]).astype(np.uint8)
+
+    by_time = np.argsort(t, kind='stable')
+    rows = {'t': t[by_time], 'spot': spot[by_time], 'state': state[by_time],
+            'prev_t': prev_t[by_time], 'prev_state': prev_state[by_time]}
+    snap_state = np.full(n_spots, UNKNOWN, np.uint8)
+    snap_since = np.zeros(n_spots)
+    bounds = np.searchsorted(rows['t'], np.arange(start, end, segment_days * 86400)[1:])
+    for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, len(t)]):
+        part = {name: column[lo:hi] for name, column in rows.items()}
+        # Rows are in time order, so the last write per spot wins
+        snap_state[part['spot']] = part['state']
+        snap_since[part['spot']] = part['t']
+        part['snap_state'], part['snap_since'] = snap_state, snap_since
+        write_segment(lot_dir, 3, part)
+    return start, end, len(t)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--spots', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--rate', type=float, default=20, help='transitions per spot per day')
+    parser.add_argument('--segment-days', type=float, default=10)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='transitions-')
+    try:
+        lot_dir = os.path.join(root, 'bench')
+        os.makedirs(lot_dir)
+        start, end, n_rows = synthesize(lot_dir, args.spots, args.days, args.rate, args.segment_days)
+        size = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(lot_dir) for f in files)
+        print(f"{n_rows:,} transitions, {args.spots} spots, {args.days} days, "
+              f"{len(list_segments(lot_dir))} segments, {size / 2 ** 20:.0f} MiB")
+
+        store = TransitionStore(root)
+        for days in (1, 7, 30, args.days):
+            elapsed = []
+            for _ in range(3):
+                t = time.perf_counter()
+                result = store.analyze('bench', end - days * 86400, end, args.spots)
+                elapsed.append(time.perf_counter() - t)
+            print(f"  {days:3d} days: {min(elapsed) * 1000:7.1f} ms (first {elapsed[0] * 1000:.1f} ms), "
+                  f"utilization {result['utilization']['overall']:.3f}, "
+                  f"{result['turnover']['arrivals']:,} arrivals, median dwell "
+                  f"{result['dwell']['percentiles']['p50'] / 60:.0f} min")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Local stand-in for the razorpay Orders API, for offline checkout load tests.
+
+    python -m benchmarks.stub_gateway [--port 8099] [--latency 0.2]
+    RAZORPAY_BASE_URL=http://127.0.0.1:8099 python main.py
+
+Implements ``POST /v1/orders`` and ``GET /v1/orders?receipt=`` with a fixed
+(optionally jittered) response delay, and counts the orders created per
+receipt so duplicate orders show up in benchmarks.
+"""
+import argparse
+import collections
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class StubGateway(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.2, jitter=0.0):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.orders = {}
+        self.by_receipt = collections.defaultdict(list)
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='stub-gateway', daemon=True).start()
+        return self
+
+    def duplicates(self):
+        with self.lock:
+            return sum(len(ids) - 1 for ids in self.by_receipt.values() if len(ids) > 1)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real gateway
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body, status=200):
+        gateway = self.server
+        time.sleep(max(gateway.latency + random.uniform(-gateway.jitter, gateway.jitter), 0))
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/v1/orders':
+            return self._reply({'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'not found'}}, 404)
+        data = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        order = {'id': f"order_{uuid.uuid4().hex[:14]}", 'entity': 'order', 'amount': data['amount'],
+                 'currency': data.get('currency', 'INR'), 'receipt': data.get('receipt'), 'status': 'created',
+                 'notes': data.get('notes', {}), 'created_at': int(time.time())}
+        gateway = self.server
+        with gateway.lock:
+            gateway.orders[order['id']] = order
+            gateway.by_receipt[order['receipt']].append(order['id'])
+        self._reply(order)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != '/v1/orders':
+            return self._reply({'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'not found'}}, 404)
+        receipt = parse_qs(url.query).get('receipt', [None])[0]
+        gateway = self.server
+        with gateway.lock:
+            items = [gateway.orders[i] for i in gateway.by_receipt.get(receipt, [])]
+        self._reply({'entity': 'collection', 'count': len(items), 'items': items})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds per response')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    args = parser.parse_args()
+
+    gateway = StubGateway(('127.0.0.1', args.port), args.latency, args.jitter)
+    print(f"Stub gateway on {gateway.base_url}")
+    gateway.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Synthetic camera frames for a lot, generated from its mask.
+
+Every spot of the mask is either empty (asphalt) or holds a "car" (a filled
+block with a darker windscreen). Each frame flips a fixed fraction of spots,
+so the change rate seen by the pipeline is controlled exactly.
+"""
+import cv2
+import numpy as np
+
+from util import get_parking_spots_bboxes
+
+
+class SyntheticLot:
+    def __init__(self, mask_path='mask_1920_1080.png', occupancy=0.6, change_rate=0.02, seed=0):
+        mask = cv2.imread(mask_path, 0)
+        if mask is None:
+            raise ValueError(f"cannot read mask {mask_path!r}")
+        self.spots = get_parking_spots_bboxes(cv2.connectedComponentsWithStats(mask, 4, cv2.CV_32S))
+        self.change_rate = change_rate
+        self.rng = np.random.default_rng(seed)
+
+        h, w = mask.shape
+        asphalt = cv2.GaussianBlur(self.rng.normal(95, 18, (h, w)).astype(np.float32), (5, 5), 0)
+        self.background = cv2.cvtColor(np.clip(asphalt, 0, 255).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+        for x1, y1, sw, sh in self.spots:
+            cv2.rectangle(self.background, (x1, y1), (x1 + sw, y1 + sh), (230, 230, 230), 1)
+
+        n = len(self.spots)
+        self.occupied = self.rng.random(n) < occupancy
+        self.car_colors = self.rng.integers(0, 256, (n, 3))
+        self.frame = self.background.copy()
+        for i in range(n):
+            self._paint(i)
+
+    def _paint(self, i):
+        x1, y1, w, h = self.spots[i]
+        self.frame[y1:y1 + h, x1:x1 + w] = self.background[y1:y1 + h, x1:x1 + w]
+        if self.occupied[i]:
+            mx, my = max(w // 8, 1), max(h // 6, 1)
+            color = tuple(int(c) for c in self.car_colors[i])
+            cv2.rectangle(self.frame, (x1 + mx, y1 + my), (x1 + w - mx, y1 + h - my), color, -1)
+            cv2.rectangle(self.frame, (x1 + w // 3, y1 + 2 * my), (x1 + w // 2, y1 + h - 2 * my), (40, 40, 40), -1)
+
+    def next_frame(self):
+        """Advance one frame, flipping ``change_rate`` of the spots; returns a new array."""
+        n_changes = self.rng.binomial(len(self.spots), self.change_rate)
+        for i in self.rng.choice(len(self.spots), n_changes, replace=False):
+            self.occupied[i] = not self.occupied[i]
+            self.car_colors[i] = self.rng.integers(0, 256, 3)
+            self._paint(i)
+        return self.frame.copy()
+
+    def write_video(self, path, n_frames, fps=30):
+        h, w = self.frame.shape[:2]
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (w, h))
+        for _ in range(n_frames):
+            writer.write(self.next_frame())
+        writer.release()
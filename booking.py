@@ -50,12 +50,11 @@ def index():
 
 @app.route('/find_seat', methods=['POST'])
 def find_seat():
-    # Simulate finding an empty seat
-    while True:
-        row = random.randint(0, 4)
-        col = random.randint(0, 4)
-        if not parking_lot[row][col]:
-            break
+    # Simulate finding an empty seat; probing random cells never ends once the lot is full
+    empty = [(row, col) for row in range(5) for col in range(5) if not parking_lot[row][col]]
+    if not empty:
+        return jsonify({'status': 'error', 'message': 'No free seats available'})
+    row, col = random.choice(empty)
 
     parking_lot[row][col] = 'selected'
     time.sleep(10)
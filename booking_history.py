@@ -0,0 +1,57 @@
+from bson import ObjectId
+from bson.errors import InvalidId
+
+# Only the fields book_history.html displays
+HISTORY_FIELDS = {"name": 1, "phone": 1, "start_time": 1, "hours": 1, "status": 1, "slot_id": 1, "lot_id": 1}
+PAGE_SIZE = 50
+
+
+def encode_cursor(booking):
+    return f"{booking['_id']}.{booking.get('start_time', '')}"
+
+
+def decode_cursor(cursor):
+    """``(start_time, _id)`` of the last booking of the previous page, or None if malformed."""
+    booking_id, _, start_time = cursor.partition('.')
+    try:
+        return start_time, ObjectId(booking_id)
+    except InvalidId:
+        return None
+
+
+class HistoryPage:
+    """One page of a user's bookings, newest first, read lazily from Mongo.
+
+    Pages are keyed on ``(start_time, _id)`` of the last booking shown rather
+    than skipped over, so every page is a range scan of the
+    ``email, start_time, _id`` index, already in page order, however far
+    back it is. Iterate over the page
+    first; ``next_cursor`` (None on the last page) is known once it is done.
+    """
+
+    def __init__(self, bookings, email, cursor=None, limit=PAGE_SIZE):
+        self.limit = limit
+        self.next_cursor = None
+
+        query = {"email": email}
+        after = decode_cursor(cursor) if cursor else None
+        if after:
+            start_time, booking_id = after
+            query["$or"] = [
+                {"start_time": {"$lt": start_time}},
+                {"start_time": start_time, "_id": {"$lt": booking_id}},
+            ]
+        # One extra document tells whether there is a next page
+        self._cursor = (bookings.find(query, HISTORY_FIELDS)
+                        .sort([("start_time", -1), ("_id", -1)])
+                        .limit(limit + 1)
+                        .batch_size(limit + 1))
+
+    def __iter__(self):
+        last = None
+        for n, booking in enumerate(self._cursor):
+            if n == self.limit:
+                self.next_cursor = encode_cursor(last)
+                break
+            last = booking
+            yield booking
@@ -0,0 +1,30 @@
+import threading
+
+
+class PendingLimit:
+    """Submits calls to an executor, up to ``limit`` of them unfinished at a time.
+
+    A call over the limit raises ``busy`` at once instead of joining the
+    executor's queue. A call counts until the executor finishes it, even if
+    whoever submitted it stopped waiting for the result.
+    """
+
+    def __init__(self, limit, busy, what='calls'):
+        self.limit = limit
+        self.busy = busy  # exception class raised over the limit
+        self.what = what  # e.g. "password hashes", for the busy message
+        self.pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, executor, fn, *args):
+        with self._lock:
+            if self.pending >= self.limit:
+                raise self.busy(f"{self.pending} {self.what} pending")
+            future = executor.submit(fn, *args)
+            self.pending += 1
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self.pending -= 1
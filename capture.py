@@ -0,0 +1,153 @@
+import collections
+import logging
+import threading
+import time
+
+import cv2
+
+from metrics import STAGE_SECONDS, DROPPED_FRAMES
+
+logger = logging.getLogger(__name__)
+
+
+def is_live(source):
+    # Camera index or network stream; anything else is a file played in a loop
+    return isinstance(source, int) or '://' in str(source)
+
+
+class FrameQueue:
+    """Bounded queue of decoded frames that drops the oldest frame when full."""
+
+    def __init__(self, maxsize=2):
+        self._items = collections.deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """The oldest queued item, or None after ``timeout`` seconds without one."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items, timeout):
+                return None
+            return self._items.popleft()
+
+
+class CaptureReader(threading.Thread):
+    """Reads a lot's camera source in its own thread and hands on only the frames that are used.
+
+    Every source frame is grabbed, but it is only retrieved (converted to a
+    BGR image) on classification ticks (every ``step``-th frame) and as often
+    as the stream viewers need; ``stream_fps()`` returns that demand (0 while
+    nobody watches, ``inf`` for every frame). The other frames never reach
+    the pipeline, so they are not annotated, encoded or published either.
+    Note that the FFmpeg backend already decodes in ``grab``; only the color
+    conversion and copy of a skipped frame are saved at this stage.
+    Retrieved frames go to ``frames`` as ``(frame, classify)`` and the oldest
+    one is dropped if the consumer falls behind.
+
+    Files are played at their own frame rate and rewound at the end. A
+    source that fails to open or to yield frames is reopened with
+    exponential backoff, until a frame is grabbed again.
+    """
+
+    def __init__(self, source, step, stream_fps=lambda: float('inf'), lot_id='', maxsize=2, realtime=True,
+                 max_backoff=30.0):
+        super().__init__(daemon=True, name=f"capture-{lot_id}")
+        self.source = source
+        self.step = step
+        self.stream_fps = stream_fps
+        self.lot_id = lot_id
+        self.frames = FrameQueue(maxsize)
+        self.live = is_live(source)
+        self.realtime = realtime and not self.live
+        self.max_backoff = max_backoff
+        self.frame_nmr = 0  # source frames grabbed
+        self.decoded = 0
+        self.stage_seconds = STAGE_SECONDS
+        self._cap = None
+        self._fps = 30
+        self._failures = 0  # consecutive failed opens and grabs, reset by a grabbed frame
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _backoff(self):
+        # Seconds to wait after the latest of consecutive failures to open or grab
+        delay = min(0.5 * 2 ** self._failures, self.max_backoff)
+        self._failures += 1
+        return delay
+
+    def _open(self):
+        while not self._stop_event.is_set():
+            cap = cv2.VideoCapture(self.source)
+            if cap.isOpened():
+                self._fps = cap.get(cv2.CAP_PROP_FPS) or 30
+                return cap
+            cap.release()
+            delay = self._backoff()
+            logger.warning("Lot %s: cannot open %s, retrying in %.1fs", self.lot_id, self.source, delay)
+            self._stop_event.wait(delay)
+
+    def _grab(self):
+        with self.stage_seconds.time(lot=self.lot_id, stage='grab'):
+            grabbed = self._cap.grab()
+        if not grabbed and not self.live:
+            # End of file: play it again from the start
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            grabbed = self._cap.grab()
+        if grabbed:
+            self._failures = 0
+            return True
+
+        # A source that opens but yields no frames backs off like one that does not open
+        delay = self._backoff()
+        logger.warning("Lot %s: lost %s, reconnecting in %.1fs", self.lot_id, self.source, delay)
+        self._cap.release()
+        self._stop_event.wait(delay)
+        self._cap = self._open()
+        return False
+
+    def run(self):
+        self._cap = self._open()
+        next_frame_at = time.monotonic()
+        next_stream_at = 0.0
+
+        while not self._stop_event.is_set():
+            if not self._grab():
+                next_frame_at = time.monotonic()
+                continue
+            now = time.monotonic()
+
+            classify = self.frame_nmr % self.step == 0
+            stream_fps = self.stream_fps()
+            stream = stream_fps > 0 and now >= next_stream_at
+            if classify or stream:
+                with self.stage_seconds.time(lot=self.lot_id, stage='decode'):
+                    success, frame = self._cap.retrieve()
+                if success:
+                    self.decoded += 1
+                    dropped = self.frames.dropped
+                    self.frames.put((frame, classify))
+                    if self.frames.dropped != dropped:
+                        DROPPED_FRAMES.inc(lot=self.lot_id, where='capture')
+                    if stream:
+                        next_stream_at = now + 1.0 / stream_fps
+            self.frame_nmr += 1
+
+            if self.realtime:
+                # Files decode faster than real time; keep to the source frame rate
+                next_frame_at += 1.0 / self._fps
+                delay = next_frame_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_frame_at = time.monotonic()
+        if self._cap is not None:
+            self._cap.release()
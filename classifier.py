@@ -0,0 +1,153 @@
+import os
+import threading
+
+import numpy as np
+
+# ----------------------
+# Spot Classifier Backends
+# ----------------------
+# SPOT_MODEL picks the model file and, by its extension, the backend:
+#   model.p    pickled scikit-learn estimator (needs the pinned scikit-learn)
+#   model.npz  NumPy export of an SVC written by export_model.py; no sklearn import
+SPOT_MODEL = os.getenv('SPOT_MODEL', 'model.p')
+
+# SVC decision values are about +-1.5 away from the boundary; scaled so those
+# map to a confidence of ~0.95
+DECISION_SCALE = 2.0
+
+
+class SpotClassifier:
+    """Scores flattened 15x15x3 spot crops (scaled to [0, 1]); label 0 means empty.
+
+    Backends implement ``_load`` and ``decision_function``; the model is
+    loaded on first use, not when the classifier is created.
+    """
+
+    classes_ = None
+
+    def __init__(self, path):
+        self.path = path
+        self._loaded = False
+        self._load_lock = threading.Lock()
+
+    def load(self):
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    self._load()
+                    self._loaded = True
+        return self
+
+    def _load(self):
+        raise NotImplementedError
+
+    def decision_function(self, data):
+        """Signed distance to the boundary; positive towards ``classes_[1]``."""
+        raise NotImplementedError
+
+    def predict(self, data):
+        self.load()
+        return self.classes_[(self.decision_function(data) > 0).astype(np.intp)]
+
+    def empty_confidence(self, data):
+        """Probability-like confidence in [0, 1] that each crop is an empty spot."""
+        self.load()
+        decision = self.decision_function(data)
+        if self.classes_[1] == 0:
+            decision = -decision
+        return 1.0 / (1.0 + np.exp(DECISION_SCALE * decision))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.path!r})"
+
+
+class SklearnClassifier(SpotClassifier):
+    """The pickled scikit-learn estimator, as trained."""
+
+    def _load(self):
+        import pickle
+        import warnings
+        warnings.filterwarnings("ignore", category=UserWarning, module='sklearn')
+
+        with open(self.path, 'rb') as f:
+            self.model = pickle.load(f)
+        self.classes_ = self.model.classes_
+
+    def decision_function(self, data):
+        self.load()
+        return self.model.decision_function(data)
+
+    def predict(self, data):
+        self.load()
+        return self.model.predict(data)
+
+    def empty_confidence(self, data):
+        self.load()
+        if getattr(self.model, 'probability', False):
+            return self.model.predict_proba(data)[:, int(np.flatnonzero(self.classes_ == 0)[0])]
+        return super().empty_confidence(data)
+
+
+class NumpySVMClassifier(SpotClassifier):
+    """Binary SVC decision function evaluated with NumPy from exported weights.
+
+    decision(x) = sum_i dual_coef_i * K(sv_i, x) + intercept, with an RBF
+    kernel exp(-gamma * |sv - x|^2) or a linear kernel sv . x.
+    """
+
+    def _load(self):
+        with np.load(self.path) as npz:
+            self.kernel = str(npz['kernel'])
+            self.gamma = float(npz['gamma'])
+            self.support_vectors = npz['support_vectors']
+            self.dual_coef = npz['dual_coef'].ravel()
+            self.intercept = float(npz['intercept'][0])
+            self.classes_ = npz['classes']
+        if self.kernel not in ('rbf', 'linear'):
+            raise ValueError(f"{self.path}: unsupported kernel {self.kernel!r}")
+        self._sv_sq_norms = np.einsum('ij,ij->i', self.support_vectors, self.support_vectors)
+        if self.kernel == 'linear':
+            self._weights = self.dual_coef @ self.support_vectors
+
+    def decision_function(self, data):
+        self.load()
+        data = np.asarray(data, dtype=np.float64)
+        if self.kernel == 'linear':
+            return data @ self._weights + self.intercept
+
+        # |x - sv|^2 = |x|^2 + |sv|^2 - 2 x . sv, for all pairs in one matrix product
+        sq_dists = data @ self.support_vectors.T
+        sq_dists *= -2
+        sq_dists += self._sv_sq_norms
+        sq_dists += np.einsum('ij,ij->i', data, data)[:, None]
+        np.maximum(sq_dists, 0, out=sq_dists)
+        sq_dists *= -self.gamma
+        return np.exp(sq_dists, out=sq_dists) @ self.dual_coef + self.intercept
+
+
+def export_svc(model, path):
+    """Write the weights ``NumpySVMClassifier`` needs from a fitted binary sklearn SVC."""
+    if len(model.classes_) != 2 or model.kernel not in ('rbf', 'linear'):
+        raise ValueError(f"only binary rbf/linear SVCs can be exported, got {model!r}")
+    np.savez(path, kernel=model.kernel, gamma=model._gamma, support_vectors=model.support_vectors_,
+             dual_coef=model.dual_coef_, intercept=model.intercept_, classes=model.classes_)
+
+
+def load_classifier(path=SPOT_MODEL):
+    if path.endswith('.npz'):
+        return NumpySVMClassifier(path)
+    return SklearnClassifier(path)
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_classifier():
+    """The process-wide classifier, created from SPOT_MODEL on first use."""
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                _classifier = load_classifier()
+    return _classifier.load()
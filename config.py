@@ -1,21 +1,81 @@
-import cv2
-from util import get_parking_spots_bboxes
+import json
+import os
+
+from geometry import load_geometry
 
 # ----------------------
 # Parking Detection Config
 # ----------------------
-mask_path = 'mask_1920_1080.png'
-video_path = 'D:\\parkvision\\parking_1920_1080.mp4'
-
-mask = cv2.imread(mask_path, 0)
-cap = cv2.VideoCapture(video_path)
-connected_components = cv2.connectedComponentsWithStats(mask, 4, cv2.CV_32S)
-spots = get_parking_spots_bboxes(connected_components)
-
-# Initialize spots_status
-spots_status = [None for _ in spots]  # Define spots_status as a list of None values, one per spot
-spot_numbers = [i for i in range(len(spots))]
-diffs = [None for _ in spots]
-previous_frame = None
-frame_nmr = 0
-step = 30
+# Lots (one camera each) are described in a JSON file:
+#
+#   {
+#     "processes": 2,
+#     "lots": [
+#       {"id": "north", "name": "North lot", "mask_path": "mask_1920_1080.png",
+#        "video_path": "rtsp://camera-1/stream", "step": 10, "entrance": [960, 1080]}
+#     ]
+#   }
+#
+# "processes" is the number of worker processes the lots are spread over;
+# 0 runs every lot in a thread of the web process.
+LOTS_CONFIG = os.getenv('LOTS_CONFIG', 'lots.json')
+
+# "embedded" runs the lots' pipelines in the web process. "external" leaves
+# them to detector.py and serves their state from shared memory, so the web
+# app can run as several worker processes (e.g. gunicorn -w 4).
+DETECTOR = os.getenv('DETECTOR', 'embedded')
+
+
+class Lot:
+    """One parking lot: its camera source, mask and the spot bboxes derived from it."""
+
+    def __init__(self, lot_id, mask_path, video_path, name=None, step=10, diff_threshold=6.0,
+                 full_refresh_every=30, show_window=False, stream_quality=80, ema_alpha=0.5, enter_free=0.6,
+                 exit_free=0.4, min_dwell=1.0, entrance=None):
+        self.id = lot_id
+        self.name = name or lot_id
+        self.mask_path = mask_path
+        self.video_path = video_path
+        self.step = step
+        self.diff_threshold = diff_threshold
+        self.full_refresh_every = full_refresh_every
+        self.show_window = show_window  # debug cv2.imshow of the empty spots; needs a display
+        self.stream_quality = stream_quality  # default JPEG quality of /video_feed
+        # Status smoothing (see smoothing.SpotSmoother): EMA weight of each new
+        # classification, "empty" confidence to become free / occupied, and the
+        # seconds a new status must hold before it is published
+        self.ema_alpha = ema_alpha
+        self.enter_free = enter_free
+        self.exit_free = exit_free
+        self.min_dwell = min_dwell
+        # [x, y] in mask pixels; /find_seat offers the free spot nearest to it
+        self.entrance = tuple(entrance) if entrance else None
+
+        try:
+            self.geometry = load_geometry(mask_path)
+        except (OSError, ValueError) as e:
+            raise ValueError(f"Lot {lot_id!r}: {e}") from e
+        self.frame_shape = self.geometry.shape
+        self.spots = self.geometry.spots()
+        self.spot_numbers = [i for i in range(len(self.spots))]
+
+    def __repr__(self):
+        return f"Lot({self.id!r}, spots={len(self.spots)})"
+
+
+def load_config(path=LOTS_CONFIG):
+    with open(path) as f:
+        data = json.load(f)
+
+    lots = {}
+    for entry in data['lots']:
+        entry = dict(entry)
+        lot = Lot(entry.pop('id'), **entry)
+        if lot.id in lots:
+            raise ValueError(f"Duplicate lot id {lot.id!r} in {path}")
+        lots[lot.id] = lot
+
+    return {
+        'lots': lots,
+        'processes': int(data.get('processes', 0)),
+    }
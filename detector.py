@@ -0,0 +1,74 @@
+"""Runs the lots' camera pipelines as one dedicated process.
+
+    python detector.py [--mongo-uri $MONGO_URI] [--metrics-port 9108]
+    DETECTOR=external gunicorn -w 4 main:app
+
+Decode and inference run once, here, however many web workers there are.
+Spot status (and the stream, while someone watches it) is published to
+shared memory (see shared_state.py), which every web worker started with
+DETECTOR=external mirrors. Detector status is synced to Mongo, and spot
+transitions are logged (see transitions.py), from here.
+
+The pipeline metrics (stage timings, frames, classified spots, flips and
+dropped frames, including those of pipeline worker processes) are recorded
+here too, and served at ``http://<host>:<--metrics-port>/metrics``. Scrape
+that as well as every web worker's /metrics, which then only has the
+web-side series (stream clients and encodes).
+"""
+import argparse
+import logging
+import os
+import signal
+import sys
+import time
+
+import dotenv
+from pymongo import MongoClient
+
+from config import load_config
+from indexes import DEFAULT_MONGO_URI
+from metrics import start_http_server
+from pipeline import LotEngine
+from shared_state import SharedStatePublisher
+from slot_sync import SlotSync
+from transitions import TransitionLog
+
+
+def main():
+    # The same database as the web app: MONGO_URI from the environment or .env
+    dotenv.load_dotenv()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI', DEFAULT_MONGO_URI))
+    parser.add_argument('--metrics-port', type=int, default=int(os.getenv('DETECTOR_METRICS_PORT', '9108')),
+                        help='port of the pipeline metrics endpoint; 0 turns it off')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'))
+    lots_config = load_config()
+
+    slot_sync = SlotSync(MongoClient(args.mongo_uri).get_default_database().slots)
+    publisher = SharedStatePublisher(lots_config['lots'])
+    transition_log = TransitionLog(lots_config['lots'])
+    engine = LotEngine(lots_config['lots'], processes=lots_config['processes'],
+                       status_listeners=[slot_sync.submit, publisher.publish_status, transition_log.record])
+
+    # Remove the shared memory on the way out; web workers attach to the next detector's
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        if args.metrics_port:
+            start_http_server(args.metrics_port)
+        slot_sync.start()
+        transition_log.start()
+        engine.start()
+        publisher.start(engine)
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        publisher.close()
+        transition_log.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Export the pickled SVC to an .npz for the NumPy classifier backend.
+
+    python export_model.py [model.p] [model.npz]
+
+Checks that both backends agree before writing anything; run the service
+with SPOT_MODEL=model.npz to use the export.
+"""
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from classifier import SklearnClassifier, NumpySVMClassifier, export_svc
+from util import N_FEATURES
+
+
+def parity_inputs(model, n=2000, seed=0):
+    # Uniform noise, plus points around the support vectors where the
+    # decision value is close to the boundary
+    rng = np.random.default_rng(seed)
+    sv = model.support_vectors_
+    near = sv[rng.integers(0, len(sv), n)] + rng.normal(0, 0.05, (n, N_FEATURES))
+    return np.clip(np.vstack([rng.random((n, N_FEATURES)), sv, near]), 0, 1)
+
+
+def main():
+    src = sys.argv[1] if len(sys.argv) > 1 else 'model.p'
+    dst = sys.argv[2] if len(sys.argv) > 2 else 'model.npz'
+
+    reference = SklearnClassifier(src).load()
+    # Exported next to dst and moved over it only once it passes, so a running service never sees a bad one
+    fd, tmp = tempfile.mkstemp(suffix='.npz', dir=os.path.dirname(os.path.abspath(dst)))
+    os.close(fd)
+    try:
+        export_svc(reference.model, tmp)
+        exported = NumpySVMClassifier(tmp).load()
+
+        data = parity_inputs(reference.model)
+        max_diff = np.max(np.abs(reference.decision_function(data) - exported.decision_function(data)))
+        agreement = np.mean(reference.predict(data) == exported.predict(data))
+        print(f"{dst}: {len(data)} inputs, max decision difference {max_diff:.2e}, "
+              f"label agreement {agreement * 100:.2f}%")
+        if max_diff > 1e-6 or agreement < 1:
+            sys.exit(f"{dst} does not match {src}; left as it was")
+        os.replace(tmp, dst)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+if __name__ == '__main__':
+    main()
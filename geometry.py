@@ -0,0 +1,159 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# ----------------------
+# Lot Geometry Cache
+# ----------------------
+# A mask is labeled once; the result is kept under GEOMETRY_CACHE_DIR in a
+# directory named after the hash of the mask file's bytes and
+# GEOMETRY_VERSION, so editing a mask (or changing what is compiled) simply
+# misses the cache.
+GEOMETRY_CACHE_DIR = os.getenv('GEOMETRY_CACHE_DIR', '.geometry')
+GEOMETRY_VERSION = 1
+SAMPLE_SCALE = 4  # downsampling of the samples compiled into the cache; util.SpotDiffer's default
+
+_ARRAYS = ('bboxes', 'centroids', 'pixel_index', 'pixel_offsets')
+_SAMPLES = ('sample_index', 'sample_offsets')
+
+
+class LotGeometry:
+    """Spot geometry of one mask, in the pixel coordinates of ``shape`` (h, w).
+
+    ``bboxes`` are (x, y, w, h) and ``centroids`` (x, y) per spot. Each
+    spot's exact pixels, for bays that are not rectangles, are kept as flat
+    indices into the mask (``pixel_index[pixel_offsets[i]:pixel_offsets[i + 1]]``),
+    always in ``mask_shape``; ``scaled`` maps everything to the resolution a
+    camera actually delivers.
+    """
+
+    def __init__(self, shape, bboxes, centroids, pixel_index, pixel_offsets, base=None, key=None):
+        self.shape = tuple(shape)
+        self._base = base or self
+        self.mask_shape = self._base.shape
+        self.bboxes = bboxes
+        self.centroids = centroids
+        self.pixel_index = pixel_index
+        self.pixel_offsets = pixel_offsets
+        self.key = key
+        self._scaled = {}
+        self._samples = {}
+
+    def __len__(self):
+        return len(self.bboxes)
+
+    def spots(self):
+        """bboxes as the ``[[x, y, w, h], ...]`` lists the pipeline works with."""
+        return np.asarray(self.bboxes).tolist()
+
+    def scaled(self, shape):
+        """This geometry for frames of ``shape`` (h, w[, channels])."""
+        shape = tuple(shape[:2])
+        base = self._base
+        if shape == base.shape:
+            return base
+        if shape not in base._scaled:
+            sy, sx = shape[0] / base.shape[0], shape[1] / base.shape[1]
+            bboxes = np.asarray(base.bboxes, dtype=np.float64)
+            x1 = np.floor(bboxes[:, 0] * sx)
+            y1 = np.floor(bboxes[:, 1] * sy)
+            x2 = np.minimum(np.ceil((bboxes[:, 0] + bboxes[:, 2]) * sx), shape[1])
+            y2 = np.minimum(np.ceil((bboxes[:, 1] + bboxes[:, 3]) * sy), shape[0])
+            bboxes = np.stack([x1, y1, np.maximum(x2 - x1, 1), np.maximum(y2 - y1, 1)], axis=1).astype(np.int32)
+            centroids = (np.asarray(base.centroids) * [sx, sy]).astype(np.float32)
+            base._scaled[shape] = LotGeometry(shape, bboxes, centroids, base.pixel_index, base.pixel_offsets,
+                                              base=base, key=base.key)
+        return base._scaled[shape]
+
+    def samples(self, scale):
+        """``(index, offsets)``: each spot's pixels as flat indices into the frame downsampled by ``scale``.
+
+        Used to average a spot over its own pixels only (see ``util.SpotDiffer``).
+        """
+        if scale not in self._samples:
+            mh, mw = self.mask_shape
+            gh, gw = max(self.shape[0] // scale, 1), max(self.shape[1] // scale, 1)
+            pixels = np.asarray(self.pixel_index, dtype=np.int64)
+            spot = np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.pixel_offsets))
+            gy = np.minimum(pixels // mw * gh // mh, gh - 1)
+            gx = np.minimum(pixels % mw * gw // mw, gw - 1)
+            # One sample per grid cell a spot touches, grouped by spot
+            keys = np.unique(spot * (gh * gw) + gy * gw + gx)
+            offsets = np.searchsorted(keys // (gh * gw), np.arange(len(self) + 1))
+            self._samples[scale] = (keys % (gh * gw), offsets)
+        return self._samples[scale]
+
+
+def compile_geometry(mask, key=None):
+    """Label ``mask`` (spots non-zero) into a LotGeometry."""
+    n_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(mask, 4, cv2.CV_32S)
+    bboxes = stats[1:, [cv2.CC_STAT_LEFT, cv2.CC_STAT_TOP, cv2.CC_STAT_WIDTH, cv2.CC_STAT_HEIGHT]]
+
+    # Flat pixel indices of every spot, grouped by spot in label order
+    flat = labels.ravel()
+    pixel_index = np.flatnonzero(flat)
+    pixel_index = pixel_index[np.argsort(flat[pixel_index], kind='stable')].astype(np.int32)
+    pixel_offsets = np.concatenate([[0], np.cumsum(stats[1:, cv2.CC_STAT_AREA])]).astype(np.int64)
+    return LotGeometry(mask.shape, bboxes.astype(np.int32), centroids[1:].astype(np.float32), pixel_index,
+                       pixel_offsets, key=key)
+
+
+def mask_key(mask_path):
+    with open(mask_path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:16]
+    return f"{digest}-v{GEOMETRY_VERSION}"
+
+
+def save_geometry(geometry, path):
+    tmp = f"{path}.tmp-{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+    for name in _ARRAYS:
+        np.save(os.path.join(tmp, f"{name}.npy"), np.asarray(getattr(geometry, name)))
+    for name, array in zip(_SAMPLES, geometry.samples(SAMPLE_SCALE)):
+        np.save(os.path.join(tmp, f"{name}.npy"), array)
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump({'version': GEOMETRY_VERSION, 'shape': geometry.shape, 'spots': len(geometry)}, f)
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        # Another process compiled the same mask first
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def open_geometry(path, key=None):
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    if meta['version'] != GEOMETRY_VERSION:
+        raise ValueError(f"geometry cache {path!r} is version {meta['version']}")
+    arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name in _ARRAYS + _SAMPLES}
+    geometry = LotGeometry(meta['shape'], key=key, **{name: arrays[name] for name in _ARRAYS})
+    geometry._samples[SAMPLE_SCALE] = tuple(arrays[name] for name in _SAMPLES)
+    return geometry
+
+
+def load_geometry(mask_path, cache_dir=GEOMETRY_CACHE_DIR):
+    """The geometry of ``mask_path``, from the cache if it was compiled before."""
+    key = mask_key(mask_path)
+    path = os.path.join(cache_dir, key)
+    try:
+        return open_geometry(path, key)
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+
+    mask = cv2.imread(mask_path, 0)
+    if mask is None:
+        raise ValueError(f"cannot read mask {mask_path!r}")
+    geometry = compile_geometry(mask, key)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        save_geometry(geometry, path)
+    except OSError:
+        logger.warning("Could not cache the geometry of %s in %s", mask_path, cache_dir, exc_info=True)
+    return geometry
@@ -0,0 +1,44 @@
+import logging
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Database of the app, detector.py and init_db.py alike unless MONGO_URI (in
+# the environment or .env) names another
+DEFAULT_MONGO_URI = "mongodb://localhost:27017/your_database_name"
+
+# collection -> [(keys, options)]
+INDEXES = {
+    "bookings": [
+        # /book_history: one user's bookings in page order (newest first, _id breaking ties),
+        # so the sort is read off the index
+        ([("email", ASCENDING), ("start_time", DESCENDING), ("_id", DESCENDING)], {}),
+        # Reservation overlap checks: a slot's bookings starting before a window's end
+        ([("lot_id", ASCENDING), ("slot_id", ASCENDING), ("start", ASCENDING), ("end", ASCENDING)], {}),
+    ],
+    # Allocator claims match on status; a slot is identified by lot and id
+    "slots": [
+        ([("status", ASCENDING)], {}),
+        ([("lot_id", ASCENDING), ("slot_id", ASCENDING)], {"unique": True}),
+    ],
+    # Registration check and login
+    "users": [
+        ([("email", ASCENDING)], {"unique": True}),
+    ],
+}
+
+
+def ensure_indexes(db):
+    """Create the indexes the app's queries rely on; existing ones are left as they are.
+
+    A failure (e.g. duplicate emails blocking the unique index) is logged and
+    the remaining indexes are still created.
+    """
+    for collection, indexes in INDEXES.items():
+        for keys, options in indexes:
+            try:
+                db[collection].create_index(keys, **options)
+            except PyMongoError:
+                logger.exception("Could not create index %s on %s", keys, collection)
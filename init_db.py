@@ -1,24 +1,130 @@
-from flask import Flask
-from flask_pymongo import PyMongo
-import cv2
-from util import get_parking_spots_bboxes
-
-app = Flask(__name__)
-app.config['MONGO_URI'] = 'mongodb://localhost:27017/parkingdb'
-mongo = PyMongo(app)
-
-# Load the mask and spots
-mask_path = 'mask_1920_1080.png'
-mask = cv2.imread(mask_path, 0)
-connected_components = cv2.connectedComponentsWithStats(mask, 4, cv2.CV_32S)
-spots = get_parking_spots_bboxes(connected_components)
-
-# Initialize Parking Slots
-with app.app_context():
-    for i in range(len(spots)):
-        mongo.db.slots.update_one(
-            {"slot_id": i},
-            {"$setOnInsert": {"status": "free"}},
-            upsert=True
-        )
-    print("Parking slots initialized successfully.")
+"""Provision the slots collection from the lots' masks.
+
+    python init_db.py [--lots lots.json] [--mongo-uri $MONGO_URI]
+    python init_db.py --mask mask_1920_1080.png --lot-id main
+    python init_db.py --dry-run
+
+Spots are computed from each lot's mask and diffed against the slots already
+stored for that lot. New spots are inserted as free, spots whose bbox moved
+are updated, and slots no longer in the mask are retired (kept for the
+booking history, but never allocated or synced again). Slots stored by the
+old script, which have no lot id, are taken over by the first lot or
+retired. All changes go to Mongo in one ordered bulk_write; running it
+again without a mask change writes nothing.
+"""
+import argparse
+import collections
+import os
+import time
+from datetime import datetime, timezone
+
+import dotenv
+from pymongo import MongoClient, InsertOne, UpdateOne
+
+from allocation import FREE, RETIRED
+from config import LOTS_CONFIG, load_config
+from geometry import load_geometry
+from indexes import ensure_indexes, DEFAULT_MONGO_URI
+
+
+def mask_spots(mask_path):
+    return load_geometry(mask_path).spots()
+
+
+def plan(slots, lot_spots, legacy_lot=None):
+    """Bulk operations that bring ``slots`` in line with ``lot_spots`` ({lot_id: bboxes}).
+
+    Slots stored by the old single-lot script have no ``lot_id``; they are
+    taken over by ``legacy_lot`` (the first lot by default, which is also
+    the app's default lot) and the rest are retired.
+    """
+    fields = {"_id": 1, "lot_id": 1, "slot_id": 1, "status": 1, "bbox": 1}
+    existing = collections.defaultdict(dict)
+    for doc in slots.find({"lot_id": {"$in": list(lot_spots)}}, fields):
+        existing[doc["lot_id"]][doc["slot_id"]] = doc
+    legacy = {doc["slot_id"]: doc for doc in slots.find({"lot_id": None}, fields)}
+    if legacy_lot is None:
+        legacy_lot = next(iter(lot_spots), None)
+
+    now = datetime.now(timezone.utc)
+    ops = []
+    stats = collections.Counter()
+    for lot_id, spots in lot_spots.items():
+        stored = existing[lot_id]
+        for slot_id, bbox in enumerate(spots):
+            bbox = [int(v) for v in bbox]
+            doc = stored.get(slot_id)
+            if doc is None and lot_id == legacy_lot and slot_id in legacy:
+                # Keeps its status, so a slot booked before the upgrade stays booked
+                doc = legacy.pop(slot_id)
+                ops.append(UpdateOne({"_id": doc["_id"], "lot_id": None},
+                                     {"$set": {"lot_id": lot_id, "bbox": bbox}}))
+                stats["adopted"] += 1
+            elif doc is None:
+                ops.append(InsertOne({"lot_id": lot_id, "slot_id": slot_id, "status": FREE, "bbox": bbox}))
+                stats["inserted"] += 1
+            elif doc.get("status") == RETIRED:
+                ops.append(UpdateOne({"_id": doc["_id"], "status": RETIRED},
+                                     {"$set": {"status": FREE, "bbox": bbox}, "$unset": {"retired_at": ""}}))
+                stats["restored"] += 1
+            elif doc.get("bbox") != bbox:
+                ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"bbox": bbox}}))
+                stats["updated"] += 1
+
+        for slot_id, doc in stored.items():
+            if slot_id >= len(spots) and doc.get("status") != RETIRED:
+                ops.append(UpdateOne({"_id": doc["_id"]},
+                                     {"$set": {"status": RETIRED, "retired_at": now},
+                                      "$unset": {"holder": "", "hold_expires": ""}}))
+                stats["retired"] += 1
+
+    for doc in legacy.values():
+        if doc.get("status") != RETIRED:
+            ops.append(UpdateOne({"_id": doc["_id"]},
+                                 {"$set": {"status": RETIRED, "retired_at": now},
+                                  "$unset": {"holder": "", "hold_expires": ""}}))
+            stats["retired"] += 1
+    return ops, stats
+
+
+def provision(slots, lot_spots, dry_run=False):
+    ops, stats = plan(slots, lot_spots)
+    if ops and not dry_run:
+        slots.bulk_write(ops, ordered=True)
+    return stats
+
+
+def main():
+    # The same database as the web app: MONGO_URI from the environment or .env
+    dotenv.load_dotenv()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI', DEFAULT_MONGO_URI))
+    parser.add_argument('--lots', default=LOTS_CONFIG, help='lots config to provision')
+    parser.add_argument('--mask', help='provision a single lot from this mask instead of the lots config')
+    parser.add_argument('--lot-id', help='lot id for --mask')
+    parser.add_argument('--dry-run', action='store_true', help='report the changes without writing them')
+    args = parser.parse_args()
+
+    if args.mask:
+        if not args.lot_id:
+            parser.error('--mask needs --lot-id')
+        lot_spots = {args.lot_id: mask_spots(args.mask)}
+    else:
+        lot_spots = {lot_id: lot.spots for lot_id, lot in load_config(args.lots)['lots'].items()}
+
+    db = MongoClient(args.mongo_uri).get_default_database()
+    if not args.dry_run:
+        ensure_indexes(db)
+
+    start = time.perf_counter()
+    stats = provision(db.slots, lot_spots, dry_run=args.dry_run)
+    elapsed = time.perf_counter() - start
+
+    n_spots = sum(len(spots) for spots in lot_spots.values())
+    changes = ', '.join(f"{n} {kind}" for kind, n in sorted(stats.items())) or 'no changes'
+    print(f"{'Would provision' if args.dry_run else 'Provisioned'} {len(lot_spots)} lot(s), {n_spots} spots: "
+          f"{changes} ({elapsed * 1000:.0f} ms)")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,28 +1,50 @@
-from flask import Flask, render_template, Response, request, redirect, url_for, session, flash, jsonify
+from flask import (Flask, render_template, stream_template, Response, request, redirect, url_for, session, flash,
+                   jsonify, abort, current_app)
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, SubmitField
 from wtforms.validators import DataRequired, Email, ValidationError
 from flask_pymongo import PyMongo
-import bcrypt
-import cv2
-import numpy as np
-from util import get_parking_spots_bboxes, empty_or_not
+from werkzeug.local import LocalProxy
+from bson import ObjectId
+from bson.errors import InvalidId
+from metrics import REGISTRY
+from indexes import ensure_indexes, DEFAULT_MONGO_URI
+from booking_history import HistoryPage, PAGE_SIZE
+from payments import PaymentBusy, PaymentError, new_receipt
+from passwords import PasswordHasher, PasswordBusy
+from transitions import to_json
+from reservations import parse_time, MAX_DAYS
+from startup import Warmup, NotReady, WARMUP
+import types
+from datetime import datetime, timedelta, timezone
 import random
-import razorpay
+import atexit
+import time
 import os
+import json
+import logging
 import dotenv
 
-# ----------------------
-# App Initialization
-# ----------------------
-app = Flask(__name__)
-app.secret_key = 'your_secret_key_here'
+# Debug output (e.g. per-spot status changes) only costs anything with LOG_LEVEL=DEBUG
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'))
+logger = logging.getLogger(__name__)
+
+mongo = PyMongo()
+
+# bcrypt runs on its own bounded process pool (see passwords.py), started on first use
+passwords = PasswordHasher()
+
+# Views are collected here and registered on every app create_app builds
+_routes = []
+
+
+def route(rule, **options):
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
 
-# Setup MongoDB URI
-app.config["MONGO_URI"] = "mongodb://localhost:27017/your_database_name"
-mongo = PyMongo(app)
 
-dotenv.load_dotenv()
 # ----------------------
 # Authentication Forms
 # ----------------------
@@ -42,116 +64,179 @@ class LoginForm(FlaskForm):
     password = PasswordField("Password", validators=[DataRequired()])
     submit = SubmitField("Login")
 
+
 # ----------------------
-# Parking Detection Config
+# Subsystems
 # ----------------------
-mask_path = r'D:\new_model_park\parking\mask_1920_1080.png'
-video_path = r'D:\new_model_park\parking\parking_1920_1080.mp4'
+# Each is started by the app's Warmup (see startup.py) rather than at import,
+# and imports what it needs when it starts: the pipelines pull in OpenCV and
+# the classifier. Requests reach them through the proxies below and get a
+# 503 while the one they need is still starting.
+def start_database():
+    mongo.cx.admin.command('ping')
+    # Indexes behind the user, slot and booking-history queries
+    ensure_indexes(mongo.db)
+    return mongo
+
+
+def start_classifier():
+    from config import DETECTOR
+    if DETECTOR == 'external':
+        return None  # classified by detector.py
+    from classifier import get_classifier
+    # Loaded now rather than on the first frame a pipeline classifies
+    return get_classifier()
+
+
+def start_lots():
+    from config import load_config, DETECTOR
+    from pipeline import LotEngine
+    from allocation import SlotAllocator
+    from slot_sync import SlotSync
+    from slot_counts import SlotCounter
+    from transitions import TransitionLog, TransitionStore
+    from reservations import ReservationBook
+
+    lots_config = load_config()
+
+    # Slot counts served to the dashboards, kept in memory from every status we write
+    slot_counter = SlotCounter(mongo.db.slots)
+
+    # Advance bookings of time windows, indexed in memory per slot
+    reservations = ReservationBook(mongo.db.bookings, mongo.db.slots,
+                                   {lot_id: len(lot.spots) for lot_id, lot in lots_config['lots'].items()})
+    reservations.start()
+
+    # Slot holds/bookings in Mongo; every claim is a single atomic update, and
+    # skips slots reserved from now on
+    allocator = SlotAllocator(mongo.db.slots, listeners=[slot_counter.record], reserved=reservations.reserved)
+
+    # One pipeline per lot decodes and classifies for every viewer; /video_feed
+    # clients only read the latest encoded frame from the lot's broadcaster.
+    slot_counter.start()
+    if DETECTOR == 'external':
+        # detector.py runs the pipelines and syncs Mongo; this process mirrors its shared memory
+        engine = LotEngine(lots_config['lots'], status_listeners=[slot_counter.record_detected])
+        engine.attach()
+        # Occupancy history as flushed by detector.py
+        transitions = TransitionStore()
+    else:
+        slot_sync = SlotSync(mongo.db.slots, listeners=[slot_counter.record])
+        transition_log = TransitionLog(lots_config['lots'])
+        engine = LotEngine(lots_config['lots'], processes=lots_config['processes'],
+                           status_listeners=[slot_sync.submit, transition_log.record])
+        slot_sync.start()
+        transition_log.start()
+        atexit.register(transition_log.close)
+        engine.start()
+        transitions = transition_log.store
+    return types.SimpleNamespace(engine=engine, slot_counter=slot_counter, allocator=allocator,
+                                 reservations=reservations, transitions=transitions)
+
+
+def start_payments():
+    from payments import PaymentService
+    return PaymentService(os.getenv('id'), os.getenv('key'))
 
-mask = cv2.imread(mask_path, 0)
-cap = cv2.VideoCapture(video_path)
-connected_components = cv2.connectedComponentsWithStats(mask, 4, cv2.CV_32S)
-spots = get_parking_spots_bboxes(connected_components)
-spot_numbers = [i for i in range(len(spots))]
-spots_status = [None for _ in spots]
-diffs = [None for _ in spots]
-previous_frame = None
-frame_nmr = 0
-step = 30
 
-global free_spots
+def subsystem(name):
+    return current_app.extensions['warmup'].get(name)
+
+
+engine = LocalProxy(lambda: subsystem('lots').engine)
+slot_counter = LocalProxy(lambda: subsystem('lots').slot_counter)
+allocator = LocalProxy(lambda: subsystem('lots').allocator)
+reservations = LocalProxy(lambda: subsystem('lots').reservations)
+transitions = LocalProxy(lambda: subsystem('lots').transitions)
+payments = LocalProxy(lambda: subsystem('payments'))
+
+
+def get_lot(lot_id):
+    try:
+        return engine.get(lot_id)
+    except KeyError:
+        abort(404, f"Unknown lot {lot_id!r}")
+
+
+def not_ready(e):
+    return jsonify({"status": "error", "message": f"Starting up, please retry: {e}"}), 503, {'Retry-After': '5'}
 
 
 # ----------------------
-# Video Frame Generator
+# App Initialization
 # ----------------------
-def calc_diff(im1, im2):
-    return np.abs(np.mean(im1) - np.mean(im2))
+def create_app(config=None):
+    """The web app, ready to serve as soon as it returns; its subsystems warm up behind it.
+
+    ``config`` overrides Flask settings such as ``MONGO_URI``. Nothing here
+    blocks on Mongo, the cameras or the model: with ``WARMUP=background``
+    (the default) every subsystem starts in a thread of its own right away,
+    and again in each worker forked from a process that had started them;
+    with ``WARMUP=lazy`` each starts with the first request that needs it,
+    Mongo (and its indexes) in the background from the first request on.
+    ``/ready`` reports how far they got, and starts the ones nothing has
+    needed yet.
+    """
+    # .env is read first, so its MONGO_URI counts
+    dotenv.load_dotenv()
+    app = Flask(__name__)
+    app.secret_key = 'your_secret_key_here'
+    app.config["MONGO_URI"] = os.getenv('MONGO_URI', DEFAULT_MONGO_URI)
+    app.config.update(config or {})
+    mongo.init_app(app)
+
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    app.register_error_handler(NotReady, not_ready)
+
+    warmup = Warmup()
+    warmup.add('mongo', start_database)
+    warmup.add('classifier', start_classifier)
+    warmup.add('lots', start_lots)
+    warmup.add('payments', start_payments)
+    app.extensions['warmup'] = warmup
+    if WARMUP == 'background':
+        app.before_request(warmup.start)
+        warmup.start()
+    else:
+        # Views use mongo directly rather than through the warm-up
+        app.before_request(lambda: warmup.warm('mongo'))
+    return app
 
-# Update the generate_frames function
-def generate_frames():
-    global previous_frame, frame_nmr, spots_status
-    while True:
-        success, frame = cap.read()
-        if not success:
-            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)  # Restart video if end is reached
-            continue
-
-        # Green frame logic inside here
-        green_frame = np.zeros_like(frame)  # Create a black frame of the same size as the original frame
-
-        if frame_nmr % step == 0:
-            if previous_frame is not None:
-                for spot_indx, spot in enumerate(spots):
-                    x1, y1, w, h = spot
-                    spot_crop = frame[y1:y1 + h, x1:x1 + w]
-                    diffs[spot_indx] = calc_diff(spot_crop, previous_frame[y1:y1 + h, x1:x1 + w])
-
-                for spot_indx in range(len(spots)):
-                    x1, y1, w, h = spots[spot_indx]
-                    spot_crop = frame[y1:y1 + h, x1:x1 + w]
-                    spot_status = empty_or_not(spot_crop)
-                    spots_status[spot_indx] = spot_status
-                    print(f"Spot {spot_indx}: {spot_status}")  # Debug print
-
-        previous_frame = frame.copy()
-
-        for spot_indx, (x1, y1, w, h) in enumerate(spots):
-            spot_status = spots_status[spot_indx]
-            color = (0, 255, 0) if spot_status else (0, 0, 255)  # Red for empty spots
-            cv2.rectangle(frame, (x1, y1), (x1 + w, y1 + h), color, 2)
-            cv2.putText(frame, str(spot_numbers[spot_indx]), (x1, y1 + 15), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-
-            # For green frame, draw only empty spots
-            if not spot_status:  # If the spot is empty
-                cv2.rectangle(green_frame, (x1, y1), (x1 + w, y1 + h), (0, 0, 255), 2)  # Red for empty
-                cv2.putText(green_frame, str(spot_numbers[spot_indx]), (x1 + 5, y1 + 15),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-
-        # Show the green frame in a separate window
-        cv2.namedWindow('Empty Parking Spots', cv2.WINDOW_NORMAL)
-        cv2.imshow('Empty Parking Spots', green_frame)
-
-        available_spots = sum(1 for status in spots_status if not status)  # Count empty spots
-        total_spots = len(spots_status)
-        cv2.rectangle(frame, (80, 20), (550, 80), (0, 0, 0), -1)
-        cv2.putText(frame, f'Available spots: {available_spots} / {total_spots}', (100, 60),
-                    cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-
-        _, buffer = cv2.imencode('.jpg', frame)
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-
-        frame_nmr += 1
 
 # ----------------------
 # Routes
 # ----------------------
-@app.route('/')
+@route('/')
 def home():
     if 'user_id' in session:
         return render_template('first.html')
     else:
         return render_template('first.html')
 
-@app.route('/display')
-def display():
+@route('/display', defaults={'lot_id': None})
+@route('/display/<lot_id>')
+def display(lot_id):
     # Find free spots and their numbers
-
-    free_spots = [{"spot_number": spot_numbers[i], "bbox": spots[i]} for i, status in enumerate(spots_status) if status]
+    lot_state = get_lot(lot_id)
+    free_spots = lot_state.table.free_spots()
     
-    return render_template('display.html', free_spots=free_spots)
+    return render_template('display.html', free_spots=free_spots, lot_id=lot_state.lot.id)
     # return {"free_spots": free_spots  , "total_spots": spots_status}
 
 
-@app.route('/register', methods=['GET', 'POST'])
+@route('/register', methods=['GET', 'POST'])
 def register():
     form = RegisterForm()
     if form.validate_on_submit():
         name = form.name.data
         email = form.email.data
         password = form.password.data
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        try:
+            hashed_password = passwords.hash(password)
+        except PasswordBusy:
+            flash("We are busy right now. Please try again in a moment.", "danger")
+            return render_template('register.html', form=form), 503
 
         mongo.db.users.insert_one({
             "name": name,
@@ -164,7 +249,7 @@ def register():
         return redirect(url_for('dashboard'))
     return render_template('register.html', form=form)
 
-@app.route('/login', methods=['GET', 'POST'])
+@route('/login', methods=['GET', 'POST'])
 def login():
     form = LoginForm()
     if form.validate_on_submit():
@@ -172,82 +257,190 @@ def login():
         password = form.password.data
         user = mongo.db.users.find_one({"email": email})
 
-        if user and bcrypt.checkpw(password.encode('utf-8'), user["password"]):
+        try:
+            valid, rehashed = passwords.verify(password, user["password"]) if user else (False, None)
+        except PasswordBusy:
+            flash("We are busy right now. Please try again in a moment.", "danger")
+            return render_template('login.html', form=form), 503
+
+        if valid:
+            if rehashed:
+                # Stored at an old cost; upgrade it unless the password changed meanwhile
+                mongo.db.users.update_one({"_id": user["_id"], "password": user["password"]},
+                                          {"$set": {"password": rehashed}})
             session['user_id'] = user["email"]
             return redirect(url_for('dashboard'))
         else:
             flash("Login failed. Check email and password.", "danger")
     return render_template('login.html', form=form)
 
-@app.route('/dashboard')
-def dashboard():
+@route('/dashboard', defaults={'lot_id': None})
+@route('/dashboard/<lot_id>')
+def dashboard(lot_id):
     if 'user_id' in session:
-        total_spots = len(spots_status)
-        available_spots = sum(1 for status in spots_status if status)
+        lot_state = get_lot(lot_id)
+        total_spots = len(lot_state.table)
+        available_spots = lot_state.table.free_count
 
-        return render_template('index.html', total_spots=total_spots, available_spots=available_spots)
+        return render_template('index.html', total_spots=total_spots, available_spots=available_spots,
+                               lot_id=lot_state.lot.id)
     return redirect(url_for('login'))
 
-@app.route('/logout')
+@route('/logout')
 def logout():
     session.pop('user_id', None)
     return redirect(url_for('login'))
 
-@app.route('/index')
+@route('/index')
 def index():
     return render_template('index.html')
 
-@app.route('/video_feed')
-def video_feed():
-    return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
-
-@app.route('/space_count', methods=['GET'])
-def space_count():
-    free_spaces_count = mongo.db.slots.count_documents({"status": "free"})
-    return jsonify({"free_spaces": free_spaces_count})
-
-@app.route('/book', methods=['GET', 'POST'])
+@route('/video_feed', defaults={'lot_id': None})
+@route('/video_feed/<lot_id>')
+def video_feed(lot_id):
+    lot_state = get_lot(lot_id)
+    # Optional per-client output settings, e.g. /video_feed?w=640&q=60&fps=5
+    width = request.args.get('w', type=int)
+    quality = request.args.get('q', type=int)
+    max_fps = request.args.get('fps', type=float)
+    stream = lot_state.broadcaster.stream(
+        width=max(width, 64) if width else None,
+        quality=min(max(quality, 10), 100) if quality else None,
+        max_fps=max_fps if max_fps and max_fps > 0 else None,
+    )
+    return Response(stream, mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@route('/ready')
+def ready():
+    # Readiness probe: 200 once every subsystem has started, with how long each took
+    warmup = current_app.extensions['warmup']
+    warmup.warm(*warmup.subsystems)
+    body = {"ready": warmup.ready, "subsystems": warmup.status()}
+    return jsonify(body), 200 if body["ready"] else 503
+
+@route('/metrics')
+def metrics():
+    # With DETECTOR=external the pipeline series are served by detector.py instead (see its --metrics-port)
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@route('/space_count', defaults={'lot_id': None}, methods=['GET'])
+@route('/space_count/<lot_id>', methods=['GET'])
+def space_count(lot_id):
+    if lot_id is not None:
+        get_lot(lot_id)
+    # Counts come from memory; a client that sends back the ETag gets a 304 while they are unchanged
+    body, etag = slot_counter.payload(lot_id)
+    response = Response(body, mimetype='application/json', headers={'Cache-Control': 'no-cache'})
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+@route('/analytics', defaults={'lot_id': None})
+@route('/analytics/<lot_id>')
+def analytics(lot_id):
+    # Occupancy over ?start=&end= (unix seconds, default the last 24h) in ?bin= second bins
+    lot_state = get_lot(lot_id)
+    end = request.args.get('end', time.time(), type=float)
+    start = request.args.get('start', end - 86400, type=float)
+    bin_seconds = max(request.args.get('bin', 3600, type=int), 60)
+    if not start < end or (end - start) / bin_seconds > 24 * 366:
+        abort(400, "Need start < end and at most 8784 bins")
+    if start >= time.time():
+        abort(400, "Need a start in the past")
+    result = transitions.analyze(lot_state.lot.id, start, end, len(lot_state.table), bin_seconds)
+    return jsonify(to_json(result))
+
+@route('/book', methods=['GET', 'POST'])
 def book():
     if request.method == 'POST':
         # Handle the booking logic
         name = request.form['name']
         phone = request.form['phone']
-        start_time = request.form['start_time']
-        hours = request.form['hours']
-        
-        # Check if there is a free parking slot
-        free_slot = mongo.db.slots.find_one({"status": "free"})
-        if free_slot:
-            # Update the slot status to booked
-            mongo.db.slots.update_one({"_id": free_slot["_id"]}, {"$set": {"status": "booked"}})
-            
-            # Create a booking record
-            mongo.db.bookings.insert_one({
-                "slot_id": free_slot["slot_id"],
-                "name": name,
-                "phone": phone,
-                "start_time": start_time,
-                "hours": hours
-            })
-            
-            return redirect(url_for('payment'))  # Redirect to the payment page
+        try:
+            start = parse_time(request.form['start_time'])
+            hours = float(request.form['hours'])
+        except ValueError:
+            return render_template('book.html', free_spaces=0, error="Enter a start time and a number of hours"), 400
+        if not 0 < hours <= MAX_DAYS * 24:
+            return render_template('book.html', free_spaces=0, error=f"Book between 0 and {MAX_DAYS * 24} hours"), 400
+        end = start + timedelta(hours=hours)
+        if end <= datetime.now(timezone.utc):
+            return render_template('book.html', free_spaces=0, error="That time has already passed"), 400
+
+        # Hold a slot that is free over the whole window until payment completes
+        lot_state = get_lot(request.form.get('lot_id'))
+        holder = session.get('user_id') or phone
+        booking = reservations.reserve(holder, lot_state.lot.id, start, end, details={
+            "email": session.get('user_id'),
+            "name": name,
+            "phone": phone,
+            "start_time": request.form['start_time'],
+            "hours": hours,
+        })
+        if booking:
+            session['hold'] = {"lot_id": booking["lot_id"], "slot_id": booking["slot_id"], "holder": holder,
+                               "booking_id": str(booking["_id"])}
+            # On to payment, as after /find_seat: the held slot and the amount form posting to /pay
+            return render_template('details.html', slot=booking["slot_id"])
         else:
             return render_template('book.html', free_spaces=0, error="No free slots available")
 
     # Handle GET request (initial page load)
     return render_template('book.html', free_spaces=0)
 
-@app.route('/get_parking')
-def get_parking():
-    # Find the free spots and their numbers
-    free_spots = [{"spot_number": spot_numbers[i], "bbox": spots[i]} for i, status in enumerate(spots_status) if status]
-
-    # Print the data to check the result
-    print(f"Free spots: {free_spots}")
-
-    return jsonify({"free_spots": free_spots})
-
-# @app.route('/display', methods=['GET'])
+@route('/availability', defaults={'lot_id': None})
+@route('/availability/<lot_id>')
+def availability(lot_id):
+    # Slots free over ?start=&end= (ISO 8601, UTC unless an offset is given), and
+    # the earliest window of the same length from ?start= on
+    lot_state = get_lot(lot_id)
+    try:
+        start = parse_time(request.args['start'])
+        end = parse_time(request.args['end'])
+    except (KeyError, ValueError):
+        abort(400, "Need start and end as ISO 8601 times")
+    if not start < end <= start + timedelta(days=MAX_DAYS):
+        abort(400, f"Need start < end, at most {MAX_DAYS} days apart")
+    free = reservations.free_slots(lot_state.lot.id, start, end)
+    earliest = reservations.earliest_free(lot_state.lot.id, start, end - start)
+    return jsonify({
+        "free_slots": free,
+        "earliest": earliest and {"start": earliest[0].isoformat(), "slot_id": earliest[1]},
+    })
+
+@route('/get_parking', defaults={'lot_id': None})
+@route('/get_parking/<lot_id>')
+def get_parking(lot_id):
+    table = get_lot(lot_id).table
+
+    # Long-poll: ?since=<version> waits for the next change and returns only the delta
+    since = request.args.get('since', type=int)
+    if since is not None:
+        table.wait(since, timeout=min(request.args.get('timeout', 25, type=float), 60))
+        return jsonify(table.delta(since))
+
+    # The payload is encoded once per status version and shared by every request
+    return Response(table.payload(), mimetype='application/json')
+
+def status_events(table, last_version):
+    # Full snapshot first (unless the client is resuming), then one event per change
+    version = last_version
+    while True:
+        data = table.delta(version)
+        if data["version"] != version:
+            version = data["version"]
+            yield f"id: {version}\ndata: {json.dumps(data)}\n\n"
+        elif table.wait(version, timeout=15) == version:
+            yield ": keep-alive\n\n"
+
+@route('/events', defaults={'lot_id': None})
+@route('/events/<lot_id>')
+def events(lot_id):
+    table = get_lot(lot_id).table
+    last_version = request.headers.get('Last-Event-ID', type=int)
+    return Response(status_events(table, last_version), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# @route('/display', methods=['GET'])
 # def display_parking_spots():
 #     # Generate data for available spots dynamically
 #     free_spots = [{"spot_number": spot_numbers[i], "bbox": spots[i]} for i, status in enumerate(spots_status) if not status]
@@ -257,77 +450,94 @@ def get_parking():
 
 # Main Execution
 
-global client
-client = razorpay.Client(auth=(os.getenv('id'), os.getenv('key')))
-@app.route('/pay' ,methods=[ "POST"])
+@route('/pay' ,methods=[ "POST"])
 def pay():
     amount = request.form['amount']
     amount=int(amount)
     amount *=100
     if amount > 100:
-        
-        data = { "amount": amount, "currency": "INR", "receipt": "order_rcptid_11" }
-        payment = client.order.create(data=data)
+        # One receipt per slot hold: a resubmitted form gets the same order back
+        hold = session.get('hold')
+        if hold is None:
+            # Nothing held: a receipt of its own, and no session entry /success would take for a hold
+            hold, receipt, resubmit = {}, new_receipt(), False
+        else:
+            resubmit = 'receipt' in hold
+            if not resubmit:
+                hold['receipt'] = new_receipt()
+                session['hold'] = hold
+            receipt = hold['receipt']
+        try:
+            payment = payments.create_order(receipt, amount, resubmit=resubmit,
+                                            notes={"lot_id": str(hold.get("lot_id")), "slot_id": str(hold.get("slot_id"))})
+        except PaymentBusy:
+            return "Payments are busy right now. Please try again in a moment.", 503
+        except PaymentError:
+            logger.exception("Creating the payment order failed")
+            return "Something Went Wrong Please Try Again", 502
         pdata=[amount, payment["id"]]
-        mongo.db.users.update_one(
-            {'user_id': session['user_id']},
-        {'$set': session['book_details']}
-    )
+        if 'book_details' in session:
+            mongo.db.users.update_one(
+                {'user_id': session['user_id']},
+            {'$set': session['book_details']}
+        )
         return render_template("payment.html", pdata=pdata)
     return redirect("/success")
 
-@app.route('/success', methods=["POST"])
+@route('/success', methods=["POST"])
 def success():
     if request.method == "POST":
 
         pid=request.form.get("razorpay_payment_id")
         ordid=request.form.get("razorpay_order_id")
         sign=request.form.get("razorpay_signature")
-        print(f"The payment id : {pid}, order id : {ordid} and signature : {sign}")
-        params={
-        'razorpay_order_id': ordid,
-        'razorpay_payment_id': pid,
-        'razorpay_signature': sign
-        }
-        final=client.utility.verify_payment_signature(params)
-        if final == True:
+        logger.debug("The payment id : %s, order id : %s and signature : %s", pid, ordid, sign)
+        valid, _ = payments.verify(ordid, pid, sign)
+        if valid:
+            hold = session.pop('hold', None) or {}
+            if "booking_id" in hold:
+                try:
+                    confirmed = reservations.confirm(ObjectId(hold["booking_id"]), hold["holder"])
+                except InvalidId:
+                    confirmed = False
+            elif "lot_id" in hold:
+                confirmed = allocator.confirm(hold["lot_id"], hold["slot_id"], hold["holder"])
+                if confirmed:
+                    # Booked until the driver checks out (see /checkout)
+                    session['parked'] = {key: hold[key] for key in ("lot_id", "slot_id", "holder")}
+            else:
+                confirmed = True  # nothing was held for this payment
+            if not confirmed:
+                return "Your slot hold expired before payment completed. Please contact support."
             return redirect("/display", code=301)
         return "Something Went Wrong Please Try Again"
     return 'get in success'
 
-razorpay_client = razorpay.Client(auth=(os.getenv('id'), os.getenv('key')))
-
-@app.route('/payment', methods=['POST'])
+@route('/checkout', methods=['POST'])
+def checkout():
+    # The driver leaves: the slot they booked through /find_seat is free again
+    parked = session.get('parked')
+    if not parked:
+        return jsonify({'status': 'error', 'message': 'No booked slot to check out of'}), 400
+    released = allocator.release(parked["lot_id"], parked["slot_id"], parked["holder"])
+    session.pop('parked')
+    if not released:
+        return jsonify({'status': 'error', 'message': 'The slot was no longer booked'}), 409
+    return jsonify({'status': 'success', 'message': 'Checked out', 'spot_number': parked["slot_id"]})
+
+@route('/payment', methods=['POST'])
 def payment2():
     return render_template('payment2.html')
 
-@app.route('/book_history')
+@route('/book_history')
 def book_history():
     if 'user_id' not in session:
         return redirect(url_for('login'))  # Ensure the user is logged in
 
-    # Fetch booking history from MongoDB for the logged-in user
-    bookings_cursor = mongo.db.bookings.find({"email": session['user_id']})
-
-    # Print bookings for debugging
-    bookings = list(bookings_cursor)  # Convert the cursor to a list
-
-    print(f"Bookings found: {bookings}")
-
-    # Convert the bookings data to a list to pass to the template
-    booking_list = []
-    for booking in bookings:
-        booking_data = {
-            "name": booking["name"],
-            "phone": booking["phone"],
-            "start_time": booking["start_time"],
-            "hours": booking["hours"],
-            "status": booking["status"],
-            "slot_id": booking["slot_id"]
-        }
-        booking_list.append(booking_data)
-
-    return render_template('book_history.html', bookings=booking_list)
+    # One page of the user's bookings, rendered while it is read from Mongo
+    page = HistoryPage(mongo.db.bookings, session['user_id'], cursor=request.args.get('cursor'),
+                       limit=min(max(request.args.get('limit', PAGE_SIZE, type=int), 1), 200))
+    return stream_template('book_history.html', bookings=page)
 
 # def payment(spot_number, user_id, cost):
 
@@ -351,34 +561,54 @@ def book_history():
 #     else:
 #         return jsonify({'status':False, 'message': 'Seat is no longer available'})
 
-@app.route('/find_seat', methods=['POST'])
+@route('/nearest_free', defaults={'lot_id': None})
+@route('/nearest_free/<lot_id>')
+def nearest_free(lot_id):
+    # The ?k= free spots closest to ?x=&y= (frame pixels), or to the lot entrance
+    lot_state = get_lot(lot_id)
+    x, y = request.args.get('x', type=float), request.args.get('y', type=float)
+    point = (x, y) if x is not None and y is not None else lot_state.lot.entrance
+    if point is None:
+        abort(400, "Need x and y; the lot has no entrance configured")
+    table = lot_state.table
+    nearest = table.nearest_free(*point, k=min(max(request.args.get('k', 1, type=int), 1), 100))
+    return jsonify({
+        "full": not nearest,
+        "free_spots": [{"spot_number": spot_id, "bbox": table.bboxes[spot_id].tolist(), "distance": round(distance, 1)}
+                       for distance, spot_id in nearest],
+    })
+
+@route('/find_seat', methods=['POST'])
 def find_seat():
     # return request.form
-    free_spots = [{"spot_number": spot_numbers[i], "bbox": spots[i]} for i, status in enumerate(spots_status) if status]
+    lot_state = get_lot(request.form.get('lot_id'))
+    table = lot_state.table
 
-    if not free_spots:
+    if not table.free_count:
         return jsonify({'status': 'error', 'message': 'No free spots available'})
 
-    # Simulate finding an empty seat
-    spot = random.choice(free_spots)
-    spot_number = spot['spot_number']
-
-    # Update the spot status to 'selected'
-    try:
-            
-        for s in free_spots:
-            if s['spot_number'] == spot_number:
-                s['status'] = 'selected'
-                break
-    except Exception as e:
-        return jsonify({'status': 'error', 'message fing free slot': str(e)})
-    
-    
+    # Hold one of the spots the camera sees as free: the nearest to the driver's
+    # position (x, y in frame pixels) or the lot entrance, if either is known
+    x, y = request.form.get('x', type=float), request.form.get('y', type=float)
+    point = (x, y) if x is not None and y is not None else lot_state.lot.entrance
+    if point:
+        candidates = [spot_id for _, spot_id in table.nearest_free(*point, k=32)]
+        slot = allocator.claim_first(session['user_id'], lot_state.lot.id, candidates)
+    else:
+        # A sample keeps the query small while still spreading concurrent users over different spots
+        free_ids = table.free_ids()
+        candidates = random.sample(free_ids, min(len(free_ids), 32))
+        slot = allocator.claim(session['user_id'], lot_id=lot_state.lot.id, slot_ids=candidates)
+    if not slot:
+        return jsonify({'status': 'error', 'message': 'No free spots available'})
+    spot_number = slot['slot_id']
+    session['hold'] = {"lot_id": slot["lot_id"], "slot_id": spot_number, "holder": session['user_id']}
 
     session['book_details']={
         'status': 'success',
         'message': 'Seat found',
         'spot_number': spot_number,
+        'lot_id': lot_state.lot.id,
         'user_id': session['user_id'],
         'license_plate':request.form['license_plate'],
         'phone':request.form['phone'],
@@ -386,9 +616,12 @@ def find_seat():
 
     }
     # return redirect(url_for('pay', amount=10))
-    return render_template('details.html', slot =  s['spot_number']  )
+    return render_template('details.html', slot =  spot_number  )
     
 
 
+# gunicorn main:app
+app = create_app()
+
 if __name__ == '__main__':
     app.run(debug=True, threaded=True)
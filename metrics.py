@@ -0,0 +1,192 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Stage latencies of a frame are in the 0.1ms - 1s range
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _label_str(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        with self._lock:
+            return {key: self._copy(value) for key, value in self._values.items()}
+
+    def merge(self, values):
+        # Samples reported by a worker process replace our copy of them, so a
+        # label set is only ever recorded in one of the two processes
+        with self._lock:
+            self._values.update(values)
+
+    def _copy(self, value):
+        return value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self.snapshot().items()):
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_label_str(self.labelnames, key)} {value}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per-bucket counts (last one is +Inf), sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _copy(self, value):
+        return [list(value[0]), value[1]]
+
+    def _render_sample(self, key, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f"{self.name}_bucket{_label_str(self.labelnames, key, [('le', le)])} {cumulative}")
+        lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {total}")
+        lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def merge(self, snapshot):
+        for name, values in snapshot.items():
+            if name in self.metrics:
+                self.metrics[name].merge(values)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def start_http_server(port, host='', registry=REGISTRY):
+    """Serve ``registry`` at ``/metrics`` on ``port`` from a daemon thread, for processes without a web app."""
+    # Imported here: the web app, which serves /metrics itself, never needs it
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # scraped every few seconds; not worth a log line
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
+
+# ----------------------
+# Vision Pipeline Metrics
+# ----------------------
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'pipeline_stage_seconds', 'Time spent in each stage of the frame loop.', ['lot', 'stage']))
+FRAMES = REGISTRY.register(Counter(
+    'pipeline_frames_total', 'Frames decoded by the pipeline.', ['lot']))
+DROPPED_FRAMES = REGISTRY.register(Counter(
+    'pipeline_dropped_frames_total', 'Encoded frames dropped before reaching a client.', ['lot', 'where']))
+CLASSIFIED_SPOTS = REGISTRY.register(Counter(
+    'pipeline_classified_spots_total', 'Spots run through the classifier.', ['lot']))
+RAW_FLIPS = REGISTRY.register(Counter(
+    'pipeline_raw_flips_total', 'Classifier decisions that flipped a spot before smoothing.', ['lot']))
+STATUS_CHANGES = REGISTRY.register(Counter(
+    'pipeline_status_changes_total', 'Spot status transitions, after smoothing.', ['lot']))
+STREAM_CLIENTS = REGISTRY.register(Gauge(
+    'stream_clients', 'Connected /video_feed clients.', ['lot']))
+
+# ----------------------
+# Transition Log Metrics
+# ----------------------
+TRANSITIONS_DROPPED = REGISTRY.register(Counter(
+    'transition_log_dropped_total', 'Spot transitions dropped because the log could not flush them in time.', ['lot']))
@@ -0,0 +1,96 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+
+from bounded import PendingLimit
+
+logger = logging.getLogger(__name__)
+
+# ----------------------
+# Password Hashing Config
+# ----------------------
+# Raising BCRYPT_ROUNDS takes effect for existing users at their next login.
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+PASSWORD_WORKERS = int(os.getenv('PASSWORD_WORKERS', str(max((os.cpu_count() or 2) // 2, 1))))
+PASSWORD_MAX_PENDING = int(os.getenv('PASSWORD_MAX_PENDING', '32'))  # hashes in the pool or waiting for it
+PASSWORD_TIMEOUT = float(os.getenv('PASSWORD_TIMEOUT', '10'))  # seconds a request waits for its hash
+
+
+class PasswordBusy(Exception):
+    """No bcrypt worker can take this password soon enough; registration and login answer 503."""
+
+
+def hash_rounds(hashed):
+    # "$2b$12$<salt><hash>"
+    return int(hashed[4:6])
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _check(password, hashed, rounds):
+    # Rehashing here, while the password is at hand, saves a second trip to the pool
+    if not bcrypt.checkpw(password, hashed):
+        return False, None
+    return True, _hash(password, rounds) if hash_rounds(hashed) != rounds else None
+
+
+class PasswordHasher:
+    """bcrypt on a small process pool, so password work cannot take the web threads.
+
+    At most ``workers`` hashes run at once, in processes of their own; a
+    request thread waits for its result (up to ``timeout``) without holding
+    the GIL or a CPU. A burst of logins beyond ``max_pending`` hashes gets
+    ``PasswordBusy`` rather than a place in a queue it would time out in.
+    The pool is started on first use, and replaced if a worker dies.
+    """
+
+    def __init__(self, rounds=BCRYPT_ROUNDS, workers=PASSWORD_WORKERS, max_pending=PASSWORD_MAX_PENDING,
+                 timeout=PASSWORD_TIMEOUT):
+        self.rounds = rounds
+        self.workers = workers
+        self.timeout = timeout
+        self._pool = None
+        self._lock = threading.Lock()
+        self._pending = PendingLimit(max_pending, PasswordBusy, 'password hashes')
+
+    def _executor(self):
+        if self._pool is None:
+            # Forking a process that runs camera and sync threads is unsafe
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def _run(self, fn, *args):
+        with self._lock:
+            pool = self._executor()
+        try:
+            return self._pending.submit(pool, fn, *args).result(timeout=self.timeout)
+        except FutureTimeout:
+            raise PasswordBusy(f"password hash took longer than {self.timeout}s")
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed); later requests get a new pool
+            with self._lock:
+                if self._pool is pool:
+                    logger.warning("Password worker pool broke; restarting it")
+                    self._pool = None
+            raise PasswordBusy("password worker pool broke")
+
+    def hash(self, password):
+        """bcrypt hash of ``password`` (str) at the configured cost."""
+        return self._run(_hash, password.encode('utf-8'), self.rounds)
+
+    def verify(self, password, hashed):
+        """``(valid, new_hash)``; ``new_hash`` is set when ``hashed`` is not at the configured cost."""
+        return self._run(_check, password.encode('utf-8'), hashed, self.rounds)
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
@@ -0,0 +1,169 @@
+import collections
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import razorpay
+import requests
+from requests.adapters import HTTPAdapter
+
+from bounded import PendingLimit
+
+logger = logging.getLogger(__name__)
+
+# ----------------------
+# Payment Gateway Config
+# ----------------------
+# RAZORPAY_BASE_URL points the client at another gateway, e.g. the stub in
+# benchmarks/stub_gateway.py for offline load tests.
+RAZORPAY_BASE_URL = os.getenv('RAZORPAY_BASE_URL')
+GATEWAY_TIMEOUT = float(os.getenv('PAYMENT_GATEWAY_TIMEOUT', '5'))  # seconds per gateway request
+GATEWAY_WORKERS = int(os.getenv('PAYMENT_GATEWAY_WORKERS', '32'))  # gateway requests in flight
+GATEWAY_MAX_PENDING = int(os.getenv('PAYMENT_GATEWAY_MAX_PENDING', '128'))  # gateway calls unfinished at once
+
+
+class PaymentBusy(Exception):
+    """The gateway is backed up: this order was not sent, and /pay answers 503 so the user can try again."""
+
+
+class PaymentError(Exception):
+    """The gateway failed or did not answer in time."""
+
+
+class _TimeoutSession(requests.Session):
+    # razorpay.Client does not set a timeout; give every request one
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, *args, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(*args, **kwargs)
+
+
+def new_receipt():
+    """A receipt id for one booking; razorpay allows up to 40 characters."""
+    return f"bk_{uuid.uuid4().hex}"
+
+
+class PaymentService:
+    """Razorpay orders behind one pooled HTTP session and a bounded worker pool.
+
+    Gateway calls run on ``workers`` threads that share keep-alive
+    connections, and a request thread waits at most ``timeout`` for its
+    call. While the gateway is slow, calls pile up only to ``max_pending``;
+    past that ``PaymentBusy`` is raised without contacting it, so a slow
+    gateway cannot take every web thread with it.
+
+    Orders are created idempotently per receipt: a receipt that already has
+    an order (in the local cache, or at the gateway after a timed-out
+    attempt or on a resubmit) gets that order back instead of a new one. Orders are cached by
+    id with their state, so ``verify`` needs no gateway or database call.
+    """
+
+    def __init__(self, key_id, key_secret, base_url=RAZORPAY_BASE_URL, timeout=GATEWAY_TIMEOUT,
+                 workers=GATEWAY_WORKERS, max_pending=GATEWAY_MAX_PENDING, cache_size=10000):
+        session = _TimeoutSession(timeout)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        options = {'base_url': base_url} if base_url else {}
+        self.client = razorpay.Client(session=session, auth=(key_id, key_secret), **options)
+
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='payment')
+        self._lock = threading.RLock()
+        self._pending = PendingLimit(max_pending, PaymentBusy, 'payment gateway requests')
+        self._in_flight = {}  # receipt -> future of its order
+        self._orders = collections.OrderedDict()  # order id -> order, least recently used first
+        self._receipts = {}  # receipt -> order id
+        self._failed = collections.OrderedDict()  # receipts whose last attempt failed
+        self.cache_size = cache_size
+
+    def _submit(self, fn, *args):
+        return self._pending.submit(self._pool, fn, *args)
+
+    def _remember(self, order):
+        with self._lock:
+            self._orders[order['id']] = order
+            self._orders.move_to_end(order['id'])
+            self._receipts[order['receipt']] = order['id']
+            self._failed.pop(order['receipt'], None)
+            while len(self._orders) > self.cache_size:
+                _, old = self._orders.popitem(last=False)
+                self._receipts.pop(old['receipt'], None)
+
+    def _fail(self, receipt):
+        with self._lock:
+            self._failed[receipt] = True
+            while len(self._failed) > self.cache_size:
+                self._failed.popitem(last=False)
+
+    def _create(self, receipt, amount, currency, notes, lookup):
+        if lookup:
+            # A previous attempt may have reached the gateway before failing here
+            for order in self.client.order.all({'receipt': receipt}).get('items', []):
+                if order['amount'] == amount and order['currency'] == currency:
+                    return order
+        return self.client.order.create(data={'amount': amount, 'currency': currency, 'receipt': receipt,
+                                              'notes': notes or {}})
+
+    def create_order(self, receipt, amount, currency='INR', notes=None, resubmit=False):
+        """The order for ``receipt`` (amount in paise), creating it at the gateway only once.
+
+        Pass ``resubmit`` when the receipt may have been used before, e.g. by
+        another web worker; the gateway is then asked for an existing order
+        first, as it is after a failed attempt in this process.
+        """
+        with self._lock:
+            order_id = self._receipts.get(receipt)
+            order = self._orders.get(order_id)
+            if order is not None and order['amount'] == amount:
+                return order
+            # Concurrent requests for one receipt share a single gateway call
+            future = self._in_flight.get(receipt)
+            if future is None:
+                lookup = resubmit or receipt in self._failed
+                future = self._in_flight[receipt] = self._submit(self._create, receipt, amount, currency, notes,
+                                                                 lookup)
+        try:
+            order = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            self._fail(receipt)
+            raise PaymentError(f"payment gateway did not answer within {self.timeout}s")
+        except (requests.RequestException, razorpay.errors.BadRequestError,
+                razorpay.errors.GatewayError, razorpay.errors.ServerError) as e:
+            self._fail(receipt)
+            raise PaymentError(str(e)) from e
+        finally:
+            with self._lock:
+                if self._in_flight.get(receipt) is future and future.done():
+                    del self._in_flight[receipt]
+        self._remember(order)
+        return order
+
+    def verify(self, order_id, payment_id, signature):
+        """Check a checkout callback's signature locally; returns ``(valid, order)``.
+
+        ``order`` is the cached order, marked paid, or None if another process created it.
+        """
+        try:
+            self.client.utility.verify_payment_signature({
+                'razorpay_order_id': order_id,
+                'razorpay_payment_id': payment_id,
+                'razorpay_signature': signature,
+            })
+        except razorpay.errors.SignatureVerificationError:
+            return False, None
+        with self._lock:
+            order = self._orders.get(order_id)
+            if order is not None:
+                order['status'] = 'paid'
+                order['payment_id'] = payment_id
+        return True, order
+
+    def order(self, order_id):
+        with self._lock:
+            return self._orders.get(order_id)
@@ -0,0 +1,397 @@
+import collections
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+from util import spot_confidence, SpotFeatures, SpotDiffer
+from geometry import SAMPLE_SCALE
+from smoothing import SpotSmoother
+from spot_table import SpotTable, FREE
+from render import Renderer
+from capture import CaptureReader
+from shared_state import SharedStateMirror
+from metrics import (REGISTRY, STAGE_SECONDS, FRAMES, DROPPED_FRAMES, CLASSIFIED_SPOTS, RAW_FLIPS,
+                     STATUS_CHANGES, STREAM_CLIENTS)
+
+logger = logging.getLogger(__name__)
+
+
+# ----------------------
+# Frame Fan-out
+# ----------------------
+def encode_jpeg(frame, quality, lot_id, stage='encode'):
+    # FrameBroadcaster times its encodes as "stream_encode": merged worker samples
+    # replace this process's copy of the same labels (see metrics._Metric.merge)
+    with STAGE_SECONDS.time(lot=lot_id, stage=stage):
+        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes()
+
+
+class FrameBroadcaster:
+    """Latest annotated frame, shared by every MJPEG client.
+
+    The frame is published either raw (pipeline in this process) or already
+    encoded (pipeline in a worker process). Encodes are made on demand, once
+    per frame and per (width, quality) setting, and shared by every client
+    asking for the same setting, so nothing is encoded while nobody watches.
+    Clients always pick up the newest frame when they are ready for one, so a
+    slow client skips frames instead of holding up the pipeline.
+
+    ``demand()`` is the frame rate the clients want (0 while nobody watches),
+    which tells the capture reader how many frames to decode. With a
+    pipeline in a worker process it is mirrored into the shared ``viewers``
+    value.
+    """
+
+    def __init__(self, lot_id, quality=80, viewers=None):
+        self.lot_id = lot_id
+        self.quality = quality
+        self.viewers = viewers
+        self._client_fps = collections.Counter()
+        self._cond = threading.Condition()
+        self._encode_lock = threading.Lock()
+        self._frame = None
+        self._jpeg = None
+        self._encoded = {}
+        self._seq = 0
+        self.clients = 0
+
+    def publish(self, frame=None, jpeg=None):
+        with self._cond:
+            self._frame = frame
+            self._jpeg = jpeg
+            self._encoded = {}
+            self._seq += 1
+            self._cond.notify_all()
+
+    def wait(self, last_seq, width=None, quality=None, timeout=5.0):
+        """Wait for a frame newer than ``last_seq``; returns ``(seq, jpeg)``."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq != last_seq, timeout)
+            seq, frame, jpeg, encoded = self._seq, self._frame, self._jpeg, self._encoded
+        if seq == last_seq or (frame is None and jpeg is None):
+            return seq, None
+
+        key = (width, quality or self.quality)
+        with self._encode_lock:
+            if key not in encoded:
+                encoded[key] = self._encode(frame, jpeg, encoded, *key)
+            return seq, encoded[key]
+
+    def _encode(self, frame, jpeg, encoded, width, quality):
+        if frame is None:
+            if width is None and quality == self.quality:
+                return jpeg
+            if 'decoded' not in encoded:
+                encoded['decoded'] = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+            frame = encoded['decoded']
+
+        h, w = frame.shape[:2]
+        if width and width < w:
+            frame = cv2.resize(frame, (width, max(round(h * width / w), 1)), interpolation=cv2.INTER_AREA)
+        return encode_jpeg(frame, quality, self.lot_id, stage='stream_encode')
+
+    def demand(self):
+        with self._cond:
+            return max(self._client_fps, default=0)
+
+    def _set_client(self, fps, delta):
+        with self._cond:
+            self.clients += delta
+            self._client_fps[fps] += delta
+            if not self._client_fps[fps]:
+                del self._client_fps[fps]
+            if self.viewers is not None:
+                self.viewers.value = max(self._client_fps, default=0)
+
+    @contextmanager
+    def client(self, max_fps=None):
+        """Count a client wanting up to ``max_fps`` frames/s (every frame if None) while in the block."""
+        client_fps = max_fps or float('inf')
+        self._set_client(client_fps, 1)
+        STREAM_CLIENTS.inc(lot=self.lot_id)
+        try:
+            yield
+        finally:
+            self._set_client(client_fps, -1)
+            STREAM_CLIENTS.dec(lot=self.lot_id)
+
+    def stream(self, width=None, quality=None, max_fps=None):
+        min_interval = 1.0 / max_fps if max_fps else 0
+        with self.client(max_fps):
+            seq = 0
+            next_frame_at = 0
+            while True:
+                delay = next_frame_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                new_seq, jpeg = self.wait(seq, width, quality)
+                if new_seq == seq or jpeg is None:
+                    continue
+                if seq and new_seq > seq + 1:
+                    DROPPED_FRAMES.inc(new_seq - seq - 1, lot=self.lot_id, where='client')
+                seq = new_seq
+                next_frame_at = time.monotonic() + min_interval
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+
+
+# ----------------------
+# Capture / Inference Worker
+# ----------------------
+class LotState:
+    """What the web process knows about a lot: its latest status and frames."""
+
+    def __init__(self, lot, status_listeners=()):
+        self.lot = lot
+        self.table = SpotTable(lot.spots)
+        self.broadcaster = FrameBroadcaster(lot.id, lot.stream_quality)
+        self.status_listeners = status_listeners
+
+    def publish_status(self, spot_ids, free):
+        changed = self.table.update(spot_ids, free)
+        if len(changed):
+            changed_free = self.table.status[changed] == FREE
+            for listener in self.status_listeners:
+                listener(self.lot.id, changed, changed_free)
+
+    def replace_status(self, version, status, changed_at=None):
+        # Status mirrored from a detector in another process (see shared_state.py)
+        changed = self.table.replace(status, version, changed_at)
+        if len(changed):
+            changed_free = self.table.status[changed] == FREE
+            for listener in self.status_listeners:
+                listener(self.lot.id, changed, changed_free)
+
+    def publish_frame(self, frame):
+        self.broadcaster.publish(frame=frame)
+
+    def stream_fps(self):
+        return self.broadcaster.demand()
+
+
+class CameraPipeline(threading.Thread):
+    """Background worker that decodes, classifies and annotates one lot's frames.
+
+    Each annotated frame is handed to ``output`` (a ``LotState`` or a queue
+    forwarder in worker processes), together with the ids of the spots whose
+    status changed on each classification tick. Frames come from a
+    ``CaptureReader``, which only decodes the frames that are classified or
+    streamed (see ``output.stream_fps``).
+    ``process`` runs one frame through every stage, so the loop can also be
+    driven without a capture source (see benchmarks/bench_pipeline.py).
+    """
+
+    stage_seconds = STAGE_SECONDS
+
+    def __init__(self, lot, output):
+        super().__init__(daemon=True, name=f"pipeline-{lot.id}")
+        self.lot = lot
+        self.output = output
+        self.video_path = lot.video_path
+        self.spot_numbers = lot.spot_numbers
+        self.table = SpotTable(lot.spots)  # bboxes stay in mask pixels whatever the camera delivers
+        self.step = lot.step
+        self.diff_threshold = lot.diff_threshold  # mean grayscale change (0-255) that triggers re-classification
+        self.full_refresh_every = lot.full_refresh_every  # classification ticks between forced full refreshes
+
+        self.frame_nmr = 0
+        self.ticks = 0  # classification ticks
+        self.diffs = np.zeros(len(lot.spots))
+        self._features = SpotFeatures(len(lot.spots))
+        self._fit(lot.frame_shape)
+        self.smoother = SpotSmoother(len(self.spots), alpha=lot.ema_alpha, enter_free=lot.enter_free,
+                                     exit_free=lot.exit_free, min_dwell=lot.min_dwell)
+
+    def _fit(self, frame_shape):
+        """Scale the spots, and what is derived from them, to frames of ``frame_shape``."""
+        geometry = self.lot.geometry.scaled(frame_shape)
+        self.frame_shape = geometry.shape
+        self.spots = geometry.spots()
+        self.renderer = Renderer(self.spots, self.frame_shape, show_window=self.lot.show_window)
+        self._differ = SpotDiffer(self.spots, self.frame_shape, scale=SAMPLE_SCALE,
+                                  samples=geometry.samples(SAMPLE_SCALE))
+        self._spot_means = None  # per-spot mean intensity when each spot was last classified
+
+    def changed_spots(self, means, tick):
+        if self._spot_means is None or tick % self.full_refresh_every == 0:
+            return np.arange(len(self.spots))
+        self.diffs[:] = np.abs(means - self._spot_means)
+        # Spots with a transition in progress are followed until it settles
+        return np.union1d(np.flatnonzero(self.diffs > self.diff_threshold), self.smoother.unsettled())
+
+    def classify(self, frame):
+        lot_id = self.lot.id
+        with self.stage_seconds.time(lot=lot_id, stage='diff'):
+            means = self._differ.means(frame)
+            changed = self.changed_spots(means, self.ticks)
+        self.ticks += 1
+        if not len(changed):
+            return
+
+        with self.stage_seconds.time(lot=lot_id, stage='classify'):
+            confidence = spot_confidence(frame, [self.spots[i] for i in changed], self._features)
+        CLASSIFIED_SPOTS.inc(len(changed), lot=lot_id)
+
+        raw_flips = self.smoother.raw_flips
+        transitions, transitions_free = self.smoother.update(changed, confidence, time.monotonic())
+        RAW_FLIPS.inc(self.smoother.raw_flips - raw_flips, lot=lot_id)
+
+        updated = self.table.update(transitions, transitions_free)
+        if len(updated):
+            updated_free = self.table.status[updated] == FREE
+            STATUS_CHANGES.inc(len(updated), lot=lot_id)
+            if logger.isEnabledFor(logging.DEBUG):
+                for spot_indx, spot_status in zip(updated.tolist(), updated_free.tolist()):
+                    logger.debug("Lot %s spot %d: %s", lot_id, spot_indx, spot_status)
+            self.output.publish_status(updated, updated_free)
+
+        if self._spot_means is None:
+            self._spot_means = means
+        else:
+            self._spot_means[changed] = means[changed]
+
+    def annotate(self, frame):
+        self.renderer.draw(frame, self.table.status == FREE, self.table.free_count)
+
+    def process(self, frame, classify=None):
+        """Classify (every ``step``-th frame unless told), annotate and publish ``frame``."""
+        lot_id = self.lot.id
+        FRAMES.inc(lot=lot_id)
+
+        if frame.shape[:2] != self.frame_shape:
+            logger.info("Lot %s: frames are %dx%d, rescaling spots from the %dx%d mask", lot_id,
+                        frame.shape[1], frame.shape[0], self.lot.frame_shape[1], self.lot.frame_shape[0])
+            self._fit(frame.shape)
+
+        if classify is None:
+            classify = self.frame_nmr % self.step == 0
+        if classify:
+            self.classify(frame)
+
+        with self.stage_seconds.time(lot=lot_id, stage='draw'):
+            self.annotate(frame)
+        self.output.publish_frame(frame)
+        self.frame_nmr += 1
+
+    def run(self):
+        reader = CaptureReader(self.video_path, self.step, self.output.stream_fps, lot_id=self.lot.id)
+        reader.stage_seconds = self.stage_seconds
+        reader.start()
+        while True:
+            frame, classify = reader.frames.get()
+            self.process(frame, classify)
+
+
+# ----------------------
+# Multi-lot Engine
+# ----------------------
+class _QueueOutput:
+    """Forwards a worker-process pipeline's output to the web process."""
+
+    def __init__(self, lot, out_queue, viewers):
+        self.lot_id = lot.id
+        self.quality = lot.stream_quality
+        self.queue = out_queue
+        self.viewers = viewers
+
+    def publish_status(self, spot_ids, free):
+        self.queue.put(('status', self.lot_id, (spot_ids, free)))
+
+    def publish_frame(self, frame):
+        if not self.viewers.value:
+            return  # nobody is watching; the status still goes out
+        # Frames are replaceable; drop this one rather than stall the pipeline
+        if self.queue.full():
+            DROPPED_FRAMES.inc(lot=self.lot_id, where='queue')
+            return
+        try:
+            self.queue.put_nowait(('frame', self.lot_id, encode_jpeg(frame, self.quality, self.lot_id)))
+        except queue.Full:
+            DROPPED_FRAMES.inc(lot=self.lot_id, where='queue')
+
+    def stream_fps(self):
+        return self.viewers.value
+
+
+def _run_worker(lots, out_queue, viewers, metrics_interval=5.0):
+    pipelines = [CameraPipeline(lot, _QueueOutput(lot, out_queue, viewers[lot.id])) for lot in lots]
+    for p in pipelines:
+        p.start()
+    # Metrics live in this process; ship them to the web process for /metrics
+    while any(p.is_alive() for p in pipelines):
+        time.sleep(metrics_interval)
+        out_queue.put(('metrics', None, REGISTRY.snapshot()))
+
+
+class LotEngine:
+    """Runs one CameraPipeline per lot.
+
+    With ``processes=0`` every pipeline is a thread of the current process.
+    Otherwise the lots are spread over that many worker processes, which send
+    status and encoded frames back over a queue so decode and inference for
+    many feeds use several cores.
+
+    ``status_listeners`` are called as ``listener(lot_id, spot_ids, free)``
+    in the web process with the spots that changed on each tick.
+
+    ``attach`` is the alternative to ``start`` for web workers of a detector
+    process: the states then mirror its shared memory.
+    """
+
+    def __init__(self, lots, processes=0, status_listeners=()):
+        self.lots = lots
+        self.processes = min(processes, len(lots))
+        self.states = {lot_id: LotState(lot, status_listeners) for lot_id, lot in lots.items()}
+        self.default_lot_id = next(iter(lots))
+        self._started = False
+
+    def get(self, lot_id=None):
+        return self.states[lot_id or self.default_lot_id]
+
+    def start(self):
+        # Worker processes re-import the app module under "spawn"; only the
+        # parent runs the engine.
+        if self._started or multiprocessing.parent_process() is not None:
+            return
+        self._started = True
+
+        if self.processes == 0:
+            for lot_id, lot in self.lots.items():
+                CameraPipeline(lot, self.states[lot_id]).start()
+            return
+
+        ctx = multiprocessing.get_context('spawn')
+        self._queue = ctx.Queue(maxsize=4 * len(self.lots))
+        # Stream demand of each lot, read by the worker's capture reader
+        viewers = {lot_id: ctx.Value('d', 0.0, lock=False) for lot_id in self.lots}
+        for lot_id, state in self.states.items():
+            state.broadcaster.viewers = viewers[lot_id]
+        lots = list(self.lots.values())
+        for i in range(self.processes):
+            ctx.Process(target=_run_worker, args=(lots[i::self.processes], self._queue, viewers),
+                        name=f"pipeline-worker-{i}", daemon=True).start()
+        threading.Thread(target=self._receive, name="pipeline-receiver", daemon=True).start()
+
+    def attach(self):
+        """Serve the lots of a detector running in another process (see detector.py) instead of starting them."""
+        if self._started:
+            return
+        self._started = True
+        SharedStateMirror(self.states).start()
+
+    def _receive(self):
+        while True:
+            kind, lot_id, payload = self._queue.get()
+            if kind == 'metrics':
+                REGISTRY.merge(payload)
+            elif kind == 'status':
+                self.states[lot_id].publish_status(*payload)
+            else:
+                self.states[lot_id].broadcaster.publish(jpeg=payload)
@@ -0,0 +1,92 @@
+import cv2
+import numpy as np
+
+FREE_COLOR = (0, 255, 0)
+TAKEN_COLOR = (0, 0, 255)
+LABEL_COLOR = (255, 255, 255)
+HEADER_BOX = ((80, 20), (550, 80))
+
+
+class Renderer:
+    """Draws spot boxes, labels and the availability header onto frames.
+
+    The annotations live in a persistent overlay layer. Only spots whose
+    status changed since the last frame are redrawn into it, and compositing
+    copies just the overlay's pixels (box outlines, labels, header) into the
+    frame instead of drawing every spot again.
+    """
+
+    def __init__(self, spots, frame_shape, show_window=False):
+        self.spots = [tuple(int(v) for v in spot) for spot in spots]
+        self.show_window = show_window
+        h, w = frame_shape[:2]
+
+        self.overlay = np.zeros((h, w, 3), dtype=np.uint8)
+        self._coverage = np.zeros((h, w), dtype=np.uint8)
+        for spot_indx in range(len(self.spots)):
+            self._draw_spot(self._coverage, spot_indx, 255, 255)
+        cv2.rectangle(self._coverage, *HEADER_BOX, 255, -1)
+
+        # Spots whose drawings can overlap; their labels are redrawn with a changed neighbour
+        boxes = np.asarray(self.spots, dtype=np.int64).reshape(-1, 4)
+        x1, y1 = boxes[:, 0] - 3, boxes[:, 1] - 3
+        x2, y2 = boxes[:, 0] + boxes[:, 2] + 3, boxes[:, 1] + boxes[:, 3] + 3
+        overlap = ((x1[:, None] < x2[None, :]) & (x1[None, :] < x2[:, None])
+                   & (y1[:, None] < y2[None, :]) & (y1[None, :] < y2[:, None]))
+        self._neighbors = [np.flatnonzero(row) for row in overlap]
+
+        self._drawn = None
+        self._drawn_count = None
+        self._green_frame = None
+
+    def _draw_spot(self, image, spot_indx, box_color, label_color):
+        x1, y1, w, h = self.spots[spot_indx]
+        cv2.rectangle(image, (x1, y1), (x1 + w, y1 + h), box_color, 2)
+        self._draw_label(image, spot_indx, label_color)
+
+    def _draw_label(self, image, spot_indx, label_color):
+        x1, y1, w, h = self.spots[spot_indx]
+        cv2.putText(image, str(spot_indx), (x1, y1 + 15), cv2.FONT_HERSHEY_SIMPLEX, 0.7, label_color, 2)
+
+    def update(self, free, free_count):
+        if self._drawn is None:
+            changed = np.arange(len(self.spots))
+        else:
+            changed = np.flatnonzero(free != self._drawn)
+
+        if len(changed):
+            for spot_indx in changed.tolist():
+                x1, y1, w, h = self.spots[spot_indx]
+                color = FREE_COLOR if free[spot_indx] else TAKEN_COLOR
+                cv2.rectangle(self.overlay, (x1, y1), (x1 + w, y1 + h), color, 2)
+            for spot_indx in np.unique(np.concatenate([self._neighbors[i] for i in changed])).tolist():
+                self._draw_label(self.overlay, spot_indx, LABEL_COLOR)
+            self._drawn = free.copy()
+
+        if free_count != self._drawn_count:
+            cv2.rectangle(self.overlay, *HEADER_BOX, (0, 0, 0), -1)
+            cv2.putText(self.overlay, f'Available spots: {free_count} / {len(self.spots)}', (100, 60),
+                        cv2.FONT_HERSHEY_SIMPLEX, 1, LABEL_COLOR, 2)
+            self._drawn_count = free_count
+
+    def draw(self, frame, free, free_count):
+        self.update(free, free_count)
+        cv2.copyTo(self.overlay, self._coverage, frame)
+
+        if self.show_window:
+            self._show_empty_spots(frame, free)
+
+    def _show_empty_spots(self, frame, free):
+        # Debug view of the empty spots only; needs a display
+        if self._green_frame is None or self._green_frame.shape != frame.shape:
+            self._green_frame = np.zeros_like(frame)
+        else:
+            self._green_frame.fill(0)
+        for spot_indx in np.flatnonzero(free).tolist():
+            x1, y1, w, h = self.spots[spot_indx]
+            cv2.rectangle(self._green_frame, (x1, y1), (x1 + w, y1 + h), TAKEN_COLOR, 2)
+            cv2.putText(self._green_frame, str(spot_indx), (x1 + 5, y1 + 15),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, LABEL_COLOR, 2)
+        cv2.namedWindow('Empty Parking Spots', cv2.WINDOW_NORMAL)
+        cv2.imshow('Empty Parking Spots', self._green_frame)
+        cv2.waitKey(1)
@@ -0,0 +1,350 @@
+import bisect
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from allocation import HOLD_SECONDS, reservable
+
+logger = logging.getLogger(__name__)
+
+# Reservation statuses in the bookings collection
+PENDING = "pending"  # waiting for payment until its hold_expires
+BOOKED = "booked"
+
+MAX_DAYS = 31  # longest reservation
+BUCKET_SECONDS = 86400  # span of the time buckets whole-lot queries read
+
+
+def to_seconds(dt):
+    # pymongo hands back naive datetimes in UTC
+    return (dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)).timestamp()
+
+
+def to_datetime(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc)
+
+
+def parse_time(value):
+    """A form's ISO 8601 date and time (e.g. ``2026-10-18T09:30``) as a UTC datetime; naive times are UTC."""
+    dt = datetime.fromisoformat(value)
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+class _Schedule:
+    # One slot's reservations as parallel lists sorted by start. They never
+    # overlap, so the ends are sorted as well and both can be bisected.
+    __slots__ = ('starts', 'ends', 'ids', 'expires')
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.ids = []
+        self.expires = []  # hold expiry of pending reservations, None once booked
+
+    def overlapping(self, start, end):
+        return range(bisect.bisect_right(self.ends, start), bisect.bisect_left(self.starts, end))
+
+    def is_free(self, start, end, now):
+        # Holds that ran out stay listed until a reservation replaces them
+        return all(self.expires[i] is not None and self.expires[i] < now for i in self.overlapping(start, end))
+
+    def earliest(self, after, duration, now):
+        t = after
+        for i in range(bisect.bisect_right(self.ends, after), len(self.starts)):
+            if self.starts[i] >= t + duration:
+                break
+            if self.expires[i] is None or self.expires[i] >= now:
+                t = self.ends[i]
+        return t
+
+    def insert(self, start, end, booking_id, expires):
+        i = bisect.bisect_left(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.ids.insert(i, booking_id)
+        self.expires.insert(i, expires)
+
+    def find(self, start, booking_id):
+        i = bisect.bisect_left(self.starts, start)
+        while i < len(self.starts) and self.starts[i] == start:
+            if self.ids[i] == booking_id:
+                return i
+            i += 1
+        return None
+
+    def pop(self, i):
+        for values in (self.starts, self.ends, self.ids, self.expires):
+            del values[i]
+
+
+class _Bucket:
+    # The reservations of a lot that overlap one time bucket, with the
+    # arrays built from them on the next query
+    __slots__ = ('slots', 'starts', 'ends', 'ids', 'expires', '_arrays')
+
+    def __init__(self):
+        self.slots = []
+        self.starts = []
+        self.ends = []
+        self.ids = []
+        self.expires = []
+        self._arrays = None
+
+    def append(self, slot_id, start, end, booking_id, expires):
+        self.slots.append(slot_id)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.ids.append(booking_id)
+        self.expires.append(math.inf if expires is None else expires)
+        self._arrays = None
+
+    def confirm(self, booking_id):
+        self.expires[self.ids.index(booking_id)] = math.inf
+        self._arrays = None
+
+    def arrays(self):
+        if self._arrays is None:
+            self._arrays = (np.array(self.slots, dtype=np.intp), np.array(self.starts), np.array(self.ends),
+                            np.array(self.expires))
+        return self._arrays
+
+
+class ReservationIndex:
+    """Every slot's reservations in memory, for time-window availability queries.
+
+    Times are unix seconds and windows half-open, ``[start, end)``. Each
+    slot keeps its reservations sorted, so whether it is free over a window
+    is two bisections and its earliest free window a walk from there. For
+    the free slots of a whole lot, reservations are also filed under every
+    ``bucket_seconds`` bucket they overlap; a query compares only those of
+    the buckets its window spans, in one vectorized pass, instead of every
+    booking. Not thread-safe; ``ReservationBook`` locks around it.
+    """
+
+    def __init__(self, lots, bucket_seconds=BUCKET_SECONDS):
+        # lots: {lot_id: number of slots}
+        self.lots = {lot_id: [_Schedule() for _ in range(n_slots)] for lot_id, n_slots in lots.items()}
+        self.bucket_seconds = bucket_seconds
+        self._buckets = {lot_id: {} for lot_id in lots}  # lot_id -> bucket number -> _Bucket
+        self._where = {}  # booking id -> (lot_id, slot_id, start, end)
+        self.size = 0
+
+    def _bucket_range(self, start, end):
+        return range(int(start // self.bucket_seconds), int(math.ceil(end / self.bucket_seconds)))
+
+    def schedule(self, lot_id, slot_id):
+        schedules = self.lots.get(lot_id)
+        return schedules[slot_id] if schedules is not None and 0 <= slot_id < len(schedules) else None
+
+    def add(self, lot_id, slot_id, start, end, booking_id, expires=None, now=None):
+        """Record a reservation, dropping the expired holds it replaces; False if it overlaps a live one."""
+        schedule = self.schedule(lot_id, slot_id)
+        if schedule is None or booking_id in self._where:
+            return False
+        now = time.time() if now is None else now
+        overlapping = schedule.overlapping(start, end)
+        if not schedule.is_free(start, end, now):
+            return False
+        # Expired holds stay in the buckets, where queries skip them, until the next load
+        for i in reversed(overlapping):
+            self._where.pop(schedule.ids[i], None)
+            schedule.pop(i)
+            self.size -= 1
+        schedule.insert(start, end, booking_id, expires)
+        buckets = self._buckets[lot_id]
+        for n in self._bucket_range(start, end):
+            if n not in buckets:
+                buckets[n] = _Bucket()
+            buckets[n].append(slot_id, start, end, booking_id, expires)
+        self._where[booking_id] = (lot_id, slot_id, start, end)
+        self.size += 1
+        return True
+
+    def confirm(self, booking_id):
+        where = self._where.get(booking_id)
+        if where is None:
+            return False
+        lot_id, slot_id, start, end = where
+        schedule = self.schedule(lot_id, slot_id)
+        schedule.expires[schedule.find(start, booking_id)] = None
+        for n in self._bucket_range(start, end):
+            self._buckets[lot_id][n].confirm(booking_id)
+        return True
+
+    def is_free(self, lot_id, slot_id, start, end, now=None):
+        schedule = self.schedule(lot_id, slot_id)
+        return schedule is not None and schedule.is_free(start, end, time.time() if now is None else now)
+
+    def free_slots(self, lot_id, start, end, now=None):
+        """Ids of the lot's slots with no live reservation overlapping ``[start, end)``."""
+        if lot_id not in self.lots:
+            return []
+        now = time.time() if now is None else now
+        busy = np.zeros(len(self.lots[lot_id]), dtype=bool)
+        buckets = self._buckets[lot_id]
+        for n in self._bucket_range(start, end):
+            if n in buckets:
+                slots, starts, ends, expires = buckets[n].arrays()
+                busy[slots[(starts < end) & (ends > start) & (expires >= now)]] = True
+        return np.flatnonzero(~busy).tolist()
+
+    def earliest_free(self, lot_id, after, duration, now=None):
+        """``(start, slot_id)`` of the earliest window of ``duration`` from ``after`` on, or None for an unknown lot.
+
+        Walks the slots' schedules from ``after`` and stops at the first
+        slot free right then, so it is O(slots * log n) at worst, not
+        logarithmic: the answer depends on both ``after`` and ``duration``,
+        and no single per-slot key (like a next free time) orders it.
+        """
+        now = time.time() if now is None else now
+        best = None
+        for slot_id, schedule in enumerate(self.lots.get(lot_id, ())):
+            start = schedule.earliest(after, duration, now)
+            if best is None or start < best[0]:
+                best = (start, slot_id)
+                if start == after:
+                    break
+        return best
+
+
+class ReservationBook(threading.Thread):
+    """Reservations of slots for time windows, in the bookings collection and a ReservationIndex.
+
+    The index answers availability without a query. A reservation is
+    written only after Mongo, checked through the ``lot_id, slot_id, start,
+    end`` index, shows nothing overlapping it, so reservations made by other
+    processes are never double-booked even before this index has them.
+    Writes to one slot are serialized on a version counter in its slot
+    document: of two reservations that raced past the check, only the first
+    to bump the counter stays, and the other tries again. The thread reloads
+    the live reservations every ``resync_every`` seconds to pick up the
+    other processes' ones.
+
+    A reservation is held for ``hold_seconds`` until ``confirm`` books it,
+    like a slot claimed through the allocator. Slots held or booked through
+    the allocator are not reserved (see ``allocation.reservable``): the
+    counter bump only matches while the slot is still free of them, and the
+    allocator skips slots ``reserved`` reports.
+    """
+
+    def __init__(self, bookings, slots, lots, hold_seconds=HOLD_SECONDS, resync_every=60.0, attempts=8):
+        super().__init__(daemon=True, name="reservation-book")
+        self.bookings = bookings
+        self.slots = slots
+        self.lots = lots  # {lot_id: number of slots}
+        self.hold_seconds = hold_seconds
+        self.resync_every = resync_every
+        self.attempts = attempts  # slots tried per reservation
+        self._lock = threading.Lock()
+        self.index = ReservationIndex(lots)
+
+    def _live(self, now):
+        return {"$or": [{"status": BOOKED}, {"status": PENDING, "hold_expires": {"$gte": now}}]}
+
+    def load(self):
+        now = datetime.now(timezone.utc)
+        query = {"lot_id": {"$in": list(self.lots)}, "end": {"$gt": now}, **self._live(now)}
+        fields = {"lot_id": 1, "slot_id": 1, "start": 1, "end": 1, "status": 1, "hold_expires": 1}
+        index = ReservationIndex(self.lots)
+        for doc in self.bookings.find(query, fields).sort([("start", 1)]):
+            self._add(index, doc)
+        with self._lock:
+            self.index = index
+
+    def _add(self, index, doc):
+        expires = to_seconds(doc["hold_expires"]) if doc.get("status") == PENDING else None
+        return index.add(doc["lot_id"], doc["slot_id"], to_seconds(doc["start"]), to_seconds(doc["end"]),
+                         doc["_id"], expires)
+
+    def run(self):
+        # Until the first load, reservations are checked against Mongo alone
+        while True:
+            try:
+                self.load()
+            except Exception:
+                logger.exception("Reloading reservations failed")
+            time.sleep(self.resync_every)
+
+    def free_slots(self, lot_id, start, end):
+        with self._lock:
+            return self.index.free_slots(lot_id, to_seconds(start), to_seconds(end))
+
+    def earliest_free(self, lot_id, after, duration):
+        """``(start, slot_id)`` of the earliest free window of ``duration`` (a timedelta) from ``after`` on."""
+        with self._lock:
+            best = self.index.earliest_free(lot_id, to_seconds(after), duration.total_seconds())
+        return best and (to_datetime(best[0]), best[1])
+
+    def reserved(self, lot_id, slot_ids, now):
+        """The slots of ``slot_ids`` with a live reservation ending after ``now``, as a set.
+
+        Asked of Mongo rather than the index, which may not have other
+        processes' reservations yet; for ``SlotAllocator(reserved=...)``.
+        """
+        query = {"lot_id": lot_id, "slot_id": {"$in": list(slot_ids)}, "end": {"$gt": now}, **self._live(now)}
+        return set(self.bookings.distinct("slot_id", query))
+
+    def _insert(self, doc, now):
+        # True once doc is stored, False if the slot is taken over its window
+        key = {"lot_id": doc["lot_id"], "slot_id": doc["slot_id"]}
+        overlap = {**key, "start": {"$lt": doc["end"]}, "end": {"$gt": doc["start"]}, **self._live(now)}
+        while True:
+            slot = self.slots.find_one({**key, **reservable(now)}, {"reservations": 1})
+            if slot is None:
+                return False
+            version = slot.get("reservations", 0)
+            conflict = self.bookings.find_one(overlap)
+            if conflict is not None:
+                with self._lock:
+                    self._add(self.index, conflict)
+                return False
+            self.bookings.insert_one(doc)
+            claimed = {**key, **reservable(now), "reservations": version if version else {"$exists": False}}
+            if self.slots.update_one(claimed, {"$inc": {"reservations": 1}}).modified_count == 1:
+                return True
+            # Another reservation of this slot got in first; check again against it
+            self.bookings.delete_one({"_id": doc.pop("_id")})
+
+    def reserve(self, holder, lot_id, start, end, details=None, slot_ids=None):
+        """Hold a slot of ``lot_id`` for ``[start, end)``; returns the booking document or None.
+
+        ``slot_ids`` restricts and orders the slots tried; otherwise the
+        first ones free over the window are.
+        """
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            free = self.index.free_slots(lot_id, to_seconds(start), to_seconds(end))
+        if slot_ids is not None:
+            free = set(free)
+            free = [slot_id for slot_id in slot_ids if slot_id in free]
+        # The index does not know about allocator holds; leave their slots out up front
+        reservable_ids = set(self.slots.distinct("slot_id", {"lot_id": lot_id, "slot_id": {"$in": free},
+                                                              **reservable(now)}))
+        free = [slot_id for slot_id in free if slot_id in reservable_ids]
+
+        expires = now + timedelta(seconds=self.hold_seconds)
+        for slot_id in free[:self.attempts]:
+            doc = {**(details or {}), "lot_id": lot_id, "slot_id": slot_id, "start": start, "end": end,
+                   "holder": holder, "status": PENDING, "hold_expires": expires}
+            if self._insert(doc, now):
+                with self._lock:
+                    self._add(self.index, doc)
+                return doc
+        return None
+
+    def confirm(self, booking_id, holder):
+        """Book a reservation whose hold is still live; returns False if the hold was lost."""
+        result = self.bookings.update_one(
+            {"_id": booking_id, "holder": holder, "status": PENDING,
+             "hold_expires": {"$gte": datetime.now(timezone.utc)}},
+            {"$set": {"status": BOOKED}, "$unset": {"hold_expires": ""}},
+        )
+        if result.modified_count != 1:
+            return False
+        with self._lock:
+            self.index.confirm(booking_id)
+        return True
@@ -0,0 +1,277 @@
+import logging
+import os
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from spot_table import OCCUPIED, FREE, UNKNOWN
+
+logger = logging.getLogger(__name__)
+
+# ----------------------
+# Shared Spot State
+# ----------------------
+# With DETECTOR=external the pipelines run in detector.py and every web worker
+# reads the lots from one shared memory segment per lot, named
+# "<SPOT_SHM_PREFIX>-<lot id>".
+SPOT_SHM_PREFIX = os.getenv('SPOT_SHM_PREFIX', 'parking')
+FRAME_CAPACITY = 4 * 2 ** 20  # largest stream JPEG that can be shared
+WATCH_TIMEOUT = 2.0  # seconds a web worker's viewer keeps the detector streaming
+
+# Header slots, 8 bytes each
+_SEQ, _VERSION, _N_SPOTS, _FRAME_SEQ, _FRAME_LEN, _FRAME_CAP, _WATCHED_AT, _ALIVE_AT = range(8)
+_HEADER_SIZE = 64
+
+
+def _layout(n_spots):
+    status = _HEADER_SIZE
+    changed_at = status + (n_spots + 7) // 8 * 8
+    bboxes = changed_at + 8 * n_spots
+    frame = bboxes + 16 * n_spots
+    return status, changed_at, bboxes, frame
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching registers the segment with this process's
+        # resource tracker, which would unlink it when the process exits
+        shm = shared_memory.SharedMemory(name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class SharedLotState:
+    """One lot's spot status, bboxes and latest stream frame in shared memory.
+
+    There is one writer (the detector process) and any number of readers.
+    Status and frame are each guarded by a seqlock: the writer makes the
+    sequence number odd while it writes, and readers retry until they copied
+    the data between two equal, even reads of it, so they never block the
+    writer or see a half-written update.
+    """
+
+    def __init__(self, shm, n_spots, frame_capacity):
+        self.shm = shm
+        self.name = shm.name
+        status, changed_at, bboxes, frame = _layout(n_spots)
+        self._header = np.ndarray(8, np.int64, shm.buf)
+        self._clock = np.ndarray(8, np.float64, shm.buf)
+        self.status = np.ndarray(n_spots, np.uint8, shm.buf, status)
+        self.changed_at = np.ndarray(n_spots, np.float64, shm.buf, changed_at)
+        self.bboxes = np.ndarray((n_spots, 4), np.int32, shm.buf, bboxes)
+        self._frame = np.ndarray(frame_capacity, np.uint8, shm.buf, frame)
+
+    @classmethod
+    def create(cls, lot_id, bboxes, frame_capacity=FRAME_CAPACITY):
+        name = f"{SPOT_SHM_PREFIX}-{lot_id}"
+        try:
+            # Left behind by a detector that did not shut down cleanly
+            stale = _attach(name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+
+        bboxes = np.asarray(bboxes, dtype=np.int32).reshape(-1, 4)
+        n_spots = len(bboxes)
+        shm = shared_memory.SharedMemory(name, create=True, size=_layout(n_spots)[-1] + frame_capacity)
+        state = cls(shm, n_spots, frame_capacity)
+        state._header[_N_SPOTS] = n_spots
+        state._header[_FRAME_CAP] = frame_capacity
+        state.status[:] = UNKNOWN
+        state.bboxes[:] = bboxes
+        return state
+
+    @classmethod
+    def attach(cls, lot_id):
+        """Open the segment of a running detector; raises FileNotFoundError if there is none."""
+        shm = _attach(f"{SPOT_SHM_PREFIX}-{lot_id}")
+        header = np.ndarray(8, np.int64, shm.buf)
+        n_spots, frame_capacity = int(header[_N_SPOTS]), int(header[_FRAME_CAP])
+        del header
+        return cls(shm, n_spots, frame_capacity)
+
+    def close(self):
+        # The arrays hold pointers into the buffer; they must go before it is closed
+        del self._header, self._clock, self.status, self.changed_at, self.bboxes, self._frame
+        self.shm.close()
+
+    @property
+    def version(self):
+        return int(self._header[_VERSION])
+
+    def write_status(self, spot_ids, free, now=None):
+        seq = int(self._header[_SEQ])
+        self._header[_SEQ] = seq + 1
+        self.status[spot_ids] = np.where(free, FREE, OCCUPIED)
+        self.changed_at[spot_ids] = time.time() if now is None else now
+        self._header[_VERSION] += 1
+        self._header[_SEQ] = seq + 2
+
+    def read_status(self):
+        """A consistent ``(version, status, changed_at)`` copy."""
+        while True:
+            seq = int(self._header[_SEQ])
+            if seq % 2 == 0:
+                version, status, changed_at = int(self._header[_VERSION]), self.status.copy(), self.changed_at.copy()
+                if int(self._header[_SEQ]) == seq:
+                    return version, status, changed_at
+            time.sleep(0)
+
+    def write_frame(self, jpeg):
+        if len(jpeg) > len(self._frame):
+            return False
+        seq = int(self._header[_FRAME_SEQ])
+        self._header[_FRAME_SEQ] = seq + 1
+        self._frame[:len(jpeg)] = np.frombuffer(jpeg, np.uint8)
+        self._header[_FRAME_LEN] = len(jpeg)
+        self._header[_FRAME_SEQ] = seq + 2
+        return True
+
+    def read_frame(self, last_seq):
+        """``(seq, jpeg)`` of the latest frame, or ``(last_seq, None)`` if there is none newer."""
+        while True:
+            seq = int(self._header[_FRAME_SEQ])
+            if seq == last_seq or seq == 0:
+                return last_seq, None
+            if seq % 2 == 0:
+                jpeg = self._frame[:int(self._header[_FRAME_LEN])].tobytes()
+                if int(self._header[_FRAME_SEQ]) == seq:
+                    return seq, jpeg
+            time.sleep(0)
+
+    # Liveness: readers stamp watched_at while they have viewers, the writer stamps alive_at
+    @property
+    def watched_at(self):
+        return float(self._clock[_WATCHED_AT])
+
+    def mark_watched(self):
+        self._clock[_WATCHED_AT] = time.time()
+
+    @property
+    def alive_at(self):
+        return float(self._clock[_ALIVE_AT])
+
+    def mark_alive(self):
+        self._clock[_ALIVE_AT] = time.time()
+
+
+class SharedStatePublisher:
+    """Detector side: publishes every lot's status changes and, while watched, its frames.
+
+    ``publish_status`` is a LotEngine status listener. ``start`` runs one
+    thread per lot that copies the lot's stream into shared memory for as
+    long as some web worker has a /video_feed viewer for it.
+    """
+
+    def __init__(self, lots, frame_capacity=FRAME_CAPACITY):
+        self.segments = {lot_id: SharedLotState.create(lot_id, lot.spots, frame_capacity)
+                         for lot_id, lot in lots.items()}
+
+    def publish_status(self, lot_id, spot_ids, free):
+        self.segments[lot_id].write_status(spot_ids, free)
+
+    def start(self, engine):
+        for lot_id, segment in self.segments.items():
+            threading.Thread(target=self._forward_frames, args=(segment, engine.get(lot_id).broadcaster),
+                             name=f"shared-frames-{lot_id}", daemon=True).start()
+
+    def _forward_frames(self, segment, broadcaster):
+        while True:
+            segment.mark_alive()
+            if time.time() - segment.watched_at > WATCH_TIMEOUT:
+                time.sleep(0.2)
+                continue
+            with broadcaster.client():
+                seq = 0
+                while time.time() - segment.watched_at <= WATCH_TIMEOUT:
+                    segment.mark_alive()
+                    seq, jpeg = broadcaster.wait(seq, timeout=1.0)
+                    if jpeg is not None and not segment.write_frame(jpeg):
+                        logger.warning("Frame of %d bytes does not fit in %s", len(jpeg), segment.name)
+
+    def close(self):
+        for segment in self.segments.values():
+            segment.shm.unlink()
+            segment.close()
+
+
+class SharedStateMirror(threading.Thread):
+    """Web worker side: keeps this process's LotStates in step with the detector.
+
+    Polls each lot's segment for a new status version (every
+    ``poll_interval`` seconds, or ``stream_poll_interval`` while the lot has
+    stream viewers) and hands it to ``LotState.replace_status``, so the local
+    SpotTable, its caches, deltas and waiters work as with an embedded
+    pipeline. Segments are (re)attached when the detector starts or
+    restarts.
+    """
+
+    def __init__(self, states, poll_interval=0.05, stream_poll_interval=0.01, stale_after=5.0):
+        super().__init__(daemon=True, name="shared-state-mirror")
+        self.states = states
+        self.poll_interval = poll_interval
+        self.stream_poll_interval = stream_poll_interval
+        self.stale_after = stale_after
+        self._segments = {}
+        self._frame_seqs = {}
+        self._attach_at = {}
+        self._missing = set()
+
+    def _segment(self, lot_id, now):
+        segment = self._segments.get(lot_id)
+        if segment is not None and now - segment.alive_at > self.stale_after and now >= self._attach_at[lot_id]:
+            # The detector stopped; look for the segment of a new one
+            segment.close()
+            del self._segments[lot_id]
+            segment = None
+        if segment is None and now >= self._attach_at.get(lot_id, 0):
+            self._attach_at[lot_id] = now + self.stale_after
+            try:
+                segment = SharedLotState.attach(lot_id)
+            except FileNotFoundError:
+                if lot_id not in self._missing:
+                    logger.warning("No shared state for lot %s yet; is detector.py running?", lot_id)
+                    self._missing.add(lot_id)
+                return None
+            self._missing.discard(lot_id)
+            table = self.states[lot_id].table
+            if segment.bboxes.shape != table.bboxes.shape:
+                logger.error("Lot %s has %d spots in the detector but %d here; not mirroring it",
+                             lot_id, len(segment.bboxes), len(table.bboxes))
+                segment.close()
+                return None
+            table.set_bboxes(segment.bboxes)
+            self._segments[lot_id] = segment
+            self._frame_seqs[lot_id] = 0
+        return segment
+
+    def poll(self):
+        now = time.time()
+        streaming = False
+        for lot_id, state in self.states.items():
+            segment = self._segment(lot_id, now)
+            if segment is None:
+                continue
+            if segment.version != state.table.version:
+                state.replace_status(*segment.read_status())
+            if state.broadcaster.clients:
+                streaming = True
+                segment.mark_watched()
+                self._frame_seqs[lot_id], jpeg = segment.read_frame(self._frame_seqs[lot_id])
+                if jpeg is not None:
+                    state.broadcaster.publish(jpeg=jpeg)
+        return streaming
+
+    def run(self):
+        while True:
+            try:
+                streaming = self.poll()
+            except Exception:
+                logger.exception("Mirroring the shared spot state failed")
+                streaming = False
+            time.sleep(self.stream_poll_interval if streaming else self.poll_interval)
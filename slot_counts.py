@@ -0,0 +1,96 @@
+import collections
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from allocation import FREE, OCCUPIED, RETIRED
+
+logger = logging.getLogger(__name__)
+
+
+class SlotCounter(threading.Thread):
+    """In-process mirror of the slots collection's statuses, counted per lot.
+
+    The allocator and the detector sync report every status they write (see
+    ``record``), so serving the counts costs no query. The thread reloads the
+    whole collection every ``resync_every`` seconds to pick up writes made by
+    other processes and updates whose filter did not match in Mongo.
+    """
+
+    def __init__(self, slots, resync_every=60.0):
+        super().__init__(daemon=True, name="slot-counter")
+        self.slots = slots
+        self.resync_every = resync_every
+        self._status = {}  # (lot_id, slot_id) -> status
+        self._counts = collections.defaultdict(collections.Counter)  # lot_id -> status -> n
+        self._lock = threading.Lock()
+        self.version = 0
+        self._cache_version = -1
+        self._cache = {}
+
+    def load(self):
+        docs = self.slots.find({}, {"_id": 0, "lot_id": 1, "slot_id": 1, "status": 1})
+        status = {(doc.get("lot_id"), doc["slot_id"]): doc.get("status") for doc in docs}
+        counts = collections.defaultdict(collections.Counter)
+        for (lot_id, _), slot_status in status.items():
+            counts[lot_id][slot_status] += 1
+        with self._lock:
+            self._status = status
+            self._counts = counts
+            self.version += 1
+
+    def record(self, lot_id, slot_id, status, if_status=None):
+        """Note that ``status`` was written to a slot, unless it was not in ``if_status``."""
+        key = (lot_id, slot_id)
+        with self._lock:
+            old = self._status.get(key)
+            if old == status or (if_status is not None and old not in if_status):
+                return
+            if key in self._status:
+                self._counts[lot_id][old] -= 1
+            self._counts[lot_id][status] += 1
+            self._status[key] = status
+            self.version += 1
+
+    def record_detected(self, lot_id, spot_ids, free):
+        """Status listener for detector changes written by another process's SlotSync."""
+        for spot_id, is_free in zip(spot_ids.tolist(), free.tolist()):
+            self.record(lot_id, spot_id, FREE if is_free else OCCUPIED, (FREE, OCCUPIED))
+
+    def counts(self, lot_id=None):
+        with self._lock:
+            return self._counts_of(lot_id)
+
+    def _counts_of(self, lot_id):
+        if lot_id is not None:
+            return collections.Counter(self._counts.get(lot_id, {}))
+        return sum(self._counts.values(), collections.Counter())
+
+    def payload(self, lot_id=None):
+        """JSON body of the counts and its ETag, built once per change."""
+        with self._lock:
+            if self._cache_version != self.version:
+                self._cache = {}
+                self._cache_version = self.version
+            if lot_id not in self._cache:
+                counts = self._counts_of(lot_id)
+                total = sum(counts.values()) - counts[RETIRED]
+                body = json.dumps({
+                    "free_spaces": counts[FREE],
+                    "free": counts[FREE],
+                    "occupied": total - counts[FREE],
+                    "total": total,
+                }).encode()
+                # Derived from the body, so every web process hands out the same tag for the same counts
+                self._cache[lot_id] = (body, hashlib.sha1(body).hexdigest()[:16])
+            return self._cache[lot_id]
+
+    def run(self):
+        while True:
+            try:
+                self.load()
+            except Exception:
+                logger.exception("Reloading slot counts failed")
+            time.sleep(self.resync_every)
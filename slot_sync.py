@@ -0,0 +1,77 @@
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+
+from allocation import FREE, OCCUPIED
+
+logger = logging.getLogger(__name__)
+
+
+class SlotSync(threading.Thread):
+    """Write-behind sync of detector status into the slots collection.
+
+    Changes are coalesced per slot (only the latest status of a slot is
+    written) and flushed as one unordered ``bulk_write`` of at most
+    ``max_batch`` updates, so the frame loop never waits on Mongo. Slots that
+    are held or booked are left alone. ``submit`` blocks once ``max_pending``
+    slots are waiting, which only happens if Mongo falls far behind.
+
+    ``listeners`` are called as ``listener(lot_id, slot_id, status, if_status)``
+    for every update of a flushed batch; like the update itself, it only
+    applies to slots whose status is in ``if_status``.
+    """
+
+    def __init__(self, slots, max_batch=1000, max_pending=20000, retry_delay=2.0, listeners=()):
+        super().__init__(daemon=True, name="slot-sync")
+        self.slots = slots
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.retry_delay = retry_delay
+        self.listeners = listeners
+        self._pending = {}
+        self._cond = threading.Condition()
+
+    def submit(self, lot_id, spot_ids, free):
+        with self._cond:
+            self._cond.wait_for(lambda: len(self._pending) < self.max_pending)
+            for spot_id, is_free in zip(spot_ids, free):
+                self._pending[(lot_id, int(spot_id))] = bool(is_free)
+            self._cond.notify_all()
+
+    def _take_batch(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending)
+            keys = list(self._pending)[:self.max_batch]
+            batch = {key: self._pending.pop(key) for key in keys}
+            self._cond.notify_all()
+            return batch
+
+    def flush(self, batch):
+        now = datetime.now(timezone.utc)
+        ops = [
+            UpdateOne(
+                {"lot_id": lot_id, "slot_id": slot_id, "status": {"$in": [FREE, OCCUPIED]}},
+                {"$set": {"status": FREE if is_free else OCCUPIED, "detected_at": now}},
+            )
+            for (lot_id, slot_id), is_free in batch.items()
+        ]
+        self.slots.bulk_write(ops, ordered=False)
+        for listener in self.listeners:
+            for (lot_id, slot_id), is_free in batch.items():
+                listener(lot_id, slot_id, FREE if is_free else OCCUPIED, (FREE, OCCUPIED))
+
+    def run(self):
+        while True:
+            batch = self._take_batch()
+            try:
+                self.flush(batch)
+            except Exception:
+                logger.exception("Slot sync of %d slots failed, retrying", len(batch))
+                with self._cond:
+                    # Newer statuses submitted in the meantime win over the failed batch
+                    for key, is_free in batch.items():
+                        self._pending.setdefault(key, is_free)
+                time.sleep(self.retry_delay)
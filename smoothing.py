@@ -0,0 +1,71 @@
+import numpy as np
+
+from spot_table import OCCUPIED, FREE, UNKNOWN
+
+
+class SpotSmoother:
+    """Debounces per-spot classifier output into stable free/occupied transitions.
+
+    Each spot keeps an exponential moving average of its "empty" confidence.
+    A spot becomes free once the average reaches ``enter_free`` and occupied
+    once it drops to ``exit_free``; in between it keeps its status. The new
+    status must also hold for ``min_dwell`` seconds before it is emitted, so a
+    pedestrian or a headlight sweeping over a spot does not flip it.
+    The first observation of a spot is taken as is.
+    """
+
+    def __init__(self, n_spots, alpha=0.5, enter_free=0.6, exit_free=0.4, min_dwell=1.0, settle=0.05):
+        if not exit_free <= enter_free:
+            raise ValueError(f"exit_free ({exit_free}) must not be above enter_free ({enter_free})")
+        self.alpha = alpha
+        self.enter_free = enter_free
+        self.exit_free = exit_free
+        self.min_dwell = min_dwell
+        self.settle = settle
+
+        self.confidence = np.full(n_spots, np.nan)  # last raw confidence
+        self.ema = np.full(n_spots, np.nan)
+        self.state = np.full(n_spots, UNKNOWN, dtype=np.uint8)
+        self.pending_since = np.full(n_spots, np.nan)  # when the EMA first asked for the other status
+        self.raw_flips = 0
+
+    def update(self, spot_ids, confidence, now):
+        """Feed new confidences for ``spot_ids``; returns ``(ids, free)`` of the transitions."""
+        spot_ids = np.asarray(spot_ids, dtype=np.intp)
+        confidence = np.asarray(confidence, dtype=np.float64)
+
+        previous = self.confidence[spot_ids]
+        seen = ~np.isnan(previous)
+        self.raw_flips += int(np.count_nonzero((previous[seen] >= 0.5) != (confidence[seen] >= 0.5)))
+        self.confidence[spot_ids] = confidence
+
+        ema = self.ema[spot_ids]
+        ema = np.where(seen, self.alpha * confidence + (1 - self.alpha) * ema, confidence)
+        self.ema[spot_ids] = ema
+
+        state = self.state[spot_ids]
+        target = state.copy()
+        target[state == UNKNOWN] = np.where(ema[state == UNKNOWN] >= 0.5, FREE, OCCUPIED)
+        target[ema >= self.enter_free] = FREE
+        target[ema <= self.exit_free] = OCCUPIED
+
+        flipping = target != state
+        since = self.pending_since[spot_ids]
+        since[flipping & np.isnan(since)] = now
+        since[~flipping] = np.nan
+
+        commit = flipping & ((state == UNKNOWN) | (now - since >= self.min_dwell))
+        since[commit] = np.nan
+        self.pending_since[spot_ids] = since
+
+        changed = spot_ids[commit]
+        self.state[changed] = target[commit]
+        return changed, target[commit] == FREE
+
+    def unsettled(self):
+        """Ids of spots still waiting out a transition or whose EMA has not caught up yet.
+
+        These need classifying on every tick even if their pixels look unchanged.
+        """
+        moving = np.abs(self.ema - self.confidence) > self.settle
+        return np.flatnonzero(~np.isnan(self.pending_since) | moving)
@@ -0,0 +1,93 @@
+import heapq
+import math
+
+import numpy as np
+
+
+class FreeSpotIndex:
+    """Uniform grid over the spot centroids, holding the ids of the free spots.
+
+    Each cell keeps the set of its free spots, updated as spots change, so a
+    full lot is detected from ``free_count`` alone and a nearest-free query
+    only visits the cells in rings around the query point until no closer
+    spot can remain, instead of scanning every spot. Cells are sized to a
+    couple of spots, which keeps both the rings and the per-cell sets short
+    however large the lot grows. When free spots are so sparse that the
+    rings would mostly cross empty cells, the free spots are compared
+    directly instead.
+    """
+
+    def __init__(self, bboxes, cell_size=None):
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        self.centroids = bboxes[:, :2] + bboxes[:, 2:] / 2
+        if cell_size is None:
+            cell_size = 2 * float(np.median(bboxes[:, 2:].max(1))) if len(bboxes) else 1.0
+        self.cell_size = max(cell_size, 1.0)
+        self.origin = self.centroids.min(0) if len(bboxes) else np.zeros(2)
+
+        cells = ((self.centroids - self.origin) // self.cell_size).astype(np.int64)
+        self.nx, self.ny = (cells.max(0) + 1).tolist() if len(bboxes) else (1, 1)
+        self.cell_of = (cells[:, 1] * self.nx + cells[:, 0]).tolist()
+        self._xy = self.centroids.tolist()
+        self._cells = [set() for _ in range(self.nx * self.ny)]
+        self._is_free = np.zeros(len(bboxes), dtype=bool)
+        self._free = set()
+        self.free_count = 0
+
+    def update(self, spot_ids, free):
+        for spot_id, is_free in zip(np.asarray(spot_ids).tolist(), np.asarray(free, dtype=bool).tolist()):
+            if self._is_free[spot_id] == is_free:
+                continue
+            self._is_free[spot_id] = is_free
+            if is_free:
+                self._cells[self.cell_of[spot_id]].add(spot_id)
+                self._free.add(spot_id)
+            else:
+                self._cells[self.cell_of[spot_id]].discard(spot_id)
+                self._free.discard(spot_id)
+        self.free_count = len(self._free)
+
+    def _ring(self, cx, cy, r):
+        # Cells at Chebyshev distance r from (cx, cy), clipped to the grid
+        x0, x1, y0, y1 = cx - r, cx + r, cy - r, cy + r
+        for y in range(max(y0, 0), min(y1, self.ny - 1) + 1):
+            if y == y0 or y == y1:
+                xs = range(max(x0, 0), min(x1, self.nx - 1) + 1)
+            else:
+                xs = [x for x in (x0, x1) if 0 <= x < self.nx]
+            row = y * self.nx
+            for x in xs:
+                yield self._cells[row + x]
+
+    def nearest(self, x, y, k=1):
+        """Up to ``k`` free spots closest to ``(x, y)``, as ``[(distance, spot_id)]`` nearest first."""
+        k = min(k, self.free_count)
+        if k <= 0:
+            return []
+        xy = self._xy
+        if self.free_count ** 2 <= k * len(self._cells):
+            # About as many cells to visit as there are free spots in the whole lot
+            return heapq.nsmallest(k, ((math.hypot(xy[i][0] - x, xy[i][1] - y), i) for i in self._free))
+
+        cx = min(max(int((x - self.origin[0]) // self.cell_size), 0), self.nx - 1)
+        cy = min(max(int((y - self.origin[1]) // self.cell_size), 0), self.ny - 1)
+        max_r = max(cx, self.nx - 1 - cx, cy, self.ny - 1 - cy)
+
+        best = []  # max-heap of the k closest so far, as (-distance, -spot_id)
+        seen = 0
+        for r in range(max_r + 1):
+            # Every cell of ring r is at least (r - 1) cells away from (x, y)
+            if len(best) == k and -best[0][0] <= (r - 1) * self.cell_size:
+                break
+            for cell in self._ring(cx, cy, r):
+                for spot_id in cell:
+                    sx, sy = xy[spot_id]
+                    item = (-math.hypot(sx - x, sy - y), -spot_id)
+                    if len(best) < k:
+                        heapq.heappush(best, item)
+                    elif item > best[0]:
+                        heapq.heapreplace(best, item)
+                seen += len(cell)
+            if seen == self.free_count and len(best) == k:
+                break
+        return sorted((-d, -spot_id) for d, spot_id in best)
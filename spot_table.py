@@ -0,0 +1,176 @@
+import collections
+import json
+import threading
+import time
+
+import numpy as np
+
+from spot_index import FreeSpotIndex
+
+# Values of SpotTable.status
+OCCUPIED = 0
+FREE = 1
+UNKNOWN = 2
+
+
+class SpotTable:
+    """Array-backed geometry and status of one lot's spots.
+
+    Every change bumps ``version``; free/occupied counts and the set of free
+    spot ids are kept up to date as spots change, and everything derived from
+    them (free-id list, ``/get_parking`` payload) is cached per version, so
+    reads cost nothing while the lot is unchanged. The ids changed by the last
+    ``history`` versions are kept so clients can ask for just the delta. Free
+    spots are also kept in a spatial index for nearest-free queries.
+    """
+
+    def __init__(self, spots, history=256):
+        self.bboxes = np.asarray(spots, dtype=np.int32).reshape(-1, 4)
+        self.status = np.full(len(self.bboxes), UNKNOWN, dtype=np.uint8)
+        self.changed_at = np.zeros(len(self.bboxes), dtype=np.float64)
+        self.version = 0
+        self.free_count = 0
+        self.occupied_count = 0
+
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+        self._history = collections.deque(maxlen=history)
+        self._free = set()
+        self.index = FreeSpotIndex(self.bboxes)
+        self._cache_version = -1
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.bboxes)
+
+    def update(self, spot_ids, free, now=None):
+        """Set the status of ``spot_ids``; returns the ids that actually changed."""
+        spot_ids = np.asarray(spot_ids, dtype=np.intp)
+        new_status = np.where(np.asarray(free, dtype=bool), FREE, OCCUPIED).astype(np.uint8)
+
+        with self._lock:
+            mask = self.status[spot_ids] != new_status
+            if not mask.any():
+                return spot_ids[mask]
+            changed = spot_ids[mask]
+            old_status = self.status[changed]
+            new_status = new_status[mask]
+
+            self.free_count += int(np.count_nonzero(new_status == FREE)) - int(np.count_nonzero(old_status == FREE))
+            self.occupied_count += (int(np.count_nonzero(new_status == OCCUPIED))
+                                    - int(np.count_nonzero(old_status == OCCUPIED)))
+            self._free.difference_update(changed[new_status != FREE].tolist())
+            self._free.update(changed[new_status == FREE].tolist())
+            self.index.update(changed, new_status == FREE)
+
+            self.status[changed] = new_status
+            self.changed_at[changed] = time.time() if now is None else now
+            self.version += 1
+            self._history.append((self.version, changed))
+            self._changed.notify_all()
+            return changed
+
+    def replace(self, status, version, changed_at=None):
+        """Take over the whole status array and version of another table; returns the ids that changed.
+
+        Used to mirror a table kept in another process (see shared_state.py).
+        Changes made between two calls are recorded as one history entry.
+        """
+        status = np.asarray(status, dtype=np.uint8)
+        with self._lock:
+            if version < self.version:
+                # The writer restarted; our history no longer lines up with its versions
+                self._history.clear()
+            changed = np.flatnonzero(self.status != status)
+            if not len(changed) and version == self.version:
+                return changed
+
+            old_status, new_status = self.status[changed], status[changed]
+            self.free_count += int(np.count_nonzero(new_status == FREE)) - int(np.count_nonzero(old_status == FREE))
+            self.occupied_count += (int(np.count_nonzero(new_status == OCCUPIED))
+                                    - int(np.count_nonzero(old_status == OCCUPIED)))
+            self._free.difference_update(changed[new_status != FREE].tolist())
+            self._free.update(changed[new_status == FREE].tolist())
+            self.index.update(changed, new_status == FREE)
+
+            self.status[:] = status
+            if changed_at is not None:
+                self.changed_at[:] = changed_at
+            self.version = version
+            if len(changed):
+                self._history.append((version, changed))
+            self._changed.notify_all()
+            return changed
+
+    def set_bboxes(self, bboxes):
+        """Take over another table's geometry (same number of spots)."""
+        with self._lock:
+            self.bboxes[:] = bboxes
+            self.index = FreeSpotIndex(self.bboxes)
+            self.index.update(np.arange(len(self.bboxes)), self.status == FREE)
+            self._cache_version = -1
+
+    def wait(self, version, timeout=None):
+        """Block until the table moves past ``version``; returns the current version."""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def is_free(self, spot_id):
+        return self.status[spot_id] == FREE
+
+    def _cached(self, key, build):
+        with self._lock:
+            if self._cache_version != self.version:
+                self._cache = {}
+                self._cache_version = self.version
+            if key not in self._cache:
+                self._cache[key] = build()
+            return self._cache[key]
+
+    def nearest_free(self, x, y, k=1):
+        """The ``k`` free spots closest to point ``(x, y)`` of the frame, as ``[(distance, spot_id)]``."""
+        with self._lock:
+            return self.index.nearest(x, y, k)
+
+    def free_ids(self):
+        return self._cached('free_ids', lambda: sorted(self._free))
+
+    def free_spots(self):
+        def build():
+            ids = self.free_ids()
+            return [{"spot_number": spot_id, "bbox": bbox} for spot_id, bbox in zip(ids, self.bboxes[ids].tolist())]
+        return self._cached('free_spots', build)
+
+    def payload(self):
+        """JSON body of ``/get_parking``, encoded once per version."""
+        return self._cached('payload', lambda: json.dumps({"free_spots": self.free_spots(), "version": self.version}).encode())
+
+    def snapshot(self):
+        def build():
+            occupied = np.flatnonzero(self.status == OCCUPIED).tolist()
+            return {"version": self.version, "snapshot": True, "free": self.free_ids(), "occupied": occupied}
+        return self._cached('snapshot', build)
+
+    def delta(self, since=None):
+        """Spots whose status changed after version ``since``.
+
+        Falls back to a full snapshot when ``since`` is unknown or older than
+        the kept history.
+        """
+        with self._lock:
+            if since is None or since > self.version:
+                return self.snapshot()
+            if since == self.version:
+                return {"version": self.version, "snapshot": False, "free": [], "occupied": []}
+            if not self._history or self._history[0][0] > since + 1:
+                return self.snapshot()
+
+            ids = np.unique(np.concatenate([changed for version, changed in self._history if version > since]))
+            status = self.status[ids]
+            return {
+                "version": self.version,
+                "snapshot": False,
+                "free": ids[status == FREE].tolist(),
+                "occupied": ids[status == OCCUPIED].tolist(),
+            }
@@ -0,0 +1,155 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# ----------------------
+# Warm-up Config
+# ----------------------
+# "background" initializes every subsystem in threads as soon as the app is
+# created; "lazy" leaves each one to the first request that needs it.
+WARMUP = os.getenv('WARMUP', 'background')
+WARMUP_WAIT = float(os.getenv('WARMUP_WAIT', '10'))  # seconds a request waits for a subsystem still warming up
+WARMUP_RETRY = float(os.getenv('WARMUP_RETRY', '5'))  # seconds before a failed subsystem is tried again
+
+PENDING, WARMING, READY, FAILED = 'pending', 'warming', 'ready', 'failed'
+
+
+class NotReady(Exception):
+    """The subsystem a request needs is still warming up, or its last start failed; served as a 503."""
+
+
+class Subsystem:
+    def __init__(self, name, init):
+        self.name = name
+        self.init = init
+        self.cond = threading.Condition()
+        self.reset()
+
+    def reset(self):
+        self.state = PENDING
+        self.value = None
+        self.error = None
+        self.started_at = None
+        self.seconds = None
+        self.failed_at = None
+
+
+class Warmup:
+    """Named subsystems of the app, each initialized once, in the background or on first use.
+
+    ``get`` returns a subsystem, initializing it in the calling thread if
+    nothing has yet, and waits at most ``wait`` seconds for one another
+    thread is initializing; it raises ``NotReady`` instead of holding the
+    request any longer. A subsystem whose init failed is tried again
+    ``retry`` seconds later.
+    """
+
+    def __init__(self, wait=WARMUP_WAIT, retry=WARMUP_RETRY):
+        self.wait = wait
+        self.retry = retry
+        self.subsystems = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._warming = set()  # names with a background warm-up thread
+
+    def add(self, name, init):
+        self.subsystems[name] = Subsystem(name, init)
+
+    def start(self):
+        """Warm every subsystem up in background threads, once per process."""
+        with self._lock:
+            # Helper processes spawned from the app (password and pipeline
+            # workers) re-import it but serve nothing
+            if self._pid == os.getpid() or multiprocessing.parent_process() is not None:
+                return
+            if self._pid is not None:
+                # Forked from a process that had started (e.g. gunicorn --preload);
+                # its threads and connections are not ours
+                for subsystem in self.subsystems.values():
+                    subsystem.reset()
+                self._warming.clear()
+            self._pid = os.getpid()
+        self.warm(*self.subsystems)
+
+    def warm(self, *names):
+        """Warm the named subsystems up in background threads, unless they are ready or already warming."""
+        with self._lock:
+            names = [name for name in names
+                     if name not in self._warming and self.subsystems[name].state != READY]
+            self._warming.update(names)
+        for name in names:
+            threading.Thread(target=self._warm, args=(name,), name=f"warmup-{name}", daemon=True).start()
+
+    def _warm(self, name):
+        while True:
+            try:
+                self._get(name, None)
+                return
+            except NotReady:
+                time.sleep(self.retry)
+
+    def get(self, name):
+        return self._get(name, time.monotonic() + self.wait)
+
+    def _get(self, name, deadline):
+        subsystem = self.subsystems[name]
+        with subsystem.cond:
+            while True:
+                if subsystem.state == READY:
+                    return subsystem.value
+                if subsystem.state == WARMING:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise NotReady(f"{name} is still starting up")
+                    subsystem.cond.wait(remaining)
+                    continue
+                if subsystem.state == FAILED and time.monotonic() - subsystem.failed_at < self.retry:
+                    raise NotReady(f"{name} failed to start: {subsystem.error}")
+                subsystem.state = WARMING
+                subsystem.started_at = time.monotonic()
+                break
+
+        try:
+            value = subsystem.init()
+        except Exception as e:
+            logger.exception("Starting %s failed", name)
+            self._finish(subsystem, FAILED, error=f"{type(e).__name__}: {e}")
+            raise NotReady(f"{name} failed to start: {e}") from e
+        self._finish(subsystem, READY, value)
+        logger.info("%s ready in %.2fs", name, subsystem.seconds)
+        return value
+
+    def _finish(self, subsystem, state, value=None, error=None):
+        with subsystem.cond:
+            subsystem.state = state
+            subsystem.value = value
+            subsystem.error = error
+            subsystem.seconds = time.monotonic() - subsystem.started_at
+            if state == FAILED:
+                subsystem.failed_at = time.monotonic()
+            subsystem.cond.notify_all()
+
+    @property
+    def ready(self):
+        return all(subsystem.state == READY for subsystem in self.subsystems.values())
+
+    def status(self):
+        """``{name: {"state", "seconds", "error"}}``; ``seconds`` is how long its init took, or has taken so far."""
+        now = time.monotonic()
+        status = {}
+        for name, subsystem in self.subsystems.items():
+            with subsystem.cond:
+                if subsystem.state == WARMING:
+                    seconds = now - subsystem.started_at
+                else:
+                    seconds = subsystem.seconds
+                status[name] = {
+                    "state": subsystem.state,
+                    "seconds": round(seconds, 3) if seconds is not None else None,
+                    "error": subsystem.error,
+                }
+        return status
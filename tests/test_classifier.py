@@ -0,0 +1,25 @@
+import os
+
+import numpy as np
+import pytest
+
+from classifier import NumpySVMClassifier, SklearnClassifier, export_svc
+from export_model import parity_inputs
+
+MODEL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'model.p')
+
+
+@pytest.fixture(scope='module')
+def reference():
+    return SklearnClassifier(MODEL).load()
+
+
+def test_numpy_export_matches_sklearn(reference, tmp_path):
+    path = str(tmp_path / 'model.npz')
+    export_svc(reference.model, path)
+    exported = NumpySVMClassifier(path).load()
+
+    data = parity_inputs(reference.model)
+    np.testing.assert_allclose(exported.decision_function(data), reference.decision_function(data), atol=1e-6)
+    np.testing.assert_array_equal(exported.predict(data), reference.predict(data))
+    np.testing.assert_array_equal(exported.classes_, reference.classes_)
@@ -0,0 +1,48 @@
+import mongomock
+
+from allocation import BOOKED, FREE, RETIRED
+from init_db import provision
+
+
+def legacy_slots(n, booked=()):
+    # What the old init_db.py stored: one document per spot of the single mask, no lot or bbox
+    slots = mongomock.MongoClient().parkingdb.slots
+    slots.insert_many([{"slot_id": i, "status": BOOKED if i in booked else FREE} for i in range(n)])
+    return slots
+
+
+def test_legacy_slots_are_taken_over_by_the_first_lot():
+    slots = legacy_slots(4, booked={2})
+    spots = [[10 * i, 0, 8, 8] for i in range(4)]
+
+    stats = provision(slots, {"main": spots, "north": spots[:2]})
+
+    assert stats == {"adopted": 4, "inserted": 2}
+    assert slots.count_documents({"lot_id": None}) == 0
+    assert slots.count_documents({}) == 6
+    main = {doc["slot_id"]: doc for doc in slots.find({"lot_id": "main"})}
+    assert [main[i]["bbox"] for i in range(4)] == spots
+    assert main[2]["status"] == BOOKED
+    assert provision(slots, {"main": spots, "north": spots[:2]}) == {}
+
+
+def test_legacy_slots_beyond_the_mask_are_retired():
+    slots = legacy_slots(5)
+    spots = [[10 * i, 0, 8, 8] for i in range(3)]
+
+    stats = provision(slots, {"main": spots})
+
+    assert stats == {"adopted": 3, "retired": 2}
+    assert slots.count_documents({"status": {"$ne": RETIRED}}) == 3
+    assert sorted(doc["slot_id"] for doc in slots.find({"lot_id": None, "status": RETIRED})) == [3, 4]
+    assert provision(slots, {"main": spots}) == {}
+
+
+def test_legacy_slots_next_to_provisioned_ones_are_retired():
+    slots = legacy_slots(3)
+    slots.insert_many([{"lot_id": "main", "slot_id": i, "status": FREE, "bbox": [i, 0, 8, 8]} for i in range(3)])
+
+    stats = provision(slots, {"main": [[i, 0, 8, 8] for i in range(3)]})
+
+    assert stats == {"retired": 3}
+    assert slots.count_documents({"status": {"$ne": RETIRED}}) == 3
@@ -0,0 +1,97 @@
+import types
+from datetime import datetime, timedelta, timezone
+
+import flask_pymongo
+import mongomock
+import pytest
+
+from allocation import BOOKED, FREE, SlotAllocator
+from reservations import ReservationBook, BOOKED as RESERVATION_BOOKED
+
+
+class FakePayments:
+    def __init__(self):
+        self.receipts = []
+
+    def create_order(self, receipt, amount, resubmit=False, notes=None):
+        self.receipts.append(receipt)
+        return {"id": f"order_{len(self.receipts)}", "receipt": receipt, "amount": amount}
+
+    def verify(self, order_id, payment_id, signature):
+        return True, {"id": order_id}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # No warm-up threads and no Mongo server: the app as a lazy worker would start, on mongomock
+    monkeypatch.setenv('WARMUP', 'lazy')
+    monkeypatch.setattr(flask_pymongo, 'MongoClient', mongomock.MongoClient)
+    import main
+    payments = FakePayments()
+    monkeypatch.setattr(main, 'payments', payments)
+    app = main.create_app({'TESTING': True})
+    with app.test_client() as client:
+        client.payments = payments
+        yield client
+
+
+def test_payment_without_a_hold(client):
+    response = client.post('/pay', data={'amount': '10'})
+    assert response.status_code == 200
+    assert len(client.payments.receipts) == 1
+    with client.session_transaction() as session:
+        assert 'hold' not in session
+
+    response = client.post('/success', data={'razorpay_payment_id': 'pay_1', 'razorpay_order_id': 'order_1',
+                                             'razorpay_signature': 'sig'})
+    assert response.status_code == 301
+    assert response.headers['Location'].endswith('/display')
+
+
+def test_resubmitted_payment_keeps_its_receipt(client):
+    with client.session_transaction() as session:
+        session['hold'] = {"lot_id": "main", "slot_id": 3, "holder": "a@example.com"}
+    client.post('/pay', data={'amount': '10'})
+    client.post('/pay', data={'amount': '10'})
+    assert len(set(client.payments.receipts)) == 1
+
+
+def test_checkout_frees_a_booked_walk_in(client, monkeypatch):
+    import main
+    slots = mongomock.MongoClient().parkingdb.slots
+    slots.insert_one({"lot_id": "main", "slot_id": 3, "status": FREE})
+    allocator = SlotAllocator(slots)
+    monkeypatch.setattr(main, 'allocator', allocator)
+    allocator.claim("a@example.com", lot_id="main", slot_ids=[3])
+
+    with client.session_transaction() as session:
+        session['hold'] = {"lot_id": "main", "slot_id": 3, "holder": "a@example.com"}
+    client.post('/success', data={'razorpay_payment_id': 'pay_1', 'razorpay_order_id': 'order_1',
+                                  'razorpay_signature': 'sig'})
+    assert slots.find_one({"slot_id": 3})["status"] == BOOKED
+
+    response = client.post('/checkout')
+    assert response.json['status'] == 'success'
+    assert slots.find_one({"slot_id": 3})["status"] == FREE
+    assert client.post('/checkout').status_code == 400
+
+
+def test_booking_goes_on_to_payment_and_is_confirmed(client, monkeypatch):
+    import main
+    db = mongomock.MongoClient().parkingdb
+    db.slots.insert_many([{"lot_id": "main", "slot_id": i, "status": FREE} for i in range(3)])
+    book = ReservationBook(db.bookings, db.slots, {"main": 3})
+    monkeypatch.setattr(main, 'reservations', book)
+    monkeypatch.setattr(main, 'get_lot', lambda lot_id: types.SimpleNamespace(lot=types.SimpleNamespace(id="main")))
+
+    start = (datetime.now(timezone.utc) + timedelta(days=1)).strftime('%Y-%m-%dT%H:%M')
+    response = client.post('/book', data={'name': 'A', 'phone': '123', 'start_time': start, 'hours': '2'})
+    assert response.status_code == 200
+    assert b'/pay' in response.data
+    with client.session_transaction() as session:
+        assert session['hold']['slot_id'] == 0
+
+    client.post('/pay', data={'amount': '10'})
+    client.post('/success', data={'razorpay_payment_id': 'pay_1', 'razorpay_order_id': 'order_1',
+                                  'razorpay_signature': 'sig'})
+    assert db.bookings.find_one()["status"] == RESERVATION_BOOKED
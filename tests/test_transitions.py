@@ -0,0 +1,14 @@
+import math
+import time
+
+from transitions import TransitionStore, to_json
+
+
+def test_a_range_in_the_future_is_empty(tmp_path):
+    now = time.time()
+    result = TransitionStore(str(tmp_path)).analyze('main', now + 10 * 86400, now + 11 * 86400, 4)
+
+    assert result['end'] == result['start']
+    assert result['turnover']['arrivals'] == 0
+    assert math.isnan(result['utilization']['overall'])
+    assert to_json(result)['utilization']['overall'] is None
@@ -0,0 +1,362 @@
+import logging
+import math
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from metrics import TRANSITIONS_DROPPED
+from spot_table import OCCUPIED, FREE, UNKNOWN
+
+logger = logging.getLogger(__name__)
+
+# ----------------------
+# Occupancy Transition Log
+# ----------------------
+# Every spot transition is kept as a row (t, spot, state, prev_t, prev_state):
+# the spot was in prev_state from prev_t until t. Rows are buffered in memory
+# and flushed to one directory per lot under TRANSITION_LOG_DIR as columnar
+# segments, one .npy file per column, which readers memory-map.
+TRANSITION_LOG_DIR = os.getenv('TRANSITION_LOG_DIR', 'transitions')
+
+COLUMNS = {'t': np.float64, 'spot': np.int32, 'state': np.uint8, 'prev_t': np.float64, 'prev_state': np.uint8}
+# Each segment also stores every spot's state (and since when) at its end
+SNAPSHOT = {'snap_state': np.uint8, 'snap_since': np.float64}
+
+DWELL_EDGES_MINUTES = (0, 5, 15, 30, 60, 120, 240, 480, 1440)
+
+
+class Segment:
+    """One flushed or compacted run of a lot's transitions, memory-mapped."""
+
+    def __init__(self, path):
+        self.path = path
+        self.level, first, last = os.path.basename(path).split('-')
+        self.level = int(self.level)
+        self.first, self.last = int(first) / 1e6, int(last) / 1e6
+
+    def load(self):
+        return {name: np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode='r')
+                for name in (*COLUMNS, *SNAPSHOT)}
+
+
+def list_segments(lot_dir):
+    """The lot's segments in time order, without those already merged into a compacted one."""
+    try:
+        names = [name for name in os.listdir(lot_dir) if not name.startswith('.')]
+    except FileNotFoundError:
+        return []
+    segments = sorted((Segment(os.path.join(lot_dir, name)) for name in names), key=lambda s: (s.first, -s.level))
+    # A compaction that has not removed its inputs yet leaves both; keep the compacted one
+    kept = []
+    for segment in segments:
+        if kept and kept[-1].level > segment.level and segment.last <= kept[-1].last:
+            continue
+        kept.append(segment)
+    return kept
+
+
+def write_segment(lot_dir, level, columns):
+    t = columns['t']
+    name = f"{level}-{int(t[0] * 1e6):016d}-{int(t[-1] * 1e6):016d}"
+    tmp = os.path.join(lot_dir, f".tmp-{name}")
+    os.makedirs(tmp, exist_ok=True)
+    for column, dtype in {**COLUMNS, **SNAPSHOT}.items():
+        np.save(os.path.join(tmp, f"{column}.npy"), np.ascontiguousarray(columns[column], dtype=dtype))
+    # Readers only ever see complete segments
+    os.rename(tmp, os.path.join(lot_dir, name))
+    return name
+
+
+class _Ring:
+    """A lot's unflushed transitions, plus every spot's current state."""
+
+    def __init__(self, n_spots, capacity):
+        self.capacity = capacity
+        self.columns = {name: np.zeros(capacity, dtype) for name, dtype in COLUMNS.items()}
+        self.head = 0  # rows ever appended
+        self.tail = 0  # rows flushed (or dropped)
+        self.state = np.full(n_spots, UNKNOWN, np.uint8)
+        self.since = np.zeros(n_spots, np.float64)
+
+    def rows(self):
+        idx = np.arange(self.tail, self.head) % self.capacity
+        rows = {name: column[idx] for name, column in self.columns.items()}
+        rows['snap_state'], rows['snap_since'] = self.state.copy(), self.since.copy()
+        return rows
+
+
+class TransitionLog(threading.Thread):
+    """Records spot transitions in memory and flushes them to columnar segments.
+
+    ``record`` is a LotEngine status listener. Each lot's transitions go to a
+    ring buffer of ``capacity`` rows, flushed every ``flush_every`` seconds
+    (or sooner once half full) as a level 0 segment. Whenever ``fanout``
+    segments of one level exist they are merged into one of the next level,
+    so months of history stay at a few dozen files per lot. If flushing falls
+    so far behind that the ring wraps, the oldest rows are dropped and
+    counted in ``transition_log_dropped_total``.
+    """
+
+    def __init__(self, lots, root=TRANSITION_LOG_DIR, flush_every=60.0, capacity=1 << 16, fanout=24):
+        super().__init__(daemon=True, name="transition-log")
+        self.root = root
+        self.flush_every = flush_every
+        self.fanout = fanout
+        self._rings = {lot_id: _Ring(len(lot.spots), capacity) for lot_id, lot in lots.items()}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self.store = TransitionStore(root, live=self.live)
+
+    def record(self, lot_id, spot_ids, free, now=None):
+        spot_ids = np.asarray(spot_ids, dtype=np.intp)
+        state = np.where(np.asarray(free, dtype=bool), FREE, OCCUPIED).astype(np.uint8)
+        now = time.time() if now is None else now
+        ring = self._rings[lot_id]
+        with self._lock:
+            n = len(spot_ids)
+            idx = np.arange(ring.head, ring.head + n) % ring.capacity
+            columns = ring.columns
+            columns['t'][idx] = now
+            columns['spot'][idx] = spot_ids
+            columns['state'][idx] = state
+            columns['prev_t'][idx] = ring.since[spot_ids]
+            columns['prev_state'][idx] = ring.state[spot_ids]
+            ring.state[spot_ids] = state
+            ring.since[spot_ids] = now
+            ring.head += n
+
+            overflow = ring.head - ring.tail - ring.capacity
+            if overflow > 0:
+                ring.tail += overflow
+                TRANSITIONS_DROPPED.inc(overflow, lot=lot_id)
+            if ring.head - ring.tail >= ring.capacity // 2:
+                self._wake.set()
+
+    def live(self, lot_id):
+        """Unflushed rows and current states of ``lot_id``, shaped like a segment."""
+        ring = self._rings.get(lot_id)
+        if ring is None:
+            return None
+        with self._lock:
+            return ring.rows()
+
+    def flush(self):
+        with self._flush_lock:
+            for lot_id, ring in self._rings.items():
+                with self._lock:
+                    head = ring.head
+                    rows = ring.rows()
+                if not len(rows['t']):
+                    continue
+                lot_dir = os.path.join(self.root, lot_id)
+                os.makedirs(lot_dir, exist_ok=True)
+                write_segment(lot_dir, 0, rows)
+                with self._lock:
+                    ring.tail = max(ring.tail, head)
+                self.compact(lot_dir)
+
+    def compact(self, lot_dir):
+        level = 0
+        while True:
+            segments = list_segments(lot_dir)
+            if level > max((segment.level for segment in segments), default=-1):
+                return
+            merging = [segment for segment in segments if segment.level == level][:self.fanout]
+            if len(merging) < self.fanout:
+                level += 1
+                continue
+            parts = [segment.load() for segment in merging]
+            merged = {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+            merged.update({name: parts[-1][name] for name in SNAPSHOT})
+            write_segment(lot_dir, level + 1, merged)
+            del parts
+            for segment in merging:
+                shutil.rmtree(segment.path, ignore_errors=True)
+
+    def close(self):
+        """Close every spot's open interval at shutdown and flush what is left."""
+        self._stop_event.set()
+        now = time.time()
+        for lot_id, ring in self._rings.items():
+            known = np.flatnonzero(ring.state != UNKNOWN)
+            if not len(known):
+                continue
+            with self._lock:
+                idx = np.arange(ring.head, ring.head + len(known)) % ring.capacity
+                ring.columns['t'][idx] = now
+                ring.columns['spot'][idx] = known
+                ring.columns['state'][idx] = UNKNOWN
+                ring.columns['prev_t'][idx] = ring.since[known]
+                ring.columns['prev_state'][idx] = ring.state[known]
+                ring.state[known] = UNKNOWN
+                ring.since[known] = now
+                ring.head += len(known)
+        self.flush()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self._wake.wait(self.flush_every)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing the transition log failed; retrying")
+
+
+class TransitionStore:
+    """Reads a lot's transition segments and answers occupancy questions about a time range.
+
+    Everything is computed with vectorized NumPy over the memory-mapped
+    columns: only segments overlapping the range are read, and no database
+    is involved. ``live`` (see ``TransitionLog.live``) adds the rows not
+    flushed yet when the log runs in this process; otherwise the latest
+    flushed states are taken to hold until now.
+    """
+
+    def __init__(self, root=TRANSITION_LOG_DIR, live=None):
+        self.root = root
+        self.live = live
+
+    def load(self, lot_id, start, end):
+        """The rows that can overlap ``[start, end)``, and the states as of the last of them."""
+        while True:
+            try:
+                parts = [segment.load() for segment in list_segments(os.path.join(self.root, lot_id))
+                         if segment.first <= end]
+                break
+            except FileNotFoundError:
+                continue  # compacted away while listing; list again
+        live = self.live(lot_id) if self.live else None
+        if live is not None and len(live['t']) and live['t'][0] <= end:
+            parts.append(live)
+        if not parts:
+            return None
+
+        # Rows of segments ending before start only matter through their snapshot
+        rows = [part for part in parts if len(part['t']) and part['t'][-1] >= start]
+        columns = {name: np.concatenate([part[name] for part in rows]) if rows else np.zeros(0, dtype)
+                   for name, dtype in COLUMNS.items()}
+        columns.update({name: np.asarray(parts[-1][name]) for name in SNAPSHOT})
+        return columns
+
+    def analyze(self, lot_id, start, end, n_spots, bin_seconds=3600):
+        """Utilization per spot and time bin, turnover and dwell times over ``[start, end)``."""
+        # Nothing is known past now; a range that lies wholly in the future is empty
+        end = max(min(end, time.time()), start)
+        origin = start // bin_seconds * bin_seconds
+        # Bins are aligned to origin, so the last one may hold the end of the range past start + n * bin_seconds
+        first_bin = int((start - origin) // bin_seconds)
+        n_bins = max(math.ceil((end - origin) / bin_seconds) - first_bin, 1)
+        width = int((end - origin) // bin_seconds) + 2
+        columns = self.load(lot_id, start, end)
+        if columns is None:
+            columns = {name: np.zeros(0, dtype) for name, dtype in {**COLUMNS, **SNAPSHOT}.items()}
+        return analyze(columns, start, end, n_spots, bin_seconds, origin, width, n_bins)
+
+
+def _binned(spots, a, b, n_spots, bin_seconds, origin, width):
+    """Seconds of the intervals ``[a, b)`` falling in each (spot, bin) cell."""
+    # a, b >= origin, so truncating is flooring
+    bin_a = ((a - origin) * (1.0 / bin_seconds)).astype(np.int64)
+    bin_b = ((b - origin) * (1.0 / bin_seconds)).astype(np.int64)
+    # Bin-major cells: rows come in time order, so neighbouring rows hit neighbouring cells
+    spots = spots.astype(np.int64)
+    cell_a = bin_a * n_spots + spots
+    cell_b = bin_b * n_spots + spots
+    cells = n_spots * width
+
+    # From the start of a's bin to its end, whole bins up to b's, then b's bin up to b.
+    # When both fall in one bin the -1 whole bin there makes it add up to b - a.
+    partial = np.bincount(cell_a, origin + (bin_a + 1) * bin_seconds - a, cells)
+    partial += np.bincount(cell_b, b - (origin + bin_b * bin_seconds), cells)
+    whole = np.bincount(cell_a + n_spots, minlength=cells) - np.bincount(cell_b, minlength=cells)
+    whole = np.cumsum(whole.reshape(width, n_spots), axis=0) * float(bin_seconds)
+    return (whole + partial.reshape(width, n_spots)).T
+
+
+def analyze(columns, start, end, n_spots, bin_seconds, origin, width, n_bins):
+    t, spot, state = columns['t'], columns['spot'], columns['state']
+    prev_t, prev_state = columns['prev_t'], columns['prev_state']
+    snap_state = np.full(n_spots, UNKNOWN, np.uint8)
+    snap_since = np.zeros(n_spots)
+    n_snap = min(len(columns['snap_state']), n_spots)
+    snap_state[:n_snap], snap_since[:n_snap] = columns['snap_state'][:n_snap], columns['snap_since'][:n_snap]
+
+    if len(spot) and spot.max() >= n_spots:
+        # The lot has fewer spots than when these rows were logged
+        keep = spot < n_spots
+        t, spot, state, prev_t, prev_state = t[keep], spot[keep], state[keep], prev_t[keep], prev_state[keep]
+
+    # Closed intervals [prev_t, t) in prev_state, then the open ones [since, end).
+    # Clipped to the range, those outside it are empty and add nothing.
+    states = np.concatenate([prev_state, snap_state])
+    a = np.clip(np.concatenate([prev_t, snap_since]), start, end)
+    b = np.clip(np.concatenate([t, np.full(n_spots, end)]), start, end)
+    b = np.where(states == UNKNOWN, a, b)
+    # One pass for both states: the intervals of state s count towards "spot" s * n_spots + spot
+    spots = np.minimum(states, FREE).astype(np.int64) * n_spots + np.concatenate([spot, np.arange(n_spots)])
+    by_state = _binned(spots, a, b, 2 * n_spots, bin_seconds, origin, width)
+    occupied = by_state[OCCUPIED * n_spots:(OCCUPIED + 1) * n_spots]
+    observed = occupied + by_state[FREE * n_spots:(FREE + 1) * n_spots]
+    first_bin = int((start - origin) // bin_seconds)
+    observed = observed[:, first_bin:first_bin + n_bins]
+    occupied = occupied[:, first_bin:first_bin + n_bins]
+
+    # Arrivals: free -> occupied inside the range
+    in_range = (t >= start) & (t < end) & (spot < n_spots)
+    arrivals = np.bincount(spot[in_range & (state == OCCUPIED) & (prev_state == FREE)], minlength=n_spots)
+    # Dwell: occupied stretches that ended inside the range (and began while observed)
+    dwell = (t - prev_t)[in_range & (prev_state == OCCUPIED)]
+    days = (end - start) / 86400
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {
+            'start': start,
+            'end': end,
+            'bin_seconds': bin_seconds,
+            'bin_start': origin + first_bin * bin_seconds,
+            'utilization': {
+                'by_spot': occupied.sum(1) / observed.sum(1),
+                'by_bin': occupied.sum(0) / observed.sum(0),
+                'by_spot_bin': occupied / observed,
+                'overall': occupied.sum() / observed.sum(),
+            },
+            'turnover': {
+                'arrivals': int(arrivals.sum()),
+                'by_spot': arrivals,
+                'per_spot_per_day': arrivals.sum() / n_spots / days if n_spots and days else math.nan,
+            },
+            'dwell': {
+                'count': len(dwell),
+                'mean': dwell.mean() if len(dwell) else math.nan,
+                'percentiles': dict(zip(('p50', 'p90', 'p99'), np.percentile(dwell, [50, 90, 99])))
+                if len(dwell) else {},
+                'histogram': {
+                    'edges_minutes': list(DWELL_EDGES_MINUTES),
+                    'counts': np.histogram(dwell / 60, [*DWELL_EDGES_MINUTES, np.inf])[0],
+                },
+            },
+        }
+
+
+def to_json(value, digits=4):
+    """``analyze`` output as JSON-ready values; NaN (no observations) becomes None."""
+    if isinstance(value, dict):
+        return {key: to_json(item, digits) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        array = np.asarray(value)
+        if array.dtype.kind == 'f':
+            rounded = np.round(array, digits).astype(object)
+            rounded[np.isnan(array)] = None
+            return rounded.tolist()
+        return array.tolist()
+    if isinstance(value, (float, np.floating)):
+        return None if math.isnan(value) else round(float(value), digits)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
@@ -1,47 +1,110 @@
-import pickle
-import warnings
-warnings.filterwarnings("ignore", category=UserWarning, module='sklearn')
-
-from skimage.transform import resize
 import numpy as np
 import cv2
 
+from classifier import get_classifier
+
 
 EMPTY = True
 NOT_EMPTY = False
 
-MODEL = pickle.load(open("model.p", "rb"))
+# The classifier was trained on 15x15x3 crops scaled to [0, 1]
+SPOT_SIZE = (15, 15)
+N_FEATURES = SPOT_SIZE[0] * SPOT_SIZE[1] * 3
 
 
-def empty_or_not(spot_bgr):
+class SpotFeatures:
+    """Reusable buffers for turning a frame and a list of spots into model input."""
 
-    flat_data = []
+    def __init__(self, n_spots=0):
+        self._alloc(n_spots)
 
-    img_resized = resize(spot_bgr, (15, 15, 3))
-    flat_data.append(img_resized.flatten())
-    flat_data = np.array(flat_data)
+    def _alloc(self, n_spots):
+        self.pixels = np.empty((n_spots, SPOT_SIZE[1], SPOT_SIZE[0], 3), dtype=np.uint8)
+        self.data = np.empty((n_spots, N_FEATURES), dtype=np.float64)
 
-    y_output = MODEL.predict(flat_data)
+    def extract(self, frame, spots):
+        n = len(spots)
+        if self.pixels.shape[0] < n:
+            self._alloc(n)
 
-    if y_output == 0:
-        return EMPTY
-    else:
-        return NOT_EMPTY
+        pixels = self.pixels[:n]
+        for i, (x1, y1, w, h) in enumerate(spots):
+            cv2.resize(frame[y1:y1 + h, x1:x1 + w], SPOT_SIZE, dst=pixels[i], interpolation=cv2.INTER_AREA)
 
+        data = self.data[:n]
+        np.multiply(pixels.reshape(n, N_FEATURES), 1.0 / 255, out=data)
+        return data
 
-def get_parking_spots_bboxes(connected_components):
-    (totalLabels, label_ids, values, centroid) = connected_components
 
-    slots = []
-    coef = 1
-    for i in range(1, totalLabels):
+def classify_spots(frame, spots, features=None):
+    """Classify every spot of ``frame`` with a single model call.
+
+    Returns a bool array, ``EMPTY`` (True) where the spot is free.
+    """
+    if len(spots) == 0:
+        return np.zeros(0, dtype=bool)
+    if features is None:
+        features = SpotFeatures(len(spots))
+
+    y_output = get_classifier().predict(features.extract(frame, spots))
+    return y_output == 0
+
+
+def spot_confidence(frame, spots, features=None):
+    """Probability that each spot of ``frame`` is empty, from a single model call.
+
+    See ``SpotClassifier.empty_confidence``.
+    """
+    if len(spots) == 0:
+        return np.zeros(0, dtype=np.float64)
+    if features is None:
+        features = SpotFeatures(len(spots))
+
+    return get_classifier().empty_confidence(features.extract(frame, spots))
 
-        # Now extract the coordinate points
-        x1 = int(values[i, cv2.CC_STAT_LEFT] * coef)
-        y1 = int(values[i, cv2.CC_STAT_TOP] * coef)
-        w = int(values[i, cv2.CC_STAT_WIDTH] * coef)
-        h = int(values[i, cv2.CC_STAT_HEIGHT] * coef)
 
-        slots.append([x1, y1, w, h])
+class SpotDiffer:
+    """Mean grayscale intensity of every spot, computed on a downsampled frame.
 
-    return slots
\ No newline at end of file
+    The means come from one integral image, so the cost does not grow with
+    the number or size of the spots. With ``samples`` (from
+    ``LotGeometry.samples``) each spot is averaged over its own pixels
+    instead of its whole bbox, for bays that are not rectangles.
+    """
+
+    def __init__(self, spots, frame_shape, scale=4, samples=None):
+        self.scale = scale
+        self.size = (max(frame_shape[1] // scale, 1), max(frame_shape[0] // scale, 1))
+        self.samples = samples
+        if samples is not None:
+            index, offsets = samples
+            self.index = np.asarray(index, dtype=np.intp)
+            self.starts = np.asarray(offsets[:-1], dtype=np.intp)
+            self.counts = np.maximum(np.diff(offsets), 1)
+
+        boxes = np.asarray(spots, dtype=np.int64).reshape(-1, 4)
+        self.x1 = np.clip(boxes[:, 0] // scale, 0, self.size[0] - 1)
+        self.y1 = np.clip(boxes[:, 1] // scale, 0, self.size[1] - 1)
+        self.x2 = np.clip((boxes[:, 0] + boxes[:, 2]) // scale, self.x1 + 1, self.size[0])
+        self.y2 = np.clip((boxes[:, 1] + boxes[:, 3]) // scale, self.y1 + 1, self.size[1])
+        self.area = (self.x2 - self.x1) * (self.y2 - self.y1)
+
+    def means(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, self.size, interpolation=cv2.INTER_AREA)
+        if self.samples is not None:
+            return np.add.reduceat(small.ravel()[self.index].astype(np.float64), self.starts) / self.counts
+        ii = cv2.integral(small)
+        sums = ii[self.y2, self.x2] - ii[self.y1, self.x2] - ii[self.y2, self.x1] + ii[self.y1, self.x1]
+        return sums / self.area
+
+
+def empty_or_not(spot_bgr):
+    h, w = spot_bgr.shape[:2]
+    return bool(classify_spots(spot_bgr, [[0, 0, w, h]])[0])
+
+
+def get_parking_spots_bboxes(connected_components):
+    (totalLabels, label_ids, values, centroid) = connected_components
+    # Label 0 is the background
+    return values[1:totalLabels, [cv2.CC_STAT_LEFT, cv2.CC_STAT_TOP, cv2.CC_STAT_WIDTH, cv2.CC_STAT_HEIGHT]].tolist()